@@ -1,13 +1,49 @@
-from flask import Flask, request, jsonify
+from flask import Flask, Response, g, has_request_context, request, jsonify, stream_with_context, url_for
 from flask_sqlalchemy import SQLAlchemy
+from sqlalchemy import event, insert, text
+from sqlalchemy.engine import Engine
+from sqlalchemy.exc import IntegrityError, OperationalError, ProgrammingError
+from sqlalchemy.orm import configure_mappers, joinedload, object_session, selectinload
 from flask_cors import CORS
 from datetime import datetime, timedelta
 import os
+import atexit
+import logging
+import queue
+import random
+from logging.handlers import QueueHandler, QueueListener
 import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
 import json
+import csv
+import io
+import base64
+import re
+import unicodedata
+import threading
+import time
+import tempfile
+import uuid
+import itertools
 import jwt as pyjwt
 import hashlib
+import hmac
+import secrets
 from functools import wraps
+from operator import attrgetter
+from contextlib import contextmanager
+from collections import OrderedDict, deque
+from urllib.parse import urlencode
+from concurrent.futures import ThreadPoolExecutor
+try:
+    import fcntl
+except ImportError:  # Windows (desenvolvimento local)
+    fcntl = None
+try:
+    import orjson  # opcional: serialização JSON mais rápida
+except ImportError:
+    orjson = None
 from flask_jwt_extended import JWTManager, jwt_required, create_access_token, get_jwt_identity
 
 app = Flask(__name__)
@@ -20,13 +56,166 @@ app.config['SQLALCHEMY_DATABASE_URI'] = database_url
 app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
 db = SQLAlchemy(app)
 
+# ==================== LOG ====================
+# Uma linha JSON por evento, com o id da requisição. As rotas só colocam o
+# registro numa fila; uma thread por worker formata e escreve no stdout.
+# Campos extras: logger.info('mensagem', extra={'campos': {...}})
+
+LOG_LEVEL = os.environ.get('LOG_LEVEL', 'INFO').upper()
+LOG_AMOSTRA_DEBUG = float(os.environ.get('LOG_AMOSTRA_DEBUG', 0.01))
+
+class FormatadorJSON(logging.Formatter):
+    def format(self, record):
+        evento = {
+            'ts': datetime.utcfromtimestamp(record.created).isoformat(timespec='milliseconds') + 'Z',
+            'nivel': record.levelname,
+            'logger': record.name,
+            'msg': record.getMessage(),
+        }
+        if getattr(record, 'request_id', None):
+            evento['request_id'] = record.request_id
+        evento.update(getattr(record, 'campos', None) or {})
+        if record.exc_info and not record.exc_text:
+            record.exc_text = self.formatException(record.exc_info)
+        if record.exc_text:
+            evento['exc'] = record.exc_text
+        return json.dumps(evento, ensure_ascii=False, default=str)
+
+class FiltroRequisicao(logging.Filter):
+    """Anexa o id da requisição e aplica a amostragem de DEBUG
+
+    A amostragem é decidida uma vez por requisição, para que os eventos de
+    DEBUG de uma requisição sorteada apareçam completos.
+    """
+    
+    def filter(self, record):
+        if has_request_context():
+            record.request_id = g.get('request_id')
+            amostrada = g.get('log_amostrada', False)
+        else:
+            record.request_id = None
+            amostrada = random.random() < LOG_AMOSTRA_DEBUG
+        return record.levelno > logging.DEBUG or amostrada
+
+class _FilaLog(QueueHandler):
+    def prepare(self, record):
+        # A formatação JSON fica para a thread do listener; aqui só resolvemos a mensagem
+        record.msg = record.getMessage()
+        record.args = None
+        if record.exc_info:
+            record.exc_text = logging.Formatter().formatException(record.exc_info)
+            record.exc_info = None
+        return record
+
+logger = logging.getLogger('loja')
+logger.setLevel(LOG_LEVEL)
+logger.propagate = False
+_fila_log = queue.SimpleQueue()
+_handler_log = _FilaLog(_fila_log)
+_handler_log.addFilter(FiltroRequisicao())
+logger.addHandler(_handler_log)
+_saida_log = logging.StreamHandler()
+_saida_log.setFormatter(FormatadorJSON())
+_ouvinte_log = QueueListener(_fila_log, _saida_log)
+_ouvinte_log.start()
+atexit.register(_ouvinte_log.stop)
+
+@app.before_request
+def iniciar_log_requisicao():
+    g.request_id = request.headers.get('X-Request-ID') or uuid.uuid4().hex
+    g.log_amostrada = random.random() < LOG_AMOSTRA_DEBUG
+    g.inicio_requisicao = time.perf_counter()
+
+@app.after_request
+def registrar_requisicao(response):
+    response.headers['X-Request-ID'] = g.get('request_id', '')
+    nivel = logging.ERROR if response.status_code >= 500 else logging.INFO
+    if logger.isEnabledFor(nivel):
+        logger.log(nivel, 'requisicao', extra={'campos': {
+            'metodo': request.method,
+            'rota': request.url_rule.rule if request.url_rule else request.path,
+            'status': response.status_code,
+            'duracao_ms': round((time.perf_counter() - g.get('inicio_requisicao', time.perf_counter())) * 1000, 2),
+        }})
+    return response
+
+# ==================== SQLITE ====================
+# Vários workers do gunicorn no mesmo arquivo: WAL deixa leituras e a escrita
+# correrem juntas, e as transações de escrita começam com BEGIN IMMEDIATE para
+# entrar na fila do busy_timeout em vez de falhar com "database is locked" ao
+# tentar promover uma leitura. SQLITE_OTIMIZADO=0 volta ao comportamento padrão.
+
+SQLITE_OTIMIZADO = os.environ.get('SQLITE_OTIMIZADO', '1') != '0'
+SQLITE_BUSY_TIMEOUT_MS = int(os.environ.get('SQLITE_BUSY_TIMEOUT_MS', 15000))
+SQLITE_PRAGMAS = [
+    'PRAGMA journal_mode=WAL',
+    'PRAGMA synchronous=NORMAL',  # com WAL, só perde as últimas transações numa queda de energia
+    f'PRAGMA busy_timeout={SQLITE_BUSY_TIMEOUT_MS}',
+    f'PRAGMA mmap_size={int(os.environ.get("SQLITE_MMAP_BYTES", 256 * 1024 * 1024))}',
+    f'PRAGMA cache_size=-{int(os.environ.get("SQLITE_CACHE_KB", 64 * 1024))}',
+]
+
+_escrita_local = threading.local()
+# Fila de escrita deste worker: as threads esperam aqui, e não no lock do SQLite
+_trava_escrita = threading.Lock()
+
+def _ao_conectar_sqlite(dbapi_conexao, registro):
+    # O pysqlite abre transações por conta própria e não emite BEGIN antes de
+    # SELECT, o que quebra SAVEPOINT; quem emite o BEGIN é _ao_iniciar_sqlite
+    dbapi_conexao.isolation_level = None
+    if SQLITE_OTIMIZADO:
+        cursor = dbapi_conexao.cursor()
+        for pragma in SQLITE_PRAGMAS:
+            cursor.execute(pragma)
+        cursor.close()
+
+def _ao_iniciar_sqlite(conexao):
+    if conexao.get_execution_options().get('isolation_level') == 'AUTOCOMMIT':
+        return
+    imediata = SQLITE_OTIMIZADO and getattr(_escrita_local, 'ativa', False)
+    # Direto no DBAPI, para o BEGIN não contar como query nas métricas
+    conexao.connection.dbapi_connection.execute('BEGIN IMMEDIATE' if imediata else 'BEGIN')
+
+with app.app_context():
+    if db.engine.dialect.name == 'sqlite':
+        event.listen(db.engine, 'connect', _ao_conectar_sqlite)
+        event.listen(db.engine, 'begin', _ao_iniciar_sqlite)
+
+@contextmanager
+def escrita_sqlite():
+    """Serializa uma unidade de escrita no SQLite: fila no worker + BEGIN IMMEDIATE
+
+    Encerra a transação aberta antes de entrar, para que a próxima já comece
+    como escrita. Em outros bancos (e com SQLITE_OTIMIZADO=0) não faz nada.
+    """
+    if not SQLITE_OTIMIZADO or getattr(_escrita_local, 'ativa', False) or db.engine.dialect.name != 'sqlite':
+        yield
+        return
+    with _trava_escrita:
+        db.session.commit()
+        _escrita_local.ativa = True
+        try:
+            yield
+        finally:
+            # Solta o lock do SQLite junto com o da fila (o que não foi commitado é descartado)
+            db.session.rollback()
+            _escrita_local.ativa = False
+
+def escrita_serializada(f):
+    """Decorator para rotas que escrevem: executa a view dentro de escrita_sqlite()"""
+    @wraps(f)
+    def decorated_function(*args, **kwargs):
+        with escrita_sqlite():
+            return f(*args, **kwargs)
+    return decorated_function
+
 # CORS - permite todas as origens em produção ou lista específica
 allowed_origins = os.environ.get('ALLOWED_ORIGINS', 'http://localhost:8081,http://localhost:3000,http://127.0.0.1:8081,http://127.0.0.1:3000')
 origins_list = [origin.strip() for origin in allowed_origins.split(',')] if allowed_origins else ['*']
 
 CORS(app, 
      origins=origins_list if '*' not in origins_list else ['*'],
-     allow_headers=['Content-Type', 'Authorization'],
+     allow_headers=['Content-Type', 'Authorization', 'Idempotency-Key'],
      methods=['GET', 'POST', 'PUT', 'DELETE', 'OPTIONS'])
 
 @app.before_request
@@ -45,7 +234,7 @@ def after_request(response):
         response.headers.add('Access-Control-Allow-Origin', origin)
     elif '*' in origins_list:
         response.headers.add('Access-Control-Allow-Origin', '*')
-    response.headers.add('Access-Control-Allow-Headers', 'Content-Type,Authorization')
+    response.headers.add('Access-Control-Allow-Headers', 'Content-Type,Authorization,Idempotency-Key')
     response.headers.add('Access-Control-Allow-Methods', 'GET,PUT,POST,DELETE,OPTIONS')
     response.headers.add('Access-Control-Allow-Credentials', 'true')
     return response
@@ -75,6 +264,18 @@ class Produto(db.Model):
     categoria_id = db.Column(db.Integer, db.ForeignKey('categoria.id'))
     ativo = db.Column(db.Boolean, default=True)
     data_criacao = db.Column(db.DateTime, default=datetime.utcnow)
+    data_atualizacao = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+    # Identificador na fonte de sincronização, ex.: 'fakestore:12'
+    id_externo = db.Column(db.String(100), index=True)
+    # Impressão digital (SHA-256) do registro de origem na última sincronização
+    hash_origem = db.Column(db.String(64))
+    
+    # Listagem do catálogo: filtro por ativo/categoria e keyset por (coluna, id)
+    __table_args__ = (
+        db.Index('ix_produto_ativo_categoria', 'ativo', 'categoria_id', 'id'),
+        db.Index('ix_produto_ativo_preco', 'ativo', 'preco', 'id'),
+        db.Index('ix_produto_ativo_data_criacao', 'ativo', 'data_criacao', 'id'),
+    )
 
 class Usuario(db.Model):
     id = db.Column(db.Integer, primary_key=True)
@@ -90,6 +291,8 @@ class Usuario(db.Model):
     avatar_url = db.Column(db.String(200))
     ativo = db.Column(db.Boolean, default=True)
 
+STATUS_PEDIDO = ['pendente', 'processando', 'enviado', 'entregue', 'cancelado']
+
 class Pedido(db.Model):
     id = db.Column(db.Integer, primary_key=True)
     usuario_id = db.Column(db.Integer, db.ForeignKey('usuario.id'))
@@ -107,6 +310,13 @@ class Pedido(db.Model):
     observacoes = db.Column(db.Text)
     
     itens = db.relationship('ItemPedido', backref='pedido', lazy=True)
+    
+    # Histórico do usuário, filtro por status e listagens ordenadas por data
+    __table_args__ = (
+        db.Index('ix_pedido_usuario_data', 'usuario_id', 'data_pedido'),
+        db.Index('ix_pedido_status_data', 'status', 'data_pedido'),
+        db.Index('ix_pedido_data', 'data_pedido'),
+    )
 
 class ItemPedido(db.Model):
     id = db.Column(db.Integer, primary_key=True)
@@ -115,6 +325,11 @@ class ItemPedido(db.Model):
     quantidade = db.Column(db.Integer, nullable=False)
     preco_unitario = db.Column(db.Float, nullable=False)
     produto = db.relationship('Produto', backref='itens_pedido')
+    
+    __table_args__ = (
+        db.Index('ix_item_pedido_pedido', 'pedido_id'),  # carregamento dos itens de cada pedido
+        db.Index('ix_item_pedido_produto', 'produto_id'),  # contagem de vendas por produto
+    )
 
 class Favorito(db.Model):
     id = db.Column(db.Integer, primary_key=True)
@@ -136,13 +351,347 @@ class Administrador(db.Model):
     data_criacao = db.Column(db.DateTime, default=datetime.utcnow)
     ultimo_login = db.Column(db.DateTime)
 
-def hash_senha(senha):
-    """Gera hash da senha usando SHA-256"""
-    return hashlib.sha256(senha.encode()).hexdigest()
+class Sincronizacao(db.Model):
+    """Histórico das sincronizações de catálogo e suas contagens"""
+    id = db.Column(db.Integer, primary_key=True)
+    origem = db.Column(db.String(50), nullable=False)
+    data_inicio = db.Column(db.DateTime, nullable=False)
+    data_fim = db.Column(db.DateTime)
+    sucesso = db.Column(db.Boolean, default=False)
+    adicionados = db.Column(db.Integer, default=0)
+    atualizados = db.Column(db.Integer, default=0)
+    desativados = db.Column(db.Integer, default=0)
+    inalterados = db.Column(db.Integer, default=0)
+    duracao_segundos = db.Column(db.Float)
+    erro = db.Column(db.Text)
+
+class TarefaSync(db.Model):
+    """Sincronização executada em segundo plano, consultável pelo id"""
+    id = db.Column(db.String(36), primary_key=True)
+    tipo = db.Column(db.String(50), nullable=False)
+    status = db.Column(db.String(20), nullable=False, default='pendente')  # pendente, executando, concluida, falhou
+    progresso = db.Column(db.Integer, default=0)  # registros processados
+    resultado = db.Column(db.Text)  # relatório JSON
+    erro = db.Column(db.Text)
+    data_criacao = db.Column(db.DateTime, default=datetime.utcnow)
+    data_inicio = db.Column(db.DateTime)
+    data_fim = db.Column(db.DateTime)
+
+class Trava(db.Model):
+    """Trava nomeada entre processos; expira para não ficar presa se um worker morrer"""
+    nome = db.Column(db.String(50), primary_key=True)
+    dono = db.Column(db.String(36))
+    expira_em = db.Column(db.DateTime)
+
+class ChaveIdempotencia(db.Model):
+    """Resposta de um POST com Idempotency-Key, devolvida de novo em retentativas"""
+    chave = db.Column(db.String(255), primary_key=True)  # rota + chave enviada pelo cliente
+    hash_requisicao = db.Column(db.String(64), nullable=False)
+    status_code = db.Column(db.Integer)  # None enquanto a requisição original está em andamento
+    resposta = db.Column(db.Text)
+    data_criacao = db.Column(db.DateTime, default=datetime.utcnow)
+    expira_em = db.Column(db.DateTime, nullable=False, index=True)
+
+class VersaoEsquema(db.Model):
+    """Migrações já aplicadas neste banco (ver MIGRACOES)"""
+    versao = db.Column(db.Integer, primary_key=True)
+    descricao = db.Column(db.String(200), nullable=False)
+    data_aplicacao = db.Column(db.DateTime, default=datetime.utcnow)
+
+class EstatisticaPedido(db.Model):
+    """Contadores materializados de pedidos por dia e status (painel administrativo)"""
+    dia = db.Column(db.Date, primary_key=True)
+    status = db.Column(db.String(50), primary_key=True)
+    quantidade = db.Column(db.Integer, nullable=False, default=0)
+    valor_total = db.Column(db.Float, nullable=False, default=0)
+
+# ==================== CARREGAMENTO ANTECIPADO ====================
+
+# Resolve os backrefs agora para que possam ser usados nas opções abaixo
+configure_mappers()
+
+# Estratégias de carregamento usadas pelos endpoints de listagem. Cada serializador
+# percorre relacionamentos; carregá-los aqui mantém o número de queries constante
+# independentemente da quantidade de linhas (sem N+1).
+CARREGAR_PRODUTO = (joinedload(Produto.categoria),)
+CARREGAR_PEDIDO = (selectinload(Pedido.itens).joinedload(ItemPedido.produto),)
+CARREGAR_FAVORITO = (joinedload(Favorito.produto),)
+
+@contextmanager
+def contar_queries():
+    """Conta os comandos SQL executados no bloco (uso: with contar_queries() as c: ...; c['total'])"""
+    contador = {'total': 0}
+    
+    def _ao_executar(conn, cursor, statement, parameters, context, executemany):
+        contador['total'] += 1
+    
+    event.listen(db.engine, 'before_cursor_execute', _ao_executar)
+    try:
+        yield contador
+    finally:
+        event.remove(db.engine, 'before_cursor_execute', _ao_executar)
+
+@contextmanager
+def assert_max_queries(maximo):
+    """Falha com AssertionError se o bloco executar mais de `maximo` comandos SQL"""
+    with contar_queries() as contador:
+        yield contador
+    if contador['total'] > maximo:
+        raise AssertionError(f'Esperado no máximo {maximo} queries, executadas {contador["total"]}')
+
+# ==================== SERIALIZAÇÃO ====================
+# Um serializador por formato de resposta, com a lista de (chave, extrator)
+# montada uma vez na importação. Variantes (projeções, itens com ou sem
+# imagem) são derivadas com .variante() e também ficam pré-compiladas.
+
+def _iso(atributo):
+    obter = attrgetter(atributo)
+    def extrair(obj):
+        valor = obter(obj)
+        return valor.isoformat() if valor is not None else None
+    return extrair
+
+def _do_produto(atributo, padrao):
+    """Atributo do produto relacionado, ou `padrao` se o produto foi removido"""
+    def extrair(obj):
+        produto = obj.produto
+        return getattr(produto, atributo) if produto is not None else padrao
+    return extrair
+
+class Serializador:
+    """Converte objetos em dicts a partir de {chave: atributo ou função(obj)}"""
+    
+    def __init__(self, fontes):
+        self.fontes = dict(fontes)
+        self.chaves = tuple(self.fontes)
+        self._extratores = tuple(
+            (chave, fonte if callable(fonte) else attrgetter(fonte)) for chave, fonte in self.fontes.items()
+        )
+        self._projecoes = {}
+    
+    def variante(self, campos=None, **substituicoes):
+        """Novo serializador com só `campos` (na ordem dada) e/ou fontes substituídas"""
+        fontes = {campo: self.fontes[campo] for campo in (campos or self.chaves)}
+        fontes.update(substituicoes)
+        return Serializador(fontes)
+    
+    def projecao(self, campos):
+        """Variante restrita a `campos`, guardada para as próximas requisições
+
+        A chave é o conjunto de campos na ordem de self.chaves, então repetições e
+        permutações vindas do cliente caem na mesma projeção: no máximo uma por
+        subconjunto das chaves.
+        """
+        if campos is None:
+            return self
+        chave = tuple(c for c in self.chaves if c in set(campos))
+        projecao = self._projecoes.get(chave)
+        if projecao is None:
+            projecao = self._projecoes[chave] = self.variante(chave)
+        return projecao
+    
+    def __call__(self, obj):
+        return {chave: extrair(obj) for chave, extrair in self._extratores}
+    
+    def muitos(self, objs):
+        extratores = self._extratores
+        return [{chave: extrair(obj) for chave, extrair in extratores} for obj in objs]
+    
+    def linhas(self, linhas):
+        """Linhas (tuplas) de uma query de colunas na ordem de self.chaves, sem montar objetos ORM"""
+        chaves = self.chaves
+        return [dict(zip(chaves, linha)) for linha in linhas]
+
+SERIALIZADOR_PRODUTO = Serializador({
+    'id': 'id',
+    'nome': 'nome',
+    'descricao': 'descricao',
+    'preco': 'preco',
+    'estoque': 'estoque',
+    'imagem_url': 'imagem_url',
+    'categoria_id': 'categoria_id',
+    'categoria_nome': lambda prod: prod.categoria.nome if prod.categoria else None,
+})
+# Resposta das rotas administrativas de produto
+SERIALIZADOR_PRODUTO_ADMIN = SERIALIZADOR_PRODUTO.variante(
+    ['id', 'nome', 'descricao', 'preco', 'estoque', 'imagem_url', 'categoria_id'], ativo='ativo'
+)
+
+SERIALIZADOR_ITEM_PEDIDO = Serializador({
+    'id': 'id',
+    'produto_id': 'produto_id',
+    'quantidade': 'quantidade',
+    'preco_unitario': 'preco_unitario',
+    'produto_nome': _do_produto('nome', 'Produto removido'),
+    'produto_imagem': _do_produto('imagem_url', ''),
+})
+SERIALIZADOR_ITEM_RESUMO = SERIALIZADOR_ITEM_PEDIDO.variante(['produto_id', 'produto_nome', 'quantidade', 'preco_unitario'])
+
+SERIALIZADOR_PEDIDO = Serializador({
+    'id': 'id',
+    'total': 'total',
+    'status': 'status',
+    'data_pedido': _iso('data_pedido'),
+    'data_atualizacao': _iso('data_atualizacao'),
+    'nome_cliente': 'nome_cliente',
+    'email_cliente': 'email_cliente',
+    'telefone_cliente': 'telefone_cliente',
+    'endereco_entrega': 'endereco_entrega',
+    'cidade_entrega': 'cidade_entrega',
+    'cep_entrega': 'cep_entrega',
+    'observacoes': 'observacoes',
+    'itens': lambda pedido: SERIALIZADOR_ITEM_PEDIDO.muitos(pedido.itens),
+})
+# Listagem geral: itens sem imagem
+SERIALIZADOR_ITEM_LISTA = SERIALIZADOR_ITEM_PEDIDO.variante(['id', 'produto_id', 'quantidade', 'preco_unitario', 'produto_nome'])
+SERIALIZADOR_PEDIDO_LISTA = SERIALIZADOR_PEDIDO.variante(
+    itens=lambda pedido: SERIALIZADOR_ITEM_LISTA.muitos(pedido.itens)
+)
+SERIALIZADOR_PEDIDO_HISTORICO = SERIALIZADOR_PEDIDO.variante(['id', 'total', 'status', 'data_pedido', 'data_atualizacao', 'itens'])
+SERIALIZADOR_PEDIDO_RESUMO = SERIALIZADOR_PEDIDO.variante(
+    ['id', 'total', 'status', 'data_pedido'], itens=lambda pedido: SERIALIZADOR_ITEM_RESUMO.muitos(pedido.itens)
+)
+
+# Exportações: lidos de linhas de colunas (pedido x item, com as colunas do item prefixadas com item_)
+SERIALIZADOR_PRODUTO_EXPORTACAO = SERIALIZADOR_PRODUTO.variante(
+    categoria_nome='categoria_nome', ativo='ativo',
+    data_criacao=_iso('data_criacao'), data_atualizacao=_iso('data_atualizacao')
+)
+SERIALIZADOR_PEDIDO_EXPORTACAO = SERIALIZADOR_PEDIDO.variante(
+    ['id', 'total', 'status', 'data_pedido', 'data_atualizacao', 'nome_cliente', 'email_cliente',
+     'telefone_cliente', 'endereco_entrega', 'cidade_entrega', 'cep_entrega', 'observacoes'],
+    usuario_id='usuario_id'
+)
+SERIALIZADOR_ITEM_EXPORTACAO = Serializador({
+    'id': 'item_id',
+    'produto_id': 'item_produto_id',
+    'quantidade': 'item_quantidade',
+    'preco_unitario': 'item_preco_unitario',
+    'produto_nome': lambda linha: linha.item_produto_nome or 'Produto removido',
+})
+
+SERIALIZADOR_USUARIO_ADMIN = Serializador({
+    'id': 'id',
+    'nome': 'nome',
+    'email': 'email',
+    'telefone': 'telefone',
+    'endereco': 'endereco',
+    'is_admin': 'is_admin',
+    'data_criacao': _iso('data_criacao'),
+    'data_nascimento': _iso('data_nascimento'),
+    'genero': 'genero',
+    'avatar_url': 'avatar_url',
+    'ativo': 'ativo',
+    'total_pedidos': 'total_pedidos',
+})
+
+SERIALIZADOR_FAVORITO = Serializador({
+    'id': 'id',
+    'produto_id': 'produto_id',
+    'produto_nome': 'produto.nome',
+    'produto_preco': 'produto.preco',
+    'produto_imagem': 'produto.imagem_url',
+    'produto_estoque': 'produto.estoque',
+    'data_favorito': _iso('data_favorito'),
+})
+
+if orjson is not None:
+    def codificar_json(dados):
+        return orjson.dumps(dados, option=orjson.OPT_SORT_KEYS | orjson.OPT_NON_STR_KEYS)
+else:
+    def _json_padrao(valor):
+        if isinstance(valor, datetime):
+            return valor.isoformat()
+        raise TypeError(f'{type(valor).__name__} não é serializável em JSON')
+    _codificador_json = json.JSONEncoder(sort_keys=True, ensure_ascii=False, separators=(',', ':'), default=_json_padrao)
+    def codificar_json(dados):
+        return _codificador_json.encode(dados).encode()
+
+def resposta_json(dados, status=200):
+    """Como jsonify (chaves ordenadas), mas compacta e com orjson quando instalado"""
+    return Response(codificar_json(dados), status=status, mimetype='application/json')
+
+# ==================== SENHAS ====================
+# Formato armazenado: "scrypt$n$r$p$sal$hash" ou "pbkdf2_sha256$iteracoes$sal$hash"
+# (sal e hash em base64). Hashes antigos são SHA-256 sem sal (64 caracteres hex)
+# e são convertidos no próximo login bem-sucedido.
+
+SENHA_ALGORITMO = os.environ.get('SENHA_ALGORITMO', 'scrypt')  # scrypt | pbkdf2_sha256
+SENHA_SCRYPT_N = int(os.environ.get('SENHA_SCRYPT_N', 2 ** 14))
+SENHA_SCRYPT_R = int(os.environ.get('SENHA_SCRYPT_R', 8))
+SENHA_SCRYPT_P = int(os.environ.get('SENHA_SCRYPT_P', 1))
+SENHA_PBKDF2_ITERACOES = int(os.environ.get('SENHA_PBKDF2_ITERACOES', 600000))
+
+# Limita quantos hashes rodam ao mesmo tempo por worker: numa rajada de logins
+# as requisições fazem fila aqui em vez de ocupar todas as CPUs
+executor_senhas = ThreadPoolExecutor(
+    max_workers=int(os.environ.get('SENHA_THREADS', 2)),
+    thread_name_prefix='senha'
+)
+
+def _b64(dados):
+    return base64.b64encode(dados).decode().rstrip('=')
+
+def _de_b64(texto):
+    return base64.b64decode(texto + '=' * (-len(texto) % 4))
+
+def parametros_senha_atuais():
+    """Algoritmo e custo configurados, no mesmo formato de `_parametros_do_hash`"""
+    if SENHA_ALGORITMO == 'pbkdf2_sha256':
+        return ('pbkdf2_sha256', SENHA_PBKDF2_ITERACOES)
+    return ('scrypt', SENHA_SCRYPT_N, SENHA_SCRYPT_R, SENHA_SCRYPT_P)
+
+def _derivar(senha, sal, parametros):
+    if parametros[0] == 'pbkdf2_sha256':
+        return hashlib.pbkdf2_hmac('sha256', senha.encode(), sal, parametros[1])
+    _, n, r, p = parametros
+    return hashlib.scrypt(senha.encode(), salt=sal, n=n, r=r, p=p, maxmem=256 * n * r * p, dklen=32)
+
+def _parametros_do_hash(senha_hash):
+    """(parametros, sal, hash) de um hash armazenado; None para o SHA-256 antigo"""
+    partes = (senha_hash or '').split('$')
+    if partes[0] == 'scrypt' and len(partes) == 6:
+        return ('scrypt', int(partes[1]), int(partes[2]), int(partes[3])), _de_b64(partes[4]), _de_b64(partes[5])
+    if partes[0] == 'pbkdf2_sha256' and len(partes) == 4:
+        return ('pbkdf2_sha256', int(partes[1])), _de_b64(partes[2]), _de_b64(partes[3])
+    return None
+
+def hash_senha(senha, parametros=None):
+    """Gera hash da senha com sal aleatório (scrypt ou PBKDF2, conforme configuração)"""
+    parametros = parametros or parametros_senha_atuais()
+    sal = secrets.token_bytes(16)
+    derivado = _derivar(senha, sal, parametros)
+    return '$'.join([parametros[0], *map(str, parametros[1:]), _b64(sal), _b64(derivado)])
 
 def verificar_senha(senha, senha_hash):
-    """Verifica se a senha está correta"""
-    return hash_senha(senha) == senha_hash
+    """Verifica se a senha está correta (aceita também o SHA-256 antigo)"""
+    decodificado = _parametros_do_hash(senha_hash)
+    if decodificado is None:
+        return hmac.compare_digest(hashlib.sha256(senha.encode()).hexdigest(), senha_hash or '')
+    parametros, sal, esperado = decodificado
+    return hmac.compare_digest(_derivar(senha, sal, parametros), esperado)
+
+def precisa_rehash(senha_hash):
+    """True se o hash é antigo ou foi gerado com outro algoritmo/custo"""
+    decodificado = _parametros_do_hash(senha_hash)
+    return decodificado is None or decodificado[0] != parametros_senha_atuais()
+
+def _conferir_senha(senha, senha_hash):
+    if not verificar_senha(senha, senha_hash):
+        return False, None
+    return True, hash_senha(senha) if precisa_rehash(senha_hash) else None
+
+def conferir_senha(senha, senha_hash):
+    """Verifica a senha no pool de hashing; retorna (correta, novo_hash ou None)
+
+    `novo_hash` vem preenchido quando o hash guardado deve ser substituído
+    (SHA-256 antigo ou custo diferente do configurado).
+    """
+    return executor_senhas.submit(_conferir_senha, senha, senha_hash).result()
+
+def gerar_hash_senha(senha):
+    """hash_senha executado no pool de hashing"""
+    return executor_senhas.submit(hash_senha, senha).result()
 
 def gerar_token(admin_id):
     """Gera token JWT para o administrador"""
@@ -173,21 +722,647 @@ def admin_required(f):
         if token.startswith('Bearer '):
             token = token[7:]
         
-        print(f"DEBUG: Token recebido: {token[:20]}...")
         admin_id = verificar_token(token)
-        print(f"DEBUG: admin_id extraído: {admin_id}")
+        logger.debug('admin_id extraído do token: %s', admin_id)
         
         if not admin_id:
             return jsonify({'erro': 'Token inválido ou expirado'}), 401
         
-        admin = Administrador.query.get(admin_id)
-        if not admin or not admin.ativo:
+        admin = carregar_admin(admin_id)
+        if not admin:
             return jsonify({'erro': 'Administrador não encontrado ou inativo'}), 401
         
+        g.admin = admin
         return f(*args, **kwargs)
     return decorated_function
 
-FAKE_STORE_API = 'https://fakestoreapi.com'
+# ==================== CACHE DO CATÁLOGO ====================
+
+class VersaoCompartilhada:
+    """Contador de geração compartilhado entre os workers do mesmo host via arquivo
+
+    Cada escrita no catálogo incrementa o número; cada worker compara o valor
+    lido com o que conhecia antes de servir do cache local. A leitura custa um
+    stat() e só relê o arquivo quando ele foi substituído.
+    
+    O número também entra nas ETags, então não pode voltar a valores já usados
+    quando o arquivo some (reboot, limpeza do /tmp): um arquivo novo começa no
+    relógio em milissegundos, acima de qualquer geração anterior.
+    """
+    
+    def __init__(self, caminho):
+        self.caminho = caminho
+        self._assinatura = None
+        self._valor = 0
+        self._lock = threading.Lock()
+    
+    def _ler(self):
+        """Valor do arquivo, ou None se ele não existir (ou estiver corrompido)"""
+        try:
+            with open(self.caminho) as arquivo:
+                return int(arquivo.read().strip())
+        except (FileNotFoundError, ValueError):
+            return None
+    
+    @contextmanager
+    def _exclusivo(self):
+        """Trava entre threads e entre processos para ler-e-gravar o arquivo"""
+        with self._lock, open(self.caminho + '.lock', 'a') as trava:
+            if fcntl:
+                fcntl.flock(trava, fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                if fcntl:
+                    fcntl.flock(trava, fcntl.LOCK_UN)
+    
+    def _gravar(self, valor):
+        temporario = f'{self.caminho}.{os.getpid()}.tmp'
+        with open(temporario, 'w') as arquivo:
+            arquivo.write(str(valor))
+        # os.replace troca o inode, então o stat() dos outros workers percebe a mudança
+        os.replace(temporario, self.caminho)
+    
+    def _iniciar(self):
+        """Cria o arquivo (se nenhum outro processo o criou antes) e retorna o valor"""
+        with self._exclusivo():
+            valor = self._ler()
+            if valor is None:
+                valor = int(time.time() * 1000)
+                self._gravar(valor)
+        return valor
+    
+    def atual(self):
+        try:
+            info = os.stat(self.caminho)
+            assinatura = (info.st_ino, info.st_mtime_ns, info.st_size)
+        except FileNotFoundError:
+            assinatura = None
+        if assinatura != self._assinatura:
+            valor = self._ler()
+            if valor is None:
+                # A assinatura fica a do arquivo ausente: a próxima chamada relê o criado
+                valor = self._iniciar()
+            with self._lock:
+                self._valor = valor
+                self._assinatura = assinatura
+        return self._valor
+    
+    def incrementar(self):
+        """Incrementa a geração de forma atômica entre processos e retorna o novo valor"""
+        with self._exclusivo():
+            # Nunca abaixo do relógio: um arquivo recriado depois não alcança valores já usados
+            valor = max((self._ler() or 0) + 1, int(time.time() * 1000))
+            self._gravar(valor)
+        return valor
+
+def caminho_versao(nome):
+    """Arquivo de versão por banco de dados, para que só workers do mesmo banco o compartilhem"""
+    diretorio = os.environ.get('CACHE_VERSAO_DIR', tempfile.gettempdir())
+    sufixo = hashlib.sha1(database_url.encode()).hexdigest()[:12]
+    return os.path.join(diretorio, f'loja-{nome}-{sufixo}.versao')
+
+class CacheLRU:
+    """Cache LRU com TTL, seguro entre threads, que guarda respostas já serializadas"""
+    
+    def __init__(self, tamanho_maximo=512, ttl=300, versao=None):
+        self.tamanho_maximo = tamanho_maximo
+        self.ttl = ttl
+        self.versao = versao
+        self._geracao = versao.atual() if versao else 0
+        self._dados = OrderedDict()
+        self._lock = threading.Lock()
+        self.acertos = 0
+        self.falhas = 0
+        self.invalidacoes = 0
+    
+    def geracao_atual(self):
+        """Geração vigente; leia-a antes de produzir um valor e passe-a para guardar()"""
+        return self.versao.atual() if self.versao else self._geracao
+    
+    def obter(self, chave):
+        """Retorna o valor guardado ou None (ausente ou expirado)"""
+        agora = time.monotonic()
+        geracao = self.geracao_atual()
+        with self._lock:
+            if geracao != self._geracao:
+                # Outro worker alterou o catálogo: nada guardado aqui é confiável
+                self.invalidacoes += len(self._dados)
+                self._dados.clear()
+                self._geracao = geracao
+            entrada = self._dados.get(chave)
+            if entrada is None or entrada[0] <= agora:
+                if entrada is not None:
+                    del self._dados[chave]
+                self.falhas += 1
+                return None
+            self._dados.move_to_end(chave)
+            self.acertos += 1
+            return entrada[1]
+    
+    def guardar(self, chave, valor, geracao):
+        """Guarda o valor produzido na `geracao` lida antes de produzi-lo
+
+        Se houve invalidação nesse meio-tempo (neste ou em outro worker), o valor
+        pode ser anterior a ela e é descartado em vez de servido até o TTL vencer.
+        """
+        if geracao != self.geracao_atual():
+            return
+        with self._lock:
+            if geracao != self._geracao:
+                return
+            self._dados[chave] = (time.monotonic() + self.ttl, valor)
+            self._dados.move_to_end(chave)
+            while len(self._dados) > self.tamanho_maximo:
+                self._dados.popitem(last=False)
+    
+    def descartar(self, chave):
+        """Remove uma entrada que obter() acabou de retornar mas o chamador julgou desatualizada"""
+        with self._lock:
+            self._dados.pop(chave, None)
+            self.acertos -= 1
+            self.falhas += 1
+            self.invalidacoes += 1
+    
+    def invalidar(self, *prefixos):
+        """Remove as entradas cujas chaves começam com algum dos prefixos (todas, se nenhum)
+
+        Também avisa os demais workers incrementando a versão compartilhada; eles
+        descartam o cache inteiro, enquanto este worker remove só o necessário.
+        """
+        geracao = self.versao.incrementar() if self.versao else None
+        with self._lock:
+            self._geracao = geracao if geracao is not None else self._geracao + 1
+            if not prefixos:
+                removidas = len(self._dados)
+                self._dados.clear()
+            else:
+                chaves = [c for c in self._dados if c.startswith(prefixos)]
+                for chave in chaves:
+                    del self._dados[chave]
+                removidas = len(chaves)
+            self.invalidacoes += removidas
+    
+    def estatisticas(self):
+        with self._lock:
+            consultas = self.acertos + self.falhas
+            return {
+                'entradas': len(self._dados),
+                'acertos': self.acertos,
+                'falhas': self.falhas,
+                'invalidacoes': self.invalidacoes,
+                'geracao': self._geracao,
+                'taxa_acerto': round(self.acertos / consultas, 4) if consultas else 0.0
+            }
+
+cache_catalogo = CacheLRU(
+    tamanho_maximo=int(os.environ.get('CACHE_CATALOGO_TAMANHO', 512)),
+    ttl=int(os.environ.get('CACHE_CATALOGO_TTL', 300)),
+    versao=VersaoCompartilhada(os.environ.get('CACHE_VERSAO_ARQUIVO', caminho_versao('catalogo')))
+)
+
+# Baixas de estoque (pedidos) não trocam a geração do catálogo, que descartaria
+# todas as respostas de todos os workers a cada pedido. Elas só trocam esta
+# versão; cada entrada em cache guarda o estoque dos produtos que contém e, quando
+# a versão muda, confere esse estoque com uma consulta antes de ser servida.
+versao_estoque = VersaoCompartilhada(caminho_versao('estoque'))
+
+def invalidar_estoque():
+    """Avisa todos os workers que o estoque de algum produto mudou (após o commit)"""
+    versao_estoque.incrementar()
+
+def estoques_conferem(estoques, lote=500):
+    """True se todos os produtos de {produto_id: estoque} ainda têm esse estoque"""
+    ids = list(estoques)
+    for inicio in range(0, len(ids), lote):
+        parte = ids[inicio:inicio + lote]
+        atuais = dict(db.session.query(Produto.id, Produto.estoque).filter(Produto.id.in_(parte)))
+        if any(atuais.get(produto_id) != estoques[produto_id] for produto_id in parte):
+            return False
+    return True
+
+def estoque_vigente(entrada):
+    """True se a entrada do cache não depende de estoque ou se o estoque dela não mudou"""
+    _, _, estoques, conferida = entrada
+    if not estoques:
+        return True
+    geracao = versao_estoque.atual()
+    if conferida[0] == geracao:
+        return True
+    if not estoques_conferem(estoques):
+        return False
+    conferida[0] = geracao
+    return True
+
+def resumo_estoques(estoques):
+    return hashlib.sha1(json.dumps(sorted(estoques.items())).encode()).hexdigest()[:12]
+
+def chave_requisicao():
+    """Chave de cache: caminho + query string em ordem canônica"""
+    return f'{request.path}?{urlencode(sorted(request.args.items(multi=True)))}'
+
+def etag_catalogo(chave):
+    """ETag forte de uma listagem: geração do catálogo + chave da requisição (sem ir ao banco)"""
+    resumo = hashlib.sha1(chave.encode()).hexdigest()[:16]
+    return f'c{cache_catalogo.versao.atual()}-{resumo}'
+
+def resposta_nao_modificada(etag, cache_control):
+    resposta = Response(status=304)
+    resposta.set_etag(etag)
+    resposta.headers['Cache-Control'] = cache_control
+    return resposta
+
+def em_cache(cache, cache_control, etag=None):
+    """Decorator para GETs do catálogo: cache de respostas 200 e GET condicional
+
+    `etag`, se informado, calcula a ETag a partir da chave sem consultar o banco,
+    permitindo responder 304 antes de qualquer query. Sem ele, a ETag vem da
+    resposta da view (ou da entrada em cache) e o 304 é decidido depois.
+    
+    Uma view cuja resposta traz estoque registra {produto_id: estoque} em
+    g.estoques: a entrada passa a ser conferida contra versao_estoque (ver
+    estoque_vigente) e a ETag calculada ganha um resumo desses estoques, então
+    um pedido só muda as respostas que contêm os produtos vendidos.
+    """
+    def decorator(f):
+        @wraps(f)
+        def decorated_function(*args, **kwargs):
+            chave = chave_requisicao()
+            etag_atual = etag(chave) if etag else None
+            if etag_atual and etag_atual in request.if_none_match:
+                return resposta_nao_modificada(etag_atual, cache_control)
+            
+            entrada = cache.obter(chave)
+            if entrada is not None and not estoque_vigente(entrada):
+                cache.descartar(chave)
+                entrada = None
+            if entrada is not None:
+                corpo, etag_guardada, _, _ = entrada
+                if etag_guardada in request.if_none_match:
+                    return resposta_nao_modificada(etag_guardada, cache_control)
+                resposta = Response(corpo, mimetype='application/json')
+                resposta.set_etag(etag_guardada)
+                resposta.headers['X-Cache'] = 'HIT'
+            else:
+                geracao, geracao_estoque = cache.geracao_atual(), versao_estoque.atual()
+                resposta = app.make_response(f(*args, **kwargs))
+                estoques = g.pop('estoques', None)
+                if resposta.status_code != 200:
+                    return resposta
+                if etag_atual:
+                    resposta.set_etag(f'{etag_atual}-e{resumo_estoques(estoques)}' if estoques else etag_atual)
+                elif not resposta.get_etag()[0]:
+                    resposta.add_etag()
+                entrada = (resposta.get_data(), resposta.get_etag()[0], estoques, [geracao_estoque])
+                cache.guardar(chave, entrada, geracao)
+                resposta.headers['X-Cache'] = 'MISS'
+            
+            resposta.headers['Cache-Control'] = cache_control
+            return resposta.make_conditional(request)
+        return decorated_function
+    return decorator
+
+def invalidar_catalogo(produto_id=None, categorias=False):
+    """Invalida as respostas afetadas por uma escrita no catálogo (tudo, sem argumentos)
+
+    Só estoque mudou? Use invalidar_estoque(), que não descarta o catálogo.
+    """
+    if produto_id is None and not categorias:
+        cache_catalogo.invalidar()
+        return
+    prefixos = []
+    if produto_id is not None:
+        prefixos += ['/api/produtos?', f'/api/produtos/{produto_id}?']
+    if categorias:
+        prefixos.append('/api/categorias?')
+    cache_catalogo.invalidar(*prefixos)
+
+# Identidade dos administradores autenticados, para admin_required não ir ao banco
+# a cada requisição. Qualquer UPDATE em Administrador (login, desativação, troca
+# de senha) invalida a entrada em todos os workers após o commit.
+cache_admins = CacheLRU(
+    tamanho_maximo=256,
+    ttl=int(os.environ.get('CACHE_ADMIN_TTL', 60)),
+    versao=VersaoCompartilhada(caminho_versao('admins'))
+)
+
+def carregar_admin(admin_id):
+    """Dados do administrador ativo (id, username, email) ou None"""
+    chave = f'admin:{admin_id}:'
+    admin = cache_admins.obter(chave)
+    if admin is None:
+        geracao = cache_admins.geracao_atual()
+        registro = db.session.get(Administrador, admin_id)
+        if not registro or not registro.ativo:
+            return None
+        admin = {'id': registro.id, 'username': registro.username, 'email': registro.email}
+        cache_admins.guardar(chave, admin, geracao)
+    return admin
+
+def invalidar_admin(admin_id):
+    cache_admins.invalidar(f'admin:{admin_id}:')
+
+@event.listens_for(Administrador, 'after_update')
+def _admin_alterado(mapper, connection, admin):
+    object_session(admin).info.setdefault('admins_alterados', set()).add(admin.id)
+
+@event.listens_for(db.session, 'after_commit')
+def _invalidar_admins_alterados(session):
+    for admin_id in session.info.pop('admins_alterados', ()):
+        invalidar_admin(admin_id)
+
+@event.listens_for(db.session, 'after_rollback')
+def _descartar_admins_alterados(session):
+    session.info.pop('admins_alterados', None)
+
+# ==================== MÉTRICAS ====================
+# Cada worker acumula contadores e histogramas em memória e grava um retrato em
+# METRICAS_DIR/<pid>-<início>.json a cada METRICAS_INTERVALO segundos. O /metrics
+# soma os retratos de todos os workers, então qualquer worker responde pelo conjunto.
+# Os retratos de workers encerrados são somados em encerrados.json e apagados: os
+# contadores continuam monotônicos e um PID reaproveitado não sobrescreve o arquivo
+# de outro processo.
+
+METRICAS_DIR = os.environ.get('METRICAS_DIR') or os.path.join(
+    os.environ.get('CACHE_VERSAO_DIR', tempfile.gettempdir()),
+    'loja-metricas-' + hashlib.sha1(database_url.encode()).hexdigest()[:12]
+)
+METRICAS_INTERVALO = float(os.environ.get('METRICAS_INTERVALO', 5))
+
+BUCKETS_DURACAO = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+BUCKETS_QUERIES = (1, 2, 3, 5, 10, 20, 50, 100)
+BUCKETS_BYTES = (256, 1024, 4096, 16384, 65536, 262144, 1048576, 4194304)
+
+DESCRICAO_METRICAS = {
+    'loja_requisicoes_total': ('counter', 'Requisições atendidas por rota, método e status'),
+    'loja_requisicao_duracao_segundos': ('histogram', 'Latência das requisições por rota'),
+    'loja_sql_queries_por_requisicao': ('histogram', 'Comandos SQL executados por requisição'),
+    'loja_sql_duracao_segundos': ('histogram', 'Tempo gasto em SQL por requisição'),
+    'loja_resposta_bytes': ('histogram', 'Tamanho do corpo das respostas'),
+    'loja_cache_acertos_total': ('counter', 'Acertos dos caches em memória'),
+    'loja_cache_falhas_total': ('counter', 'Falhas dos caches em memória'),
+}
+
+class Metricas:
+    """Contadores e histogramas do worker atual, no formato gravado em disco"""
+    
+    def __init__(self, diretorio):
+        self.diretorio = diretorio
+        self._contadores = {}
+        self._histogramas = {}
+        self._lock = threading.Lock()
+        self._ultima_gravacao = time.monotonic()
+        self._pid = self._arquivo = None
+    
+    @staticmethod
+    def _chave(nome, rotulos):
+        return json.dumps([nome, sorted(rotulos.items())])
+    
+    def incrementar(self, nome, valor=1, **rotulos):
+        chave = self._chave(nome, rotulos)
+        with self._lock:
+            self._contadores[chave] = self._contadores.get(chave, 0) + valor
+    
+    def observar(self, nome, valor, buckets, **rotulos):
+        chave = self._chave(nome, rotulos)
+        with self._lock:
+            histograma = self._histogramas.get(chave)
+            if histograma is None:
+                histograma = self._histogramas[chave] = {'limites': list(buckets), 'buckets': [0] * len(buckets), 'soma': 0.0, 'contagem': 0}
+            for i, limite in enumerate(buckets):
+                if valor <= limite:
+                    histograma['buckets'][i] += 1
+                    break
+            histograma['soma'] += valor
+            histograma['contagem'] += 1
+    
+    def retrato(self):
+        with self._lock:
+            retrato = {
+                'contadores': dict(self._contadores),
+                'histogramas': {chave: dict(h, buckets=list(h['buckets'])) for chave, h in self._histogramas.items()}
+            }
+        for nome, cache in (('catalogo', cache_catalogo), ('admins', cache_admins)):
+            estatisticas = cache.estatisticas()
+            retrato['contadores'][self._chave('loja_cache_acertos_total', {'cache': nome})] = estatisticas['acertos']
+            retrato['contadores'][self._chave('loja_cache_falhas_total', {'cache': nome})] = estatisticas['falhas']
+        return retrato
+    
+    def gravar(self, forcar=False):
+        """Grava o retrato deste worker, no máximo a cada METRICAS_INTERVALO segundos"""
+        agora = time.monotonic()
+        if not forcar and agora - self._ultima_gravacao < METRICAS_INTERVALO:
+            return
+        self._ultima_gravacao = agora
+        if self._pid != os.getpid():
+            # Primeira gravação deste processo (ou filho de um fork com --preload)
+            self._pid = os.getpid()
+            self._arquivo = f'{self._pid}-{int(time.time() * 1000)}.json'
+        os.makedirs(self.diretorio, exist_ok=True)
+        caminho = os.path.join(self.diretorio, self._arquivo)
+        self._gravar_json(caminho, self.retrato())
+    
+    @staticmethod
+    def _gravar_json(caminho, retrato):
+        with open(caminho + '.tmp', 'w') as arquivo:
+            json.dump(retrato, arquivo)
+        os.replace(caminho + '.tmp', caminho)
+    
+    @staticmethod
+    def _somar(contadores, histogramas, retrato):
+        for chave, valor in retrato['contadores'].items():
+            contadores[chave] = contadores.get(chave, 0) + valor
+        for chave, h in retrato['histogramas'].items():
+            total = histogramas.setdefault(chave, {'limites': h['limites'], 'buckets': [0] * len(h['limites']), 'soma': 0.0, 'contagem': 0})
+            total['buckets'] = [a + b for a, b in zip(total['buckets'], h['buckets'])]
+            total['soma'] += h['soma']
+            total['contagem'] += h['contagem']
+    
+    @staticmethod
+    def _processo_vivo(nome_arquivo):
+        """False só quando o PID do arquivo com certeza não existe mais"""
+        try:
+            pid = int(nome_arquivo.split('-')[0].split('.')[0])
+        except ValueError:
+            return True
+        if os.name != 'posix':
+            return True  # no Windows os.kill(pid, 0) não é uma sondagem
+        try:
+            os.kill(pid, 0)
+        except ProcessLookupError:
+            return False
+        except OSError:
+            pass
+        return True
+    
+    @contextmanager
+    def _exclusivo(self):
+        """Trava entre processos: incorporar e somar os arquivos não podem se intercalar"""
+        with open(os.path.join(self.diretorio, '.trava'), 'a') as trava:
+            if fcntl:
+                fcntl.flock(trava, fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                if fcntl:
+                    fcntl.flock(trava, fcntl.LOCK_UN)
+    
+    def _ler_retratos(self):
+        for nome_arquivo in os.listdir(self.diretorio):
+            if not nome_arquivo.endswith('.json'):
+                continue
+            try:
+                with open(os.path.join(self.diretorio, nome_arquivo)) as arquivo:
+                    yield nome_arquivo, json.load(arquivo)
+            except (OSError, ValueError):
+                continue
+    
+    def agregar(self):
+        """Soma os retratos de todos os workers, incorporando antes os de workers encerrados"""
+        os.makedirs(self.diretorio, exist_ok=True)
+        encerrados = os.path.join(self.diretorio, 'encerrados.json')
+        contadores, histogramas = {}, {}
+        with self._exclusivo():
+            retratos = dict(self._ler_retratos())
+            mortos = [nome for nome in retratos if nome != 'encerrados.json' and not self._processo_vivo(nome)]
+            if mortos:
+                acumulado = retratos.get('encerrados.json', {'contadores': {}, 'histogramas': {}})
+                soma_contadores, soma_histogramas = dict(acumulado['contadores']), dict(acumulado['histogramas'])
+                for nome in mortos:
+                    self._somar(soma_contadores, soma_histogramas, retratos.pop(nome))
+                retratos['encerrados.json'] = {'contadores': soma_contadores, 'histogramas': soma_histogramas}
+                self._gravar_json(encerrados, retratos['encerrados.json'])
+                for nome in mortos:
+                    try:
+                        os.remove(os.path.join(self.diretorio, nome))
+                    except OSError:
+                        pass
+        for retrato in retratos.values():
+            self._somar(contadores, histogramas, retrato)
+        return contadores, histogramas
+
+def _rotulos_prometheus(pares):
+    if not pares:
+        return ''
+    escapar = lambda valor: str(valor).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+    return '{' + ','.join(f'{nome}="{escapar(valor)}"' for nome, valor in pares) + '}'
+
+def formatar_prometheus(contadores, histogramas):
+    """Texto no formato de exposição do Prometheus (0.0.4)"""
+    series = {}
+    for chave, valor in sorted(contadores.items()):
+        nome, pares = json.loads(chave)
+        series.setdefault(nome, []).append(f'{nome}{_rotulos_prometheus(pares)} {valor}')
+    for chave, h in sorted(histogramas.items()):
+        nome, pares = json.loads(chave)
+        linhas = series.setdefault(nome, [])
+        acumulado = 0
+        for limite, quantidade in zip(h['limites'], h['buckets']):
+            acumulado += quantidade
+            linhas.append(f'{nome}_bucket{_rotulos_prometheus(pares + [["le", limite]])} {acumulado}')
+        linhas.append(f'{nome}_bucket{_rotulos_prometheus(pares + [["le", "+Inf"]])} {h["contagem"]}')
+        linhas.append(f'{nome}_sum{_rotulos_prometheus(pares)} {round(h["soma"], 6)}')
+        linhas.append(f'{nome}_count{_rotulos_prometheus(pares)} {h["contagem"]}')
+    saida = []
+    for nome in sorted(series):
+        tipo, descricao = DESCRICAO_METRICAS.get(nome, ('untyped', nome))
+        saida += [f'# HELP {nome} {descricao}', f'# TYPE {nome} {tipo}', *series[nome]]
+    return '\n'.join(saida) + '\n'
+
+metricas = Metricas(METRICAS_DIR)
+atexit.register(lambda: metricas.gravar(forcar=True))
+
+@event.listens_for(Engine, 'before_cursor_execute')
+def _inicio_sql(conn, cursor, statement, parameters, context, executemany):
+    conn.info['inicio_sql'] = time.perf_counter()
+
+@event.listens_for(Engine, 'after_cursor_execute')
+def _fim_sql(conn, cursor, statement, parameters, context, executemany):
+    duracao = time.perf_counter() - conn.info.pop('inicio_sql', time.perf_counter())
+    if has_request_context():
+        g.sql_queries = g.get('sql_queries', 0) + 1
+        g.sql_segundos = g.get('sql_segundos', 0.0) + duracao
+    if SQL_LENTA_MS is not None and duracao * 1000 >= SQL_LENTA_MS:
+        registrar_sql_lenta(conn, cursor, statement, parameters, executemany, duracao)
+
+# ==================== CONSULTAS LENTAS ====================
+# Desligado por padrão: com SQL_LENTA_MS definido, cada comando acima do limite
+# entra num buffer circular deste worker, com parâmetros, rota e plano de execução.
+
+SQL_LENTA_MS = float(os.environ['SQL_LENTA_MS']) if os.environ.get('SQL_LENTA_MS') else None
+consultas_lentas = deque(maxlen=int(os.environ.get('SQL_LENTA_MAXIMO', 200)))
+
+def _plano_execucao(conn, cursor, statement, parameters):
+    """EXPLAIN do comando num cursor separado (o cursor original ainda tem o resultado pendente)"""
+    if not statement.lstrip().upper().startswith(('SELECT', 'WITH')):
+        return None
+    dialeto = conn.dialect.name
+    if dialeto == 'sqlite':
+        prefixo = 'EXPLAIN QUERY PLAN '
+    elif dialeto == 'postgresql':
+        prefixo = 'EXPLAIN '
+    else:
+        return None
+    explicacao = cursor.connection.cursor()
+    try:
+        explicacao.execute(prefixo + statement, parameters)
+        linhas = explicacao.fetchall()
+    except Exception as e:
+        return [f'EXPLAIN falhou: {e}']
+    finally:
+        explicacao.close()
+    # SQLite: (id, pai, não usado, detalhe); PostgreSQL: uma coluna de texto por linha
+    return [linha[-1] for linha in linhas]
+
+def registrar_sql_lenta(conn, cursor, statement, parameters, executemany, duracao):
+    consultas_lentas.append({
+        'data': datetime.utcnow().isoformat(),
+        'duracao_ms': round(duracao * 1000, 2),
+        'sql': statement,
+        'parametros': repr(parameters)[:500],
+        'rota': f'{request.method} {request.url_rule.rule if request.url_rule else request.path}' if has_request_context() else threading.current_thread().name,
+        'request_id': g.get('request_id') if has_request_context() else None,
+        'plano': None if executemany else _plano_execucao(conn, cursor, statement, parameters)
+    })
+
+@app.after_request
+def registrar_metricas(response):
+    rota = request.url_rule.rule if request.url_rule else 'nao_encontrada'
+    duracao = time.perf_counter() - g.get('inicio_requisicao', time.perf_counter())
+    metricas.incrementar('loja_requisicoes_total', rota=rota, metodo=request.method, status=response.status_code)
+    metricas.observar('loja_requisicao_duracao_segundos', duracao, BUCKETS_DURACAO, rota=rota)
+    metricas.observar('loja_sql_queries_por_requisicao', g.get('sql_queries', 0), BUCKETS_QUERIES, rota=rota)
+    metricas.observar('loja_sql_duracao_segundos', g.get('sql_segundos', 0.0), BUCKETS_DURACAO, rota=rota)
+    if response.content_length is not None:
+        metricas.observar('loja_resposta_bytes', response.content_length, BUCKETS_BYTES, rota=rota)
+    metricas.gravar()
+    return response
+
+@app.route('/metrics', methods=['GET'])
+def exportar_metricas():
+    """Métricas de todos os workers no formato texto do Prometheus"""
+    token = os.environ.get('METRICAS_TOKEN')
+    if token and not hmac.compare_digest(request.headers.get('Authorization', ''), f'Bearer {token}'):
+        return jsonify({'erro': 'Token de métricas inválido'}), 401
+    metricas.gravar(forcar=True)
+    return Response(formatar_prometheus(*metricas.agregar()), mimetype='text/plain; version=0.0.4')
+
+@app.route('/api/admin/sql-lentas', methods=['GET', 'DELETE'])
+@admin_required
+def listar_sql_lentas():
+    """Consultas lentas registradas por este worker, da mais recente para a mais antiga"""
+    if request.method == 'DELETE':
+        consultas_lentas.clear()
+        return jsonify({'mensagem': 'Registro de consultas lentas limpo'})
+    return jsonify({
+        'ativo': SQL_LENTA_MS is not None,
+        'limite_ms': SQL_LENTA_MS,
+        'worker': os.getpid(),
+        'consultas': list(reversed(consultas_lentas))
+    })
+
+FAKE_STORE_API = os.environ.get('FAKE_STORE_API', 'https://fakestoreapi.com')
+TAMANHO_LOTE_SYNC = 1000
 
 PRODUTOS_PORTUGUES = [
     # Eletrônicos
@@ -267,161 +1442,564 @@ PRODUTOS_PORTUGUES = [
     {"nome": "Livro: A Menina que Roubava Livros", "descricao": "Romance de Markus Zusak", "preco": 500, "categoria": "Livros", "imagem": "https://images.unsplash.com/photo-1481627834876-b7833e8f5570?w=300&h=300&fit=crop"},
 ]
 
+def iterar_array_json(pedacos):
+    """Itera os elementos de um array JSON recebido em pedaços, sem montar o documento inteiro"""
+    decodificador = json.JSONDecoder()
+    buffer = ''
+    dentro = False
+    for pedaco in pedacos:
+        buffer += pedaco
+        pos = 0
+        while True:
+            while pos < len(buffer) and buffer[pos] in ' \t\r\n,':
+                pos += 1
+            if pos >= len(buffer):
+                break
+            if not dentro:
+                if buffer[pos] != '[':
+                    raise ValueError('Resposta não é um array JSON')
+                dentro = True
+                pos += 1
+                continue
+            if buffer[pos] == ']':
+                return
+            try:
+                elemento, fim = decodificador.raw_decode(buffer, pos)
+            except json.JSONDecodeError:
+                break  # elemento ainda incompleto: espera o próximo pedaço
+            if fim == len(buffer) and not isinstance(elemento, (dict, list)):
+                break  # um número no fim do buffer pode continuar no próximo pedaço
+            yield elemento
+            pos = fim
+        buffer = buffer[pos:]
+    raise ValueError('Array JSON incompleto')
+
+# ==================== CLIENTE DA API EXTERNA ====================
+
+class CircuitoAberto(requests.RequestException):
+    """Chamada recusada porque a API externa falhou repetidamente"""
+
+class Disjuntor:
+    """Circuit breaker: abre após N falhas seguidas e libera uma tentativa depois do intervalo"""
+    
+    def __init__(self, limite_falhas=5, intervalo_reabertura=30):
+        self.limite_falhas = limite_falhas
+        self.intervalo_reabertura = intervalo_reabertura
+        self.falhas = 0
+        self.aberto_ate = 0.0
+        self._lock = threading.Lock()
+    
+    @property
+    def estado(self):
+        if self.falhas < self.limite_falhas:
+            return 'fechado'
+        return 'aberto' if time.monotonic() < self.aberto_ate else 'meio-aberto'
+    
+    def permitir(self):
+        with self._lock:
+            estado = self.estado
+            if estado == 'meio-aberto':
+                # Só uma chamada de teste por intervalo
+                self.aberto_ate = time.monotonic() + self.intervalo_reabertura
+            return estado != 'aberto'
+    
+    def registrar_sucesso(self):
+        with self._lock:
+            self.falhas = 0
+    
+    def registrar_falha(self):
+        with self._lock:
+            self.falhas += 1
+            if self.falhas >= self.limite_falhas:
+                self.aberto_ate = time.monotonic() + self.intervalo_reabertura
+
+class ClienteExterno:
+    """Cliente HTTP compartilhado para a API externa
+
+    Mantém conexões keep-alive em pool, aplica timeouts e novas tentativas com
+    backoff, protege com um disjuntor e guarda o último resultado de saúde para
+    que /api/status não precise fazer uma chamada de rede a cada requisição.
+    """
+    
+    def __init__(self, base_url, timeout=(3.05, 15), tentativas=3, backoff=0.5, ttl_saude=60):
+        self.base_url = base_url
+        self.timeout = timeout
+        self.ttl_saude = ttl_saude
+        self.disjuntor = Disjuntor()
+        self.executor = ThreadPoolExecutor(max_workers=4, thread_name_prefix='api-externa')
+        self.sessao = requests.Session()
+        adaptador = HTTPAdapter(pool_connections=4, pool_maxsize=8, max_retries=Retry(
+            total=tentativas,
+            backoff_factor=backoff,
+            status_forcelist=(429, 500, 502, 503, 504),
+            allowed_methods=frozenset(['GET'])
+        ))
+        self.sessao.mount('http://', adaptador)
+        self.sessao.mount('https://', adaptador)
+        self._saude = None
+        self._saude_em = 0.0
+        self._verificando = False
+        self._lock = threading.Lock()
+    
+    def _marcar_saude(self, online):
+        self._saude = online
+        self._saude_em = time.monotonic()
+    
+    def get(self, caminho, **kwargs):
+        """GET na API externa; lança CircuitoAberto sem tocar a rede se o disjuntor estiver aberto"""
+        if not self.disjuntor.permitir():
+            raise CircuitoAberto(f'API externa indisponível (disjuntor aberto): {caminho}')
+        kwargs.setdefault('timeout', self.timeout)
+        try:
+            response = self.sessao.get(f'{self.base_url}{caminho}', **kwargs)
+            response.raise_for_status()
+        except requests.RequestException:
+            self.disjuntor.registrar_falha()
+            self._marcar_saude(False)
+            raise
+        self.disjuntor.registrar_sucesso()
+        self._marcar_saude(True)
+        return response
+    
+    def _verificar_saude(self):
+        try:
+            self.get('/products?limit=1', timeout=(2, 5)).close()
+        except requests.RequestException:
+            pass
+        finally:
+            self._verificando = False
+    
+    def saude(self):
+        """Último estado conhecido (None se ainda desconhecido); renova em segundo plano se expirado"""
+        if time.monotonic() - self._saude_em > self.ttl_saude:
+            with self._lock:
+                if not self._verificando:
+                    self._verificando = True
+                    self.executor.submit(self._verificar_saude)
+        return self._saude
+
+cliente_externo = ClienteExterno(
+    FAKE_STORE_API,
+    timeout=(float(os.environ.get('API_EXTERNA_TIMEOUT_CONEXAO', 3.05)), float(os.environ.get('API_EXTERNA_TIMEOUT_LEITURA', 15))),
+    tentativas=int(os.environ.get('API_EXTERNA_TENTATIVAS', 3)),
+    ttl_saude=int(os.environ.get('API_EXTERNA_SAUDE_TTL', 60))
+)
+
 def buscar_produtos_externos():
-    """Busca produtos da Fake Store API"""
-    try:
-        response = requests.get(f'{FAKE_STORE_API}/products')
-        response.raise_for_status()
-        return response.json()
-    except requests.RequestException as e:
-        print(f'Erro ao buscar produtos externos: {e}')
-        return []
+    """Itera os produtos da Fake Store API à medida que chegam (streaming)"""
+    with cliente_externo.get('/products', stream=True) as response:
+        response.encoding = response.encoding or 'utf-8'
+        yield from iterar_array_json(response.iter_content(chunk_size=65536, decode_unicode=True))
 
 def buscar_categorias_externas():
     """Busca categorias da Fake Store API"""
     try:
-        response = requests.get(f'{FAKE_STORE_API}/products/categories')
-        response.raise_for_status()
-        return response.json()
+        return cliente_externo.get('/products/categories').json()
     except requests.RequestException as e:
-        print(f'Erro ao buscar categorias externas: {e}')
+        logger.warning('Erro ao buscar categorias externas: %s', e)
         return []
 
-def sincronizar_dados_externos():
-    """Sincroniza dados da API externa com o banco local"""
-    try:
-        produtos_externos = buscar_produtos_externos()
-        categorias_externas = buscar_categorias_externas()
-        
-        Produto.query.delete()
-        Categoria.query.delete()
-        
-        for i, cat_nome in enumerate(categorias_externas, 1):
-            categoria = Categoria(
-                id=i,
-                nome=cat_nome.title(),
-                descricao=f'Produtos da categoria {cat_nome.title()}'
-            )
-            db.session.add(categoria)
-        
-        db.session.flush()
-        
-        for produto_ext in produtos_externos:
-            categoria_id = 1  
-            if produto_ext['category'] in categorias_externas:
-                categoria_id = categorias_externas.index(produto_ext['category']) + 1
-            
-            produto = Produto(
-                nome=produto_ext['title'],
-                descricao=produto_ext['description'],
-                preco=float(produto_ext['price']),
-                estoque=100,  
-                imagem_url=produto_ext['image'],
-                categoria_id=categoria_id,
-                ativo=True
-            )
-            db.session.add(produto)
-        
+CATEGORIAS_PORTUGUES = [
+    {"nome": "Eletrônicos", "descricao": "Smartphones, laptops, tablets e acessórios"},
+    {"nome": "Roupas Masculinas", "descricao": "Camisas, calças, tênis e acessórios masculinos"},
+    {"nome": "Roupas Femininas", "descricao": "Vestidos, blusas, sapatos e acessórios femininos"},
+    {"nome": "Casa e Jardim", "descricao": "Móveis, eletrodomésticos e decoração"},
+    {"nome": "Esportes", "descricao": "Equipamentos esportivos e roupas de academia"},
+    {"nome": "Joias", "descricao": "Anéis, colares, relógios e acessórios de luxo"},
+    {"nome": "Livros", "descricao": "Livros de literatura, ficção e não-ficção"}
+]
+
+# Origem dos produtos gravados antes de a sincronização guardar id_externo. Só
+# eles podem ser adotados pelo nome; os criados pelo admin (id_externo nulo) não.
+ORIGEM_LEGADO = 'legado'
+
+def impressao_digital(registro):
+    """Hash do conteúdo de um registro de origem, usado para detectar mudanças"""
+    conteudo = {c: registro[c] for c in ('nome', 'descricao', 'preco', 'imagem_url', 'categoria')}
+    conteudo['preco'] = float(conteudo['preco'])
+    return hashlib.sha256(json.dumps(conteudo, sort_keys=True, ensure_ascii=False).encode()).hexdigest()
+
+def garantir_categorias(categorias):
+    """Cria (com commit) as categorias (nome, descricao) que ainda não existem"""
+    categorias = list(categorias)
+    with escrita_sqlite():
+        existentes = {nome for (nome,) in db.session.query(Categoria.nome)}
+        for nome, descricao in categorias:
+            if nome not in existentes:
+                db.session.add(Categoria(nome=nome, descricao=descricao))
+                existentes.add(nome)
         db.session.commit()
-        return True
-    except Exception as e:
-        print(f'Erro ao sincronizar dados: {e}')
-        db.session.rollback()
-        return False
 
-def sincronizar_produtos_portugues():
-    """Sincroniza produtos em português com valores em meticais"""
-    try:
-        Produto.query.delete()
-        Categoria.query.delete()
-        
-        categorias = [
-            {"nome": "Eletrônicos", "descricao": "Smartphones, laptops, tablets e acessórios"},
-            {"nome": "Roupas Masculinas", "descricao": "Camisas, calças, tênis e acessórios masculinos"},
-            {"nome": "Roupas Femininas", "descricao": "Vestidos, blusas, sapatos e acessórios femininos"},
-            {"nome": "Casa e Jardim", "descricao": "Móveis, eletrodomésticos e decoração"},
-            {"nome": "Esportes", "descricao": "Equipamentos esportivos e roupas de academia"},
-            {"nome": "Joias", "descricao": "Anéis, colares, relógios e acessórios de luxo"},
-            {"nome": "Livros", "descricao": "Livros de literatura, ficção e não-ficção"}
-        ]
-        
-        for i, cat in enumerate(categorias, 1):
-            categoria = Categoria(
-                id=i,
-                nome=cat["nome"],
-                descricao=cat["descricao"]
-            )
-            db.session.add(categoria)
-        
-        db.session.flush()
-        
-        for produto_data in PRODUTOS_PORTUGUES:
-            categoria_id = 1  # Default
-            for i, cat in enumerate(categorias, 1):
-                if cat["nome"] == produto_data["categoria"]:
-                    categoria_id = i
-                    break
-            
-            produto = Produto(
-                nome=produto_data["nome"],
-                descricao=produto_data["descricao"],
-                preco=float(produto_data["preco"]),
-                estoque=100,  # Estoque padrão
-                imagem_url=produto_data["imagem"],
-                categoria_id=categoria_id,
-                ativo=True
-            )
-            db.session.add(produto)
+def sincronizar_registros(registros, origem, progresso=None):
+    """Aplica de forma incremental os produtos de uma fonte externa
+
+    `registros` é um iterável de dicts com id_externo, nome, descricao, preco,
+    imagem_url e categoria (nome). Cada registro é comparado pela impressão
+    digital com o que foi gravado na última sincronização: só inserções e
+    alterações são escritas (em lotes), e produtos da mesma origem que sumiram
+    da fonte são desativados, nunca apagados, preservando os ids usados por
+    pedidos e favoritos. `progresso(n)` é chamado a cada lote com o total de
+    registros lidos. Retorna as contagens.
+    
+    Cada lote (produtos + índice de busca) é gravado e commitado numa transação
+    curta dentro de escrita_sqlite(); a leitura da fonte, que pode esperar pela
+    rede, acontece fora dela. Uma falha no meio deixa os lotes anteriores gravados,
+    o que é seguro: a próxima sincronização compara as impressões digitais e
+    continua de onde parou. A desativação só roda depois de a fonte ser lida inteira.
+    """
+    categorias = {nome: cat_id for cat_id, nome in db.session.query(Categoria.id, Categoria.nome)}
+    existentes = {
+        id_externo: (produto_id, hash_origem, ativo)
+        for produto_id, id_externo, hash_origem, ativo in db.session.query(
+            Produto.id, Produto.id_externo, Produto.hash_origem, Produto.ativo
+        ).filter(Produto.id_externo.like(f'{origem}:%'))
+    }
+    # Produtos gravados antes do id_externo existir são adotados pelo nome
+    legados = {nome: produto_id for produto_id, nome in db.session.query(Produto.id, Produto.nome).filter(
+        Produto.id_externo.like(f'{ORIGEM_LEGADO}:%')
+    )}
+    
+    db.session.rollback()  # não segura a transação de leitura enquanto espera a fonte
+    
+    novos, alterados = [], []
+    vistos = set()
+    contagem = {'adicionados': 0, 'atualizados': 0, 'desativados': 0, 'inalterados': 0}
+    
+    def gravar_lotes(forcar=False):
+        gravar_novos = novos and (forcar or len(novos) >= TAMANHO_LOTE_SYNC)
+        gravar_alterados = alterados and (forcar or len(alterados) >= TAMANHO_LOTE_SYNC)
+        if not (gravar_novos or gravar_alterados):
+            return
+        ids = []
+        with escrita_sqlite():
+            if gravar_novos:
+                db.session.bulk_insert_mappings(Produto, novos)
+                ids += [i for (i,) in db.session.query(Produto.id).filter(
+                    Produto.id_externo.in_([n['id_externo'] for n in novos])
+                )]
+            if gravar_alterados:
+                db.session.bulk_update_mappings(Produto, alterados)
+                ids += [a['id'] for a in alterados]
+            indexar_produtos(ids)
+            db.session.commit()
+        if gravar_novos:
+            novos.clear()
+        if gravar_alterados:
+            alterados.clear()
+        invalidar_catalogo()
+    
+    for registro in registros:
+        id_externo = registro['id_externo']
+        vistos.add(id_externo)
+        if progresso and len(vistos) % TAMANHO_LOTE_SYNC == 0:
+            progresso(len(vistos))
+        hash_origem = impressao_digital(registro)
+        atual = existentes.get(id_externo)
+        if atual is not None and atual[1] == hash_origem and atual[2]:
+            contagem['inalterados'] += 1
+            continue
+        
+        nome_categoria = registro['categoria']
+        if nome_categoria not in categorias:
+            garantir_categorias([(nome_categoria, f'Produtos da categoria {nome_categoria}')])
+            categorias[nome_categoria] = db.session.query(Categoria.id).filter_by(nome=nome_categoria).scalar()
+            db.session.rollback()
+        
+        valores = {
+            'nome': registro['nome'],
+            'descricao': registro['descricao'],
+            'preco': float(registro['preco']),
+            'imagem_url': registro['imagem_url'],
+            'categoria_id': categorias[nome_categoria],
+            'ativo': True,
+            'id_externo': id_externo,
+            'hash_origem': hash_origem
+        }
         
-        db.session.commit()
-        return True
+        produto_id = atual[0] if atual is not None else legados.pop(registro['nome'], None)
+        if produto_id is None:
+            novos.append({**valores, 'estoque': 100, 'data_criacao': datetime.utcnow()})
+            contagem['adicionados'] += 1
+        else:
+            alterados.append({**valores, 'id': produto_id, 'data_atualizacao': datetime.utcnow()})
+            contagem['atualizados'] += 1
+        gravar_lotes()
+    
+    # Desativação dos produtos desta origem que não vieram mais da fonte
+    for id_externo, (produto_id, _, ativo) in existentes.items():
+        if ativo and id_externo not in vistos:
+            alterados.append({'id': produto_id, 'ativo': False, 'data_atualizacao': datetime.utcnow()})
+            contagem['desativados'] += 1
+            gravar_lotes()
+    
+    gravar_lotes(forcar=True)
+    if progresso:
+        progresso(len(vistos))
+    
+    return contagem
+
+def executar_sincronizacao(origem, preparar, progresso=None):
+    """Executa uma sincronização registrando o relatório em Sincronizacao
+
+    `preparar()` deve fazer os ajustes iniciais (categorias) e retornar o
+    iterável de registros. Retorna o relatório ou None em caso de falha.
+    """
+    inicio = datetime.utcnow()
+    cronometro = time.perf_counter()
+    try:
+        contagem = sincronizar_registros(preparar(), origem, progresso)
+        relatorio = {'origem': origem, **contagem, 'duracao_segundos': round(time.perf_counter() - cronometro, 3)}
+        with escrita_sqlite():
+            db.session.add(Sincronizacao(data_inicio=inicio, data_fim=datetime.utcnow(), sucesso=True, **relatorio))
+            db.session.commit()
+        return relatorio
     except Exception as e:
-        print(f'Erro ao sincronizar produtos em português: {e}')
+        logger.exception('Erro ao sincronizar dados (%s)', origem)
         db.session.rollback()
-        return False
+        with escrita_sqlite():
+            db.session.add(Sincronizacao(
+                origem=origem, data_inicio=inicio, data_fim=datetime.utcnow(), sucesso=False,
+                duracao_segundos=round(time.perf_counter() - cronometro, 3), erro=str(e)
+            ))
+            db.session.commit()
+        return None
+
+def sincronizar_dados_externos(progresso=None):
+    """Sincroniza de forma incremental os produtos da API externa com o banco local"""
+    def preparar():
+        # Categorias e produtos são buscados em paralelo: o stream de produtos
+        # é aberto enquanto a lista de categorias ainda está a caminho
+        categorias_futuras = cliente_externo.executor.submit(buscar_categorias_externas)
+        produtos = buscar_produtos_externos()
+        try:
+            primeiro = next(produtos, None)
+            garantir_categorias(
+                (cat_nome.title(), f'Produtos da categoria {cat_nome.title()}')
+                for cat_nome in categorias_futuras.result()
+            )
+        except BaseException:
+            produtos.close()  # devolve a conexão do stream ao pool
+            raise
+        if primeiro is not None:
+            produtos = itertools.chain([primeiro], produtos)
+        return ({
+            'id_externo': f'fakestore:{produto_ext["id"]}',
+            'nome': produto_ext['title'],
+            'descricao': produto_ext['description'],
+            'preco': produto_ext['price'],
+            'imagem_url': produto_ext['image'],
+            'categoria': produto_ext['category'].title()
+        } for produto_ext in produtos)
+    
+    return executar_sincronizacao('fakestore', preparar, progresso)
+
+def sincronizar_produtos_portugues(progresso=None):
+    """Sincroniza de forma incremental os produtos em português com valores em meticais"""
+    def preparar():
+        garantir_categorias((cat['nome'], cat['descricao']) for cat in CATEGORIAS_PORTUGUES)
+        return ({
+            'id_externo': 'pt:' + re.sub(r'\W+', '-', normalizar_texto(produto_data['nome'])).strip('-'),
+            'nome': produto_data['nome'],
+            'descricao': produto_data['descricao'],
+            'preco': produto_data['preco'],
+            'imagem_url': produto_data['imagem'],
+            'categoria': produto_data['categoria']
+        } for produto_data in PRODUTOS_PORTUGUES)
+    
+    return executar_sincronizacao('pt', preparar, progresso)
+
+def ultima_sincronizacao():
+    """Relatório da última sincronização bem-sucedida, ou 'N/A'"""
+    ultima = Sincronizacao.query.filter_by(sucesso=True).order_by(Sincronizacao.data_fim.desc()).first()
+    if not ultima:
+        return 'N/A'
+    return {
+        'origem': ultima.origem,
+        'data': ultima.data_fim.isoformat(),
+        'adicionados': ultima.adicionados,
+        'atualizados': ultima.atualizados,
+        'desativados': ultima.desativados,
+        'inalterados': ultima.inalterados,
+        'duracao_segundos': ultima.duracao_segundos
+    }
+
+
+# ==================== TAREFAS EM SEGUNDO PLANO ====================
+
+# Um único executor por worker; a trava no banco impede duas sincronizações
+# simultâneas mesmo entre workers diferentes.
+executor_sync = ThreadPoolExecutor(max_workers=1, thread_name_prefix='sincronizacao')
+TRAVA_SYNC_TTL = int(os.environ.get('SYNC_TRAVA_TTL', 30 * 60))
+
+SINCRONIZADORES = {
+    'fakestore': sincronizar_dados_externos,
+    'pt': sincronizar_produtos_portugues,
+}
+
+# Progresso das tarefas rodando neste worker (mais recente que o gravado no banco)
+_progresso_local = {}
+
+def adquirir_trava(nome, dono, ttl):
+    """Tenta adquirir a trava `nome` para `dono`; retorna True se conseguiu"""
+    agora = datetime.utcnow()
+    try:
+        with db.session.begin_nested():
+            db.session.add(Trava(nome=nome))
+    except IntegrityError:
+        pass  # a linha da trava já existe
+    tabela = Trava.__table__
+    resultado = db.session.execute(tabela.update().where(
+        tabela.c.nome == nome,
+        db.or_(tabela.c.dono.is_(None), tabela.c.expira_em < agora)
+    ).values(dono=dono, expira_em=agora + timedelta(seconds=ttl)))
+    db.session.commit()
+    return resultado.rowcount == 1
+
+def renovar_trava(nome, dono, ttl):
+    """Estende a validade da trava se `dono` ainda a detém (na transação corrente); retorna False se a perdeu"""
+    tabela = Trava.__table__
+    resultado = db.session.execute(tabela.update().where(
+        tabela.c.nome == nome, tabela.c.dono == dono
+    ).values(expira_em=datetime.utcnow() + timedelta(seconds=ttl)))
+    return resultado.rowcount == 1
+
+class TravaPerdida(Exception):
+    """A trava expirou e foi adquirida por outro dono enquanto o trabalho executava"""
+
+def liberar_trava(nome, dono):
+    tabela = Trava.__table__
+    db.session.execute(tabela.update().where(tabela.c.nome == nome, tabela.c.dono == dono).values(dono=None, expira_em=None))
+    db.session.commit()
+
+def serializar_tarefa(tarefa):
+    progresso = _progresso_local.get(tarefa.id, tarefa.progresso) if tarefa.status == 'executando' else tarefa.progresso
+    return {
+        'id': tarefa.id,
+        'tipo': tarefa.tipo,
+        'status': tarefa.status,
+        'progresso': progresso,
+        'resultado': json.loads(tarefa.resultado) if tarefa.resultado else None,
+        'erro': tarefa.erro,
+        'data_criacao': tarefa.data_criacao.isoformat() if tarefa.data_criacao else None,
+        'data_inicio': tarefa.data_inicio.isoformat() if tarefa.data_inicio else None,
+        'data_fim': tarefa.data_fim.isoformat() if tarefa.data_fim else None
+    }
+
+def _registrar_progresso(tarefa_id, processados):
+    """Grava o progresso no banco, para que qualquer worker o mostre, e renova a trava
 
+    A sincronização não mantém transação aberta entre os lotes, então a gravação
+    é uma escrita curta como as outras (na fila de escrita, no SQLite). A trava
+    só expira se a tarefa parar de avançar por TRAVA_SYNC_TTL; se outra tarefa a
+    adquiriu nesse meio-tempo, esta para com TravaPerdida em vez de gravar junto.
+    """
+    _progresso_local[tarefa_id] = processados
+    try:
+        with escrita_sqlite():
+            db.session.execute(TarefaSync.__table__.update().where(
+                TarefaSync.__table__.c.id == tarefa_id
+            ).values(progresso=processados))
+            mantida = renovar_trava('sincronizacao', tarefa_id, TRAVA_SYNC_TTL)
+            db.session.commit()
+    except OperationalError:
+        db.session.rollback()  # progresso é informativo: não interrompe a sincronização
+        return
+    if not mantida:
+        raise TravaPerdida('Trava da sincronização expirou e foi adquirida por outra tarefa')
+
+def _executar_tarefa(tarefa_id):
+    """Corpo da tarefa, executado na thread do executor_sync"""
+    with app.app_context():
+        relatorio, erro = None, 'Falha ao sincronizar dados'
+        try:
+            with escrita_sqlite():
+                tarefa = db.session.get(TarefaSync, tarefa_id)
+                tarefa.status = 'executando'
+                tarefa.data_inicio = datetime.utcnow()
+                tipo = tarefa.tipo
+                db.session.commit()
+            # Sem transação aberta aqui: cada lote entra sozinho na fila de escrita
+            # (ver sincronizar_registros), e a leitura da fonte fica fora dela
+            relatorio = SINCRONIZADORES[tipo](progresso=lambda n: _registrar_progresso(tarefa_id, n))
+        except Exception as e:
+            erro = str(e)
+        finally:
+            db.session.rollback()
+            try:
+                with escrita_sqlite():
+                    tarefa = db.session.get(TarefaSync, tarefa_id)
+                    if relatorio is None:
+                        tarefa.status = 'falhou'
+                        tarefa.erro = erro
+                    else:
+                        tarefa.status = 'concluida'
+                        tarefa.resultado = json.dumps(relatorio)
+                        tarefa.progresso = _progresso_local.get(tarefa_id, 0)
+                    tarefa.data_fim = datetime.utcnow()
+                    db.session.commit()
+            finally:
+                # Mesmo se o status não pôde ser gravado, a trava não fica presa até o TTL
+                db.session.rollback()
+                with escrita_sqlite():
+                    liberar_trava('sincronizacao', tarefa_id)
+                _progresso_local.pop(tarefa_id, None)
+
+def agendar_sincronizacao(tipo):
+    """Enfileira uma sincronização; retorna 202 com o id da tarefa, ou 409 se já houver uma"""
+    tarefa_id = str(uuid.uuid4())
+    if not adquirir_trava('sincronizacao', tarefa_id, TRAVA_SYNC_TTL):
+        trava = db.session.get(Trava, 'sincronizacao')
+        return jsonify({'erro': 'Já existe uma sincronização em andamento', 'tarefa_id': trava.dono if trava else None}), 409
+    
+    # Tarefas que ficaram abertas por um worker que morreu (a trava expirou)
+    TarefaSync.query.filter(TarefaSync.status.in_(['pendente', 'executando'])).update(
+        {'status': 'falhou', 'erro': 'Interrompida', 'data_fim': datetime.utcnow()}, synchronize_session=False
+    )
+    tarefa = TarefaSync(id=tarefa_id, tipo=tipo, status='pendente')
+    db.session.add(tarefa)
+    db.session.commit()
+    
+    executor_sync.submit(_executar_tarefa, tarefa_id)
+    
+    url_status = url_for('status_tarefa_sync', tarefa_id=tarefa_id)
+    resposta = jsonify({'mensagem': 'Sincronização agendada', 'tarefa_id': tarefa_id, 'status_url': url_status})
+    resposta.status_code = 202
+    resposta.headers['Location'] = url_status
+    return resposta
 
 @app.route('/api/sync', methods=['POST'])
 def sincronizar_api():
-    """Endpoint para sincronizar com API externa"""
-    if sincronizar_dados_externos():
-        return jsonify({'mensagem': 'Dados sincronizados com sucesso!'})
-    else:
-        return jsonify({'erro': 'Falha ao sincronizar dados'}), 500
+    """Endpoint para sincronizar com API externa (em segundo plano)"""
+    return agendar_sincronizacao('fakestore')
 
 @app.route('/api/sync-portugues', methods=['POST'])
 def sincronizar_portugues():
-    """Endpoint para sincronizar com produtos em português"""
-    if sincronizar_produtos_portugues():
-        return jsonify({'mensagem': 'Produtos em português sincronizados com sucesso!'})
-    else:
-        return jsonify({'erro': 'Falha ao sincronizar produtos em português'}), 500
+    """Endpoint para sincronizar com produtos em português (em segundo plano)"""
+    return agendar_sincronizacao('pt')
+
+@app.route('/api/sync/tarefas/<tarefa_id>', methods=['GET'])
+def status_tarefa_sync(tarefa_id):
+    """Status, progresso e resultado de uma sincronização"""
+    tarefa = db.session.get(TarefaSync, tarefa_id)
+    if not tarefa:
+        return jsonify({'erro': 'Tarefa não encontrada'}), 404
+    return jsonify(serializar_tarefa(tarefa))
 
 @app.route('/api/status', methods=['GET'])
 def status_api():
-    """Endpoint para verificar status da API"""
-    try:
-        response = requests.get(f'{FAKE_STORE_API}/products?limit=1', timeout=5)
-        api_status = response.status_code == 200
-        
-        produtos_count = Produto.query.count()
-        categorias_count = Categoria.query.count()
-        
-        return jsonify({
-            'api_externa_online': api_status,
-            'produtos_locais': produtos_count,
-            'categorias_locais': categorias_count,
-            'ultima_sincronizacao': 'N/A'  
-        })
-    except:
-        return jsonify({
-            'api_externa_online': False,
-            'produtos_locais': Produto.query.count(),
-            'categorias_locais': Categoria.query.count(),
-            'ultima_sincronizacao': 'N/A'
-        })
+    """Endpoint para verificar status da API (saúde da API externa vem do cache do cliente)"""
+    return jsonify({
+        'api_externa_online': cliente_externo.saude(),
+        'api_externa_disjuntor': cliente_externo.disjuntor.estado,
+        'produtos_locais': Produto.query.count(),
+        'categorias_locais': Categoria.query.count(),
+        'ultima_sincronizacao': ultima_sincronizacao(),
+        'cache_catalogo': cache_catalogo.estatisticas(),
+        'cache_admins': cache_admins.estatisticas()
+    })
 
 @app.route('/api/categorias', methods=['GET'])
+@em_cache(cache_catalogo, 'public, max-age=300', etag=etag_catalogo)
 def get_categorias():
     categorias = Categoria.query.all()
     return jsonify([{
@@ -430,46 +2008,338 @@ def get_categorias():
         'descricao': cat.descricao
     } for cat in categorias])
 
+# ==================== BUSCA TEXTUAL ====================
+
+# Índice de busca sobre nome + descrição + nome da categoria. No SQLite usa uma
+# tabela FTS5 (rowid = produto.id); no PostgreSQL uma tabela com tsvector e índice
+# GIN. O texto é normalizado (minúsculas, sem acentos) antes de indexar e de
+# consultar, então "tenis" encontra "Tênis" em qualquer um dos bancos.
+_busca_disponivel = None
+
+def normalizar_texto(texto):
+    """Converte para minúsculas e remove acentos ("Óculos" -> "oculos")"""
+    decomposto = unicodedata.normalize('NFKD', texto or '')
+    return ''.join(c for c in decomposto if not unicodedata.combining(c)).lower()
+
+def _dialeto():
+    return db.engine.dialect.name
+
+def criar_indice_busca():
+    """Cria a estrutura do índice de busca se o banco suportar; retorna se está disponível"""
+    global _busca_disponivel
+    try:
+        if _dialeto() == 'sqlite':
+            db.session.execute(text(
+                "CREATE VIRTUAL TABLE IF NOT EXISTS produto_busca "
+                "USING fts5(nome, descricao, categoria, tokenize='unicode61 remove_diacritics 2')"
+            ))
+        elif _dialeto() == 'postgresql':
+            db.session.execute(text(
+                "CREATE TABLE IF NOT EXISTS produto_busca "
+                "(produto_id INTEGER PRIMARY KEY, documento TSVECTOR NOT NULL)"
+            ))
+            db.session.execute(text(
+                "CREATE INDEX IF NOT EXISTS ix_produto_busca_documento ON produto_busca USING GIN (documento)"
+            ))
+        else:
+            _busca_disponivel = False
+            return False
+        db.session.commit()
+        _busca_disponivel = True
+    except (OperationalError, ProgrammingError) as e:
+        # SQLite compilado sem FTS5, por exemplo: a busca volta para LIKE
+        db.session.rollback()
+        logger.warning('Índice de busca indisponível, usando LIKE: %s', e)
+        _busca_disponivel = False
+    return _busca_disponivel
+
+def busca_disponivel():
+    if _busca_disponivel is None:
+        return criar_indice_busca()
+    return _busca_disponivel
+
+def indice_busca_vazio():
+    return db.session.execute(text("SELECT 1 FROM produto_busca LIMIT 1")).first() is None
+
+def remover_do_indice(ids):
+    """Remove produtos do índice de busca (na transação corrente)"""
+    if not ids or not busca_disponivel():
+        return
+    if _dialeto() == 'sqlite':
+        sql = text("DELETE FROM produto_busca WHERE rowid = :id")
+    else:
+        sql = text("DELETE FROM produto_busca WHERE produto_id = :id")
+    db.session.execute(sql, [{'id': i} for i in ids])
+
+def indexar_produtos(ids=None):
+    """(Re)indexa os produtos informados, ou todo o catálogo quando ids é None (na transação corrente)"""
+    if not busca_disponivel():
+        return
+    query = db.session.query(
+        Produto.id, Produto.nome, Produto.descricao, Categoria.nome
+    ).outerjoin(Categoria, Produto.categoria_id == Categoria.id)
+    
+    if ids is None:
+        db.session.execute(text("DELETE FROM produto_busca"))
+    else:
+        ids = list(ids)
+        if not ids:
+            return
+        remover_do_indice(ids)
+        query = query.filter(Produto.id.in_(ids))
+    
+    documentos = [{
+        'id': produto_id,
+        'nome': normalizar_texto(nome),
+        'descricao': normalizar_texto(descricao),
+        'categoria': normalizar_texto(categoria_nome)
+    } for produto_id, nome, descricao, categoria_nome in query]
+    if not documentos:
+        return
+    
+    if _dialeto() == 'sqlite':
+        sql = text(
+            "INSERT INTO produto_busca (rowid, nome, descricao, categoria) "
+            "VALUES (:id, :nome, :descricao, :categoria)"
+        )
+    else:
+        sql = text(
+            "INSERT INTO produto_busca (produto_id, documento) VALUES (:id, "
+            "setweight(to_tsvector('simple', :nome), 'A') || "
+            "setweight(to_tsvector('simple', :categoria), 'B') || "
+            "setweight(to_tsvector('simple', :descricao), 'C'))"
+        )
+    db.session.execute(sql, documentos)
+
+def subconsulta_busca(termo):
+    """Subquery (produto_id, relevancia) dos produtos que casam com o termo
+
+    Cada palavra é tratada como prefixo e todas precisam aparecer. Menor
+    relevância = mais relevante (bm25 no SQLite, -ts_rank no PostgreSQL), para
+    ordenar de forma ascendente nos dois bancos. Quem chama faz o join com
+    produto, então os filtros de ativo/categoria e a paginação valem sobre todos
+    os resultados. Retorna None se o índice não estiver disponível (quem chama
+    deve usar o LIKE).
+    """
+    if not busca_disponivel():
+        return None
+    palavras = re.findall(r'\w+', normalizar_texto(termo))
+    
+    if not palavras:
+        sql = text("SELECT 0 AS produto_id, 0.0 AS relevancia WHERE 1 = 0")
+    elif _dialeto() == 'sqlite':
+        sql = text(
+            "SELECT rowid AS produto_id, bm25(produto_busca, 10.0, 1.0, 5.0) AS relevancia "
+            "FROM produto_busca WHERE produto_busca MATCH :consulta"
+        ).bindparams(consulta=' '.join(f'"{p}"*' for p in palavras))
+    else:
+        # float8 para que o valor no cursor volte idêntico na comparação do keyset
+        sql = text(
+            "SELECT produto_id, -ts_rank(documento, q)::float8 AS relevancia "
+            "FROM produto_busca, to_tsquery('simple', :consulta) q WHERE documento @@ q"
+        ).bindparams(consulta=' & '.join(f'{p}:*' for p in palavras))
+    return sql.columns(produto_id=db.Integer, relevancia=db.Float).subquery('busca')
+
+# ==================== PAGINAÇÃO DO CATÁLOGO ====================
+
+LIMITE_PADRAO_PRODUTOS = 20
+LIMITE_MAXIMO_PRODUTOS = 100
+
+# Colunas aceitas em ?sort= (prefixo '-' indica ordem decrescente)
+ORDENACOES_PRODUTO = {
+    'id': Produto.id,
+    'preco': Produto.preco,
+    'data_criacao': Produto.data_criacao,
+}
+
+CAMPOS_PRODUTO = list(SERIALIZADOR_PRODUTO.chaves)
+# Coluna SQL de cada campo, para a listagem ler tuplas em vez de objetos
+COLUNAS_PRODUTO = {campo: getattr(Produto, campo) for campo in CAMPOS_PRODUTO if campo != 'categoria_nome'}
+COLUNAS_PRODUTO['categoria_nome'] = Categoria.nome
+
+def _valor_cursor(valor):
+    """Converte o valor da coluna de ordenação para algo serializável em JSON"""
+    if isinstance(valor, datetime):
+        return valor.isoformat()
+    return valor
+
+def codificar_cursor(sort, produto):
+    """Gera cursor opaco a partir do último produto da página"""
+    coluna = sort.lstrip('-')
+    dados = {'s': sort, 'v': _valor_cursor(getattr(produto, coluna)), 'id': produto.id}
+    bruto = json.dumps(dados, separators=(',', ':')).encode()
+    return base64.urlsafe_b64encode(bruto).decode().rstrip('=')
+
+# Tipo que o valor de cada ordenação tem no JSON do cursor (None é aceito: coluna nula)
+TIPOS_CURSOR = {
+    'id': int,
+    'preco': (int, float),
+    'relevancia': (int, float),
+    'data_criacao': str,
+    'nome': str,
+}
+MAIOR_INTEIRO_SQL = 2 ** 63 - 1
+
+def _valor_do_tipo(valor, tipos):
+    """isinstance sem aceitar bool como número e com inteiros no limite do SQL"""
+    if isinstance(valor, bool) or not isinstance(valor, tipos):
+        return False
+    return not isinstance(valor, int) or abs(valor) <= MAIOR_INTEIRO_SQL
+
+def decodificar_cursor(cursor, sort):
+    """Decodifica o cursor e valida que pertence à mesma ordenação
+
+    O cursor vem do cliente: um valor fora do tipo da coluna é rejeitado com
+    ValueError (400) em vez de chegar ao SQL.
+    """
+    try:
+        bruto = base64.urlsafe_b64decode(cursor + '=' * (-len(cursor) % 4))
+        dados = json.loads(bruto)
+        valor, ultimo_id = dados['v'], dados['id']
+    except (ValueError, KeyError, TypeError):
+        raise ValueError('Cursor inválido')
+    if dados.get('s') != sort:
+        raise ValueError('Cursor não corresponde à ordenação solicitada')
+    if not _valor_do_tipo(ultimo_id, int):
+        raise ValueError('Cursor inválido')
+    if valor is None:
+        return valor, ultimo_id
+    if not _valor_do_tipo(valor, TIPOS_CURSOR.get(sort.lstrip('-'), ())):
+        raise ValueError('Cursor inválido')
+    if sort.lstrip('-') == 'data_criacao':
+        try:
+            valor = datetime.fromisoformat(valor)
+        except ValueError:
+            raise ValueError('Cursor inválido')
+    return valor, ultimo_id
+
+def aplicar_keyset(query, sort, cursor, ordenacoes=ORDENACOES_PRODUTO):
+    """Aplica ordenação e filtro de keyset (coluna, id) à query de produtos"""
+    descendente = sort.startswith('-')
+    coluna = ordenacoes[sort.lstrip('-')]
+    
+    if cursor:
+        valor, ultimo_id = decodificar_cursor(cursor, sort)
+        if coluna is Produto.id:
+            query = query.filter(Produto.id < ultimo_id if descendente else Produto.id > ultimo_id)
+        elif descendente:
+            query = query.filter(db.or_(coluna < valor, db.and_(coluna == valor, Produto.id < ultimo_id)))
+        else:
+            query = query.filter(db.or_(coluna > valor, db.and_(coluna == valor, Produto.id > ultimo_id)))
+    
+    if coluna is Produto.id:
+        return query.order_by(Produto.id.desc() if descendente else Produto.id.asc())
+    if descendente:
+        return query.order_by(coluna.desc(), Produto.id.desc())
+    return query.order_by(coluna.asc(), Produto.id.asc())
+
+def parse_campos(valor):
+    """Lê ?campos=a,b,c validando contra CAMPOS_PRODUTO (id é sempre incluído)
+
+    Retorna os campos sem repetição e na ordem de CAMPOS_PRODUTO.
+    """
+    if not valor:
+        return None
+    campos = {c.strip() for c in valor.split(',') if c.strip()}
+    invalidos = sorted(campos.difference(CAMPOS_PRODUTO))
+    if invalidos:
+        raise ValueError(f'Campos inválidos: {", ".join(invalidos)}')
+    return [c for c in CAMPOS_PRODUTO if c in campos or c == 'id']
+
+def colunas_projecao(query, campos, sort=None, ordenacoes=ORDENACOES_PRODUTO):
+    """Restringe a query às colunas da projeção, na ordem de `campos`
+
+    A coluna de ordenação, se não foi pedida, vem por último (só para o cursor);
+    o serializador a ignora porque faz zip com as chaves da projeção.
+    """
+    colunas = [COLUNAS_PRODUTO[campo].label(campo) for campo in campos]
+    if sort and sort.lstrip('-') not in campos:
+        colunas.append(ordenacoes[sort.lstrip('-')].label(sort.lstrip('-')))
+    if 'categoria_nome' in campos:
+        query = query.outerjoin(Categoria, Produto.categoria_id == Categoria.id)
+    return query.with_entities(*colunas)
+
 @app.route('/api/produtos', methods=['GET'])
+@em_cache(cache_catalogo, 'public, max-age=30', etag=etag_catalogo)
 def get_produtos():
+    """Lista produtos ativos; com limit/cursor/sort responde paginado por keyset"""
     categoria_id = request.args.get('categoria_id')
     busca = request.args.get('busca')
+    paginado = any(p in request.args for p in ('limit', 'cursor', 'sort'))
+    
+    try:
+        campos = parse_campos(request.args.get('campos'))
+    except ValueError as e:
+        return jsonify({'erro': str(e)}), 400
     
     query = Produto.query.filter_by(ativo=True)
     
     if categoria_id:
         query = query.filter_by(categoria_id=categoria_id)
     
+    ordenacoes = ORDENACOES_PRODUTO
     if busca:
-        query = query.filter(Produto.nome.contains(busca))
+        resultados = subconsulta_busca(busca)
+        if resultados is None:
+            query = query.filter(db.or_(Produto.nome.ilike(f'%{busca}%'), Produto.descricao.ilike(f'%{busca}%')))
+        else:
+            # Na busca textual, a relevância é a ordenação padrão (e só existe nela)
+            query = query.join(resultados, resultados.c.produto_id == Produto.id)
+            ordenacoes = dict(ORDENACOES_PRODUTO, relevancia=resultados.c.relevancia)
     
-    produtos = query.all()
-    return jsonify([{
-        'id': prod.id,
-        'nome': prod.nome,
-        'descricao': prod.descricao,
-        'preco': prod.preco,
-        'estoque': prod.estoque,
-        'imagem_url': prod.imagem_url,
-        'categoria_id': prod.categoria_id,
-        'categoria_nome': prod.categoria.nome if prod.categoria else None
-    } for prod in produtos])
+    serializador = SERIALIZADOR_PRODUTO.projecao(campos)
+    
+    if not paginado:
+        if 'relevancia' in ordenacoes:
+            query = query.order_by(ordenacoes['relevancia'], Produto.id)
+        produtos = colunas_projecao(query, serializador.chaves).all()
+        if 'estoque' in serializador.chaves:
+            g.estoques = {p.id: p.estoque for p in produtos}
+        return resposta_json(serializador.linhas(produtos))
+    
+    sort = request.args.get('sort', 'relevancia' if 'relevancia' in ordenacoes else 'id')
+    if sort.lstrip('-') not in ordenacoes:
+        return jsonify({'erro': f'Ordenação inválida. Use: {", ".join(ordenacoes)}'}), 400
+    
+    try:
+        limite = int(request.args.get('limit', LIMITE_PADRAO_PRODUTOS))
+    except ValueError:
+        return jsonify({'erro': 'limit deve ser um número inteiro'}), 400
+    limite = max(1, min(limite, LIMITE_MAXIMO_PRODUTOS))
+    
+    try:
+        query = aplicar_keyset(query, sort, request.args.get('cursor'), ordenacoes)
+    except ValueError as e:
+        return jsonify({'erro': str(e)}), 400
+    
+    # Busca um registro a mais para saber se existe próxima página
+    produtos = colunas_projecao(query, serializador.chaves, sort, ordenacoes).limit(limite + 1).all()
+    tem_mais = len(produtos) > limite
+    produtos = produtos[:limite]
+    if 'estoque' in serializador.chaves:
+        g.estoques = {p.id: p.estoque for p in produtos}
+    
+    return resposta_json({
+        'produtos': serializador.linhas(produtos),
+        'proximo_cursor': codificar_cursor(sort, produtos[-1]) if tem_mais else None,
+        'limit': limite,
+        'sort': sort
+    })
 
 @app.route('/api/produtos/<int:produto_id>', methods=['GET'])
+@em_cache(cache_catalogo, 'public, max-age=60')
 def get_produto(produto_id):
-    produto = Produto.query.get_or_404(produto_id)
-    return jsonify({
-        'id': produto.id,
-        'nome': produto.nome,
-        'descricao': produto.descricao,
-        'preco': produto.preco,
-        'estoque': produto.estoque,
-        'imagem_url': produto.imagem_url,
-        'categoria_id': produto.categoria_id,
-        'categoria_nome': produto.categoria.nome if produto.categoria else None
-    })
+    produto = Produto.query.options(*CARREGAR_PRODUTO).get_or_404(produto_id)
+    # ETag por linha: muda a cada atualização do produto
+    versao = produto.data_atualizacao or produto.data_criacao
+    resposta = resposta_json(SERIALIZADOR_PRODUTO(produto))
+    g.estoques = {produto.id: produto.estoque}
+    resposta.set_etag(f'p{produto.id}-{int(versao.timestamp() * 1000) if versao else 0}')
+    resposta.last_modified = versao
+    return resposta
 
 @app.route('/api/usuarios', methods=['POST'])
+@escrita_serializada
 def criar_usuario():
     data = request.get_json()
     usuario = Usuario(
@@ -497,19 +2367,8 @@ def get_usuario(usuario_id):
 
 @app.route('/api/pedidos/usuario/<int:usuario_id>', methods=['GET'])
 def get_pedidos_usuario(usuario_id):
-    pedidos = Pedido.query.filter_by(usuario_id=usuario_id).all()
-    return jsonify([{
-        'id': pedido.id,
-        'total': pedido.total,
-        'status': pedido.status,
-        'data_pedido': pedido.data_pedido.isoformat(),
-        'itens': [{
-            'produto_id': item.produto_id,
-            'produto_nome': item.produto.nome,
-            'quantidade': item.quantidade,
-            'preco_unitario': item.preco_unitario
-        } for item in pedido.itens]
-    } for pedido in pedidos])
+    pedidos = Pedido.query.options(*CARREGAR_PEDIDO).filter_by(usuario_id=usuario_id).all()
+    return resposta_json(SERIALIZADOR_PEDIDO_RESUMO.muitos(pedidos))
 
 @app.route('/api/admin/login', methods=['POST'])
 def admin_login():
@@ -522,11 +2381,19 @@ def admin_login():
     
     admin = Administrador.query.filter_by(username=username, ativo=True).first()
     
-    if not admin or not verificar_senha(senha, admin.senha_hash):
+    if not admin:
         return jsonify({'erro': 'Credenciais inválidas'}), 401
     
-    admin.ultimo_login = datetime.utcnow()
-    db.session.commit()
+    correta, novo_hash = conferir_senha(senha, admin.senha_hash)
+    if not correta:
+        return jsonify({'erro': 'Credenciais inválidas'}), 401
+    
+    # A senha é conferida fora da fila de escrita; só a gravação entra nela
+    with escrita_sqlite():
+        if novo_hash:
+            admin.senha_hash = novo_hash
+        admin.ultimo_login = datetime.utcnow()
+        db.session.commit()
     
     token = gerar_token(admin.id)
     
@@ -543,21 +2410,14 @@ def admin_login():
 @app.route('/api/admin/verify', methods=['GET'])
 @admin_required
 def admin_verify():
-    token = request.headers.get('Authorization')[7:]  # Remove 'Bearer '
-    admin_id = verificar_token(token)
-    admin = Administrador.query.get(admin_id)
-    
     return jsonify({
-        'admin': {
-            'id': admin.id,
-            'username': admin.username,
-            'email': admin.email
-        },
+        'admin': g.admin,
         'valido': True
     })
 
 @app.route('/api/admin/produtos', methods=['POST'])
 @admin_required
+@escrita_serializada
 def criar_produto():
     data = request.get_json()
     
@@ -579,25 +2439,20 @@ def criar_produto():
     )
     
     db.session.add(produto)
+    db.session.flush()
+    indexar_produtos([produto.id])
     db.session.commit()
+    invalidar_catalogo(produto_id=produto.id)
     
     return jsonify({
         'id': produto.id,
         'mensagem': 'Produto criado com sucesso',
-        'produto': {
-            'id': produto.id,
-            'nome': produto.nome,
-            'descricao': produto.descricao,
-            'preco': produto.preco,
-            'estoque': produto.estoque,
-            'imagem_url': produto.imagem_url,
-            'categoria_id': produto.categoria_id,
-            'ativo': produto.ativo
-        }
+        'produto': SERIALIZADOR_PRODUTO_ADMIN(produto)
     })
 
 @app.route('/api/admin/produtos/<int:produto_id>', methods=['PUT'])
 @admin_required
+@escrita_serializada
 def atualizar_produto(produto_id):
     produto = Produto.query.get_or_404(produto_id)
     data = request.get_json()
@@ -620,24 +2475,19 @@ def atualizar_produto(produto_id):
     if 'ativo' in data:
         produto.ativo = data['ativo']
     
+    db.session.flush()
+    indexar_produtos([produto.id])
     db.session.commit()
+    invalidar_catalogo(produto_id=produto.id)
     
     return jsonify({
         'mensagem': 'Produto atualizado com sucesso',
-        'produto': {
-            'id': produto.id,
-            'nome': produto.nome,
-            'descricao': produto.descricao,
-            'preco': produto.preco,
-            'estoque': produto.estoque,
-            'imagem_url': produto.imagem_url,
-            'categoria_id': produto.categoria_id,
-            'ativo': produto.ativo
-        }
+        'produto': SERIALIZADOR_PRODUTO_ADMIN(produto)
     })
 
 @app.route('/api/admin/produtos/<int:produto_id>', methods=['DELETE'])
 @admin_required
+@escrita_serializada
 def deletar_produto(produto_id):
     produto = Produto.query.get_or_404(produto_id)
     
@@ -646,12 +2496,15 @@ def deletar_produto(produto_id):
         return jsonify({'erro': 'Não é possível deletar produto que possui pedidos associados'}), 400
     
     db.session.delete(produto)
+    remover_do_indice([produto_id])
     db.session.commit()
+    invalidar_catalogo(produto_id=produto_id)
     
     return jsonify({'mensagem': 'Produto deletado com sucesso'})
 
 @app.route('/api/admin/categorias', methods=['POST'])
 @admin_required
+@escrita_serializada
 def criar_categoria():
     data = request.get_json()
     
@@ -665,6 +2518,7 @@ def criar_categoria():
     
     db.session.add(categoria)
     db.session.commit()
+    invalidar_catalogo(categorias=True)
     
     return jsonify({
         'id': categoria.id,
@@ -692,7 +2546,7 @@ def cadastrar_usuario():
         return jsonify({'erro': 'Email já cadastrado'}), 400
     
     try:
-        senha_hash = hashlib.sha256(data['senha'].encode()).hexdigest()
+        senha_hash = gerar_hash_senha(data['senha'])
         
         usuario = Usuario(
             nome=data['nome'],
@@ -705,8 +2559,10 @@ def cadastrar_usuario():
             avatar_url=data.get('avatar_url', '')
         )
         
-        db.session.add(usuario)
-        db.session.commit()
+        # O hash da senha fica fora da fila de escrita
+        with escrita_sqlite():
+            db.session.add(usuario)
+            db.session.commit()
         
         return jsonify({
             'id': usuario.id,
@@ -742,10 +2598,15 @@ def login_usuario():
         if not usuario.ativo:
             return jsonify({'erro': 'Usuário inativo'}), 403
         
-        senha_hash = hashlib.sha256(data['senha'].encode()).hexdigest()
-        if usuario.senha_hash != senha_hash:
+        correta, novo_hash = conferir_senha(data['senha'], usuario.senha_hash)
+        if not correta:
             return jsonify({'erro': 'Senha incorreta'}), 401
         
+        if novo_hash:
+            with escrita_sqlite():
+                usuario.senha_hash = novo_hash
+                db.session.commit()
+        
         token = create_access_token(
             identity=str(usuario.id),
             additional_claims={
@@ -805,6 +2666,7 @@ def obter_perfil():
 
 @app.route('/api/usuarios/perfil', methods=['PUT'])
 @jwt_required()
+@escrita_serializada
 def atualizar_perfil():
     """Atualizar perfil do usuário"""
     try:
@@ -860,57 +2722,23 @@ def obter_historico_compras():
     try:
         # Obter o identity do JWT
         current_user_id = get_jwt_identity()
-        print(f"DEBUG: User ID recebido: {current_user_id}, tipo: {type(current_user_id)}")
         
         # Converter para int se for string
         if isinstance(current_user_id, str):
             current_user_id = int(current_user_id) if current_user_id.isdigit() else None
         
         if not current_user_id:
-            print("DEBUG: Token inválido - current_user_id é None")
+            logger.debug('Histórico com identidade inválida no token')
             return jsonify({'erro': 'Token inválido'}), 401
         
-        print(f"DEBUG: Buscando pedidos para usuário ID: {current_user_id}")
-        pedidos = Pedido.query.filter_by(usuario_id=current_user_id).order_by(Pedido.data_pedido.desc()).all()
-        print(f"DEBUG: Encontrados {len(pedidos)} pedidos")
-        
-        historico = []
-        for pedido in pedidos:
-            itens_data = []
-            for item in pedido.itens:
-                try:
-                    produto_nome = item.produto.nome if item.produto else 'Produto removido'
-                    produto_imagem = item.produto.imagem_url if item.produto else ''
-                except Exception as e:
-                    print(f"DEBUG: Erro ao obter produto do item {item.id}: {e}")
-                    produto_nome = 'Produto removido'
-                    produto_imagem = ''
-                
-                itens_data.append({
-                    'id': item.id,
-                    'produto_id': item.produto_id,
-                    'produto_nome': produto_nome,
-                    'produto_imagem': produto_imagem,
-                    'quantidade': item.quantidade,
-                    'preco_unitario': item.preco_unitario
-                })
-            
-            historico.append({
-                'id': pedido.id,
-                'total': pedido.total,
-                'status': pedido.status,
-                'data_pedido': pedido.data_pedido.isoformat(),
-                'data_atualizacao': pedido.data_atualizacao.isoformat(),
-                'itens': itens_data
-            })
+        pedidos = Pedido.query.options(*CARREGAR_PEDIDO).filter_by(usuario_id=current_user_id).order_by(Pedido.data_pedido.desc()).all()
         
-        print(f"DEBUG: Retornando histórico com {len(historico)} pedidos")
-        return jsonify(historico)
+        historico = SERIALIZADOR_PEDIDO_HISTORICO.muitos(pedidos)
+        logger.debug('Histórico do usuário', extra={'campos': {'usuario_id': current_user_id, 'pedidos': len(historico)}})
+        return resposta_json(historico)
         
     except Exception as e:
-        print(f"DEBUG: Erro ao obter histórico: {str(e)}")
-        import traceback
-        traceback.print_exc()
+        logger.exception('Erro ao obter histórico')
         return jsonify({'erro': f'Erro ao obter histórico: {str(e)}'}), 500
 
 # ==================== ROTAS DE FAVORITOS ====================
@@ -928,28 +2756,17 @@ def obter_favoritos():
         if not current_user_id:
             return jsonify({'erro': 'Token inválido'}), 401
         
-        favoritos = Favorito.query.filter_by(usuario_id=current_user_id).order_by(Favorito.data_favorito.desc()).all()
+        favoritos = Favorito.query.options(*CARREGAR_FAVORITO).filter_by(usuario_id=current_user_id).order_by(Favorito.data_favorito.desc()).all()
         
-        favoritos_data = []
-        for favorito in favoritos:
-            if favorito.produto:  
-                favoritos_data.append({
-                    'id': favorito.id,
-                    'produto_id': favorito.produto_id,
-                    'produto_nome': favorito.produto.nome,
-                    'produto_preco': favorito.produto.preco,
-                    'produto_imagem': favorito.produto.imagem_url,
-                    'produto_estoque': favorito.produto.estoque,
-                    'data_favorito': favorito.data_favorito.isoformat()
-                })
-        
-        return jsonify(favoritos_data)
+        # Favoritos de produtos já removidos ficam de fora
+        return resposta_json(SERIALIZADOR_FAVORITO.muitos(f for f in favoritos if f.produto))
         
     except Exception as e:
         return jsonify({'erro': f'Erro ao obter favoritos: {str(e)}'}), 500
 
 @app.route('/api/favoritos', methods=['POST'])
 @jwt_required()
+@escrita_serializada
 def adicionar_favorito():
     """Adicionar produto aos favoritos"""
     try:
@@ -1000,6 +2817,7 @@ def adicionar_favorito():
 
 @app.route('/api/favoritos/<int:produto_id>', methods=['DELETE'])
 @jwt_required()
+@escrita_serializada
 def remover_favorito(produto_id):
     """Remover produto dos favoritos"""
     try:
@@ -1047,63 +2865,251 @@ def verificar_favorito(produto_id):
     except Exception as e:
         return jsonify({'erro': f'Erro ao verificar favorito: {str(e)}'}), 500
 
+# ==================== ESTOQUE ====================
+
+class ErroPedido(Exception):
+    """Pedido rejeitado: dados inválidos, produto indisponível ou estoque insuficiente"""
+    
+    def __init__(self, mensagem, status=400, **detalhes):
+        super().__init__(mensagem)
+        self.mensagem = mensagem
+        self.status = status
+        self.detalhes = detalhes
+    
+    def resposta(self):
+        return jsonify({'erro': self.mensagem, **self.detalhes}), self.status
+
+def agregar_itens(itens):
+    """Valida os itens do pedido e soma as quantidades por produto"""
+    if not isinstance(itens, list) or not itens:
+        raise ErroPedido('O pedido precisa de ao menos um item')
+    quantidades = {}
+    for item in itens:
+        try:
+            produto_id = int(item['produto_id'])
+            quantidade = int(item['quantidade'])
+        except (KeyError, TypeError, ValueError):
+            raise ErroPedido('Cada item precisa de produto_id e quantidade inteiros')
+        if quantidade <= 0:
+            raise ErroPedido('Quantidade deve ser maior que zero', produto_id=produto_id)
+        quantidades[produto_id] = quantidades.get(produto_id, 0) + quantidade
+    return quantidades
+
+def carregar_precos(produto_ids):
+    """Preço e nome dos produtos ativos, em uma única query"""
+    return {
+        produto_id: (preco, nome) for produto_id, preco, nome in db.session.query(
+            Produto.id, Produto.preco, Produto.nome
+        ).filter(Produto.id.in_(produto_ids), Produto.ativo.is_(True))
+    }
+
+def reservar_estoque(quantidades, precos):
+    """Baixa o estoque de todos os itens ou de nenhum (na transação corrente)
+
+    Cada linha é decrementada por um UPDATE condicional (estoque >= quantidade),
+    atômico por si só no SQLite e no PostgreSQL, então dois pedidos simultâneos
+    nunca vendem a mesma unidade. Os produtos são atualizados em ordem de id
+    para que transações concorrentes travem as linhas na mesma ordem. Na
+    primeira falta, devolve o que já tinha baixado e lança ErroPedido, de modo
+    que vários pedidos podem ser reservados na mesma transação.
+    """
+    for produto_id in quantidades:
+        if produto_id not in precos:
+            raise ErroPedido('Produto não encontrado ou inativo', 404, produto_id=produto_id)
+    
+    tabela = Produto.__table__
+    reservados = []
+    for produto_id in sorted(quantidades):
+        quantidade = quantidades[produto_id]
+        resultado = db.session.execute(tabela.update().where(
+            tabela.c.id == produto_id,
+            tabela.c.estoque >= quantidade
+        ).values(estoque=tabela.c.estoque - quantidade))
+        if resultado.rowcount == 1:
+            reservados.append((produto_id, quantidade))
+        else:
+            for reservado_id, reservado in reservados:
+                db.session.execute(tabela.update().where(tabela.c.id == reservado_id).values(
+                    estoque=tabela.c.estoque + reservado
+                ))
+            raise ErroPedido(
+                f'Estoque insuficiente para {precos[produto_id][1]}', 409,
+                produto_id=produto_id, quantidade=quantidade
+            )
+
+# ==================== IDEMPOTÊNCIA ====================
+
+IDEMPOTENCIA_TTL = int(os.environ.get('IDEMPOTENCIA_TTL', 24 * 60 * 60))
+# Validade da reserva enquanto a requisição executa: se o worker morrer no meio
+# (timeout do gunicorn, OOM, deploy), a chave fica livre depois disso em vez de
+# responder 409 pelo TTL inteiro. Precisa ser maior que o timeout do gunicorn (120s).
+IDEMPOTENCIA_RESERVA = int(os.environ.get('IDEMPOTENCIA_RESERVA', 300))
+IDEMPOTENCIA_INTERVALO_LIMPEZA = 300
+_ultima_limpeza_idempotencia = 0.0
+
+def limpar_chaves_expiradas():
+    """Remove as chaves vencidas; roda no máximo a cada IDEMPOTENCIA_INTERVALO_LIMPEZA segundos por worker"""
+    global _ultima_limpeza_idempotencia
+    agora = time.monotonic()
+    if agora - _ultima_limpeza_idempotencia < IDEMPOTENCIA_INTERVALO_LIMPEZA:
+        return
+    _ultima_limpeza_idempotencia = agora
+    ChaveIdempotencia.query.filter(ChaveIdempotencia.expira_em < datetime.utcnow()).delete(synchronize_session=False)
+    db.session.commit()
+
+def idempotente(f):
+    """Decorator para POSTs: com o header Idempotency-Key, repete a resposta gravada em vez de reexecutar
+
+    A chave é reservada com um INSERT antes de executar a view; como é chave
+    primária, só um worker consegue reservá-la. A reserva vale por
+    IDEMPOTENCIA_RESERVA segundos e passa a valer IDEMPOTENCIA_TTL quando a
+    resposta é gravada; uma reserva vencida (worker que morreu) é tratada como
+    livre. Respostas 5xx não são guardadas, para que o cliente possa tentar de novo.
+    """
+    @wraps(f)
+    def decorated_function(*args, **kwargs):
+        chave_cliente = request.headers.get('Idempotency-Key')
+        if not chave_cliente:
+            return f(*args, **kwargs)
+        if len(chave_cliente) > 200:
+            return jsonify({'erro': 'Idempotency-Key deve ter no máximo 200 caracteres'}), 400
+        
+        limpar_chaves_expiradas()
+        chave = f'{request.path}:{chave_cliente}'
+        hash_requisicao = hashlib.sha256(request.get_data()).hexdigest()
+        
+        registro = db.session.get(ChaveIdempotencia, chave)
+        if registro is not None and registro.expira_em < datetime.utcnow():
+            # Resposta expirada ou reserva de um worker que morreu. O DELETE
+            # condicional não apaga a reserva nova de outro worker que chegou antes.
+            ChaveIdempotencia.query.filter(
+                ChaveIdempotencia.chave == chave,
+                ChaveIdempotencia.expira_em < datetime.utcnow()
+            ).delete(synchronize_session=False)
+            db.session.commit()
+            db.session.expire_all()
+            registro = None
+        
+        if registro is None:
+            try:
+                db.session.add(ChaveIdempotencia(
+                    chave=chave,
+                    hash_requisicao=hash_requisicao,
+                    expira_em=datetime.utcnow() + timedelta(seconds=IDEMPOTENCIA_RESERVA)
+                ))
+                db.session.commit()
+            except IntegrityError:
+                # Outro worker reservou a mesma chave agora
+                db.session.rollback()
+                registro = db.session.get(ChaveIdempotencia, chave)
+        
+        if registro is not None:
+            if registro.hash_requisicao != hash_requisicao:
+                return jsonify({'erro': 'Idempotency-Key já usada com outro conteúdo'}), 422
+            if registro.status_code is None:
+                return jsonify({'erro': 'Requisição com esta Idempotency-Key ainda em processamento'}), 409
+            resposta = Response(registro.resposta, status=registro.status_code, mimetype='application/json')
+            resposta.headers['Idempotent-Replayed'] = 'true'
+            return resposta
+        
+        try:
+            resposta = app.make_response(f(*args, **kwargs))
+        except Exception:
+            db.session.rollback()
+            ChaveIdempotencia.query.filter_by(chave=chave).delete()
+            db.session.commit()
+            raise
+        
+        if resposta.status_code >= 500:
+            ChaveIdempotencia.query.filter_by(chave=chave).delete()
+        else:
+            ChaveIdempotencia.query.filter_by(chave=chave).update({
+                'status_code': resposta.status_code,
+                'resposta': resposta.get_data(as_text=True),
+                'expira_em': datetime.utcnow() + timedelta(seconds=IDEMPOTENCIA_TTL)
+            })
+        db.session.commit()
+        return resposta
+    return decorated_function
+
 # ==================== ROTAS DE PEDIDOS ====================
 
+CAMPOS_OBRIGATORIOS_PEDIDO = ['itens', 'nome_cliente', 'email_cliente', 'telefone_cliente', 'endereco_entrega', 'cidade_entrega', 'cep_entrega']
+LIMITE_LOTE_PEDIDOS = 500
+
+def validar_pedido(data):
+    """Confere os campos obrigatórios e retorna as quantidades por produto"""
+    if not isinstance(data, dict) or not data:
+        raise ErroPedido('Dados não fornecidos')
+    # O total e os preços enviados pelo cliente são ignorados: tudo é calculado a partir do catálogo
+    for field in CAMPOS_OBRIGATORIOS_PEDIDO:
+        if field not in data or not data[field]:
+            raise ErroPedido(f'Campo obrigatório: {field}')
+    return agregar_itens(data['itens'])
+
+def usuario_do_token():
+    """Id do usuário do token JWT opcional; None se ausente ou inválido"""
+    auth_header = request.headers.get('Authorization')
+    if not auth_header or not auth_header.startswith('Bearer '):
+        return None
+    try:
+        from flask_jwt_extended import decode_token
+        current_user_id = decode_token(auth_header[7:]).get('sub')
+    except Exception:
+        return None  # Token inválido ou expirado, cria pedido sem usuário
+    return int(current_user_id) if current_user_id and str(current_user_id).isdigit() else None
+
+def total_pedido(quantidades, precos):
+    return sum(precos[produto_id][0] * quantidade for produto_id, quantidade in quantidades.items())
+
+def dados_pedido(data, usuario_id, total):
+    """Colunas de Pedido a partir do corpo da requisição"""
+    return {
+        'usuario_id': usuario_id,
+        'total': total,
+        'nome_cliente': data['nome_cliente'],
+        'email_cliente': data['email_cliente'],
+        'telefone_cliente': data['telefone_cliente'],
+        'endereco_entrega': data['endereco_entrega'],
+        'cidade_entrega': data['cidade_entrega'],
+        'cep_entrega': data['cep_entrega'],
+        'observacoes': data.get('observacoes', ''),
+        'status': 'pendente'
+    }
+
 @app.route('/api/pedidos', methods=['POST'])
+@escrita_serializada
+@idempotente
 def criar_pedido():
     """Criar um novo pedido"""
     data = request.get_json()
     
-    if not data:
-        return jsonify({'erro': 'Dados não fornecidos'}), 400
-    
-    required_fields = ['itens', 'total', 'nome_cliente', 'email_cliente', 'telefone_cliente', 'endereco_entrega', 'cidade_entrega', 'cep_entrega']
-    for field in required_fields:
-        if field not in data or not data[field]:
-            return jsonify({'erro': f'Campo obrigatório: {field}'}), 400
+    try:
+        quantidades = validar_pedido(data)
+    except ErroPedido as e:
+        return e.resposta()
     
     try:
-        # Verificar se há token no header
-        current_user_id = None
-        auth_header = request.headers.get('Authorization')
-        if auth_header and auth_header.startswith('Bearer '):
-            token = auth_header[7:]
-            try:
-                from flask_jwt_extended import decode_token
-                # Tentar decodificar o token
-                token_data = decode_token(token)
-                current_user_id = token_data.get('sub')
-                if current_user_id:
-                    current_user_id = int(current_user_id) if str(current_user_id).isdigit() else None
-            except:
-                pass  # Token inválido ou expirado, cria pedido sem usuário  
-        
-        pedido = Pedido(
-            usuario_id=current_user_id,  
-            total=float(data['total']),
-            nome_cliente=data['nome_cliente'],
-            email_cliente=data['email_cliente'],
-            telefone_cliente=data['telefone_cliente'],
-            endereco_entrega=data['endereco_entrega'],
-            cidade_entrega=data['cidade_entrega'],
-            cep_entrega=data['cep_entrega'],
-            observacoes=data.get('observacoes', ''),
-            status='pendente'
-        )
+        precos = carregar_precos(list(quantidades))
+        reservar_estoque(quantidades, precos)
+        
+        pedido = Pedido(**dados_pedido(data, usuario_do_token(), total_pedido(quantidades, precos)))
         
         db.session.add(pedido)
         db.session.flush()  
         
-        for item_data in data['itens']:
+        for produto_id, quantidade in quantidades.items():
             item_pedido = ItemPedido(
                 pedido_id=pedido.id,
-                produto_id=item_data['produto_id'],
-                quantidade=item_data['quantidade'],
-                preco_unitario=item_data['preco']
+                produto_id=produto_id,
+                quantidade=quantidade,
+                preco_unitario=precos[produto_id][0]
             )
             db.session.add(item_pedido)
         
+        registrar_estatistica(pedido.data_pedido.date(), pedido.status, 1, pedido.total)
         db.session.commit()
+        invalidar_estoque()
         
         return jsonify({
             'id': pedido.id,
@@ -1116,41 +3122,96 @@ def criar_pedido():
             }
         }), 201
         
+    except ErroPedido as e:
+        db.session.rollback()
+        return e.resposta()
     except Exception as e:
         db.session.rollback()
         return jsonify({'erro': f'Erro ao criar pedido: {str(e)}'}), 500
 
+@app.route('/api/pedidos/batch', methods=['POST'])
+@escrita_serializada
+@idempotente
+def criar_pedidos_lote():
+    """Criar vários pedidos em uma única transação, com resultado por pedido
+
+    Todos os preços vêm de uma única query, o estoque é reservado pedido a
+    pedido (um pedido sem estoque não afeta os demais) e os pedidos aceitos e
+    seus itens são gravados com INSERTs em lote.
+    """
+    data = request.get_json()
+    pedidos_data = data.get('pedidos') if isinstance(data, dict) else None
+    if not isinstance(pedidos_data, list) or not pedidos_data:
+        return jsonify({'erro': 'Campo obrigatório: pedidos (lista)'}), 400
+    if len(pedidos_data) > LIMITE_LOTE_PEDIDOS:
+        return jsonify({'erro': f'Máximo de {LIMITE_LOTE_PEDIDOS} pedidos por lote'}), 400
+    
+    resultados = [None] * len(pedidos_data)
+    validos = []
+    for indice, pedido_data in enumerate(pedidos_data):
+        try:
+            validos.append((indice, pedido_data, validar_pedido(pedido_data)))
+        except ErroPedido as e:
+            resultados[indice] = {'indice': indice, 'sucesso': False, 'erro': e.mensagem, **e.detalhes}
+    
+    try:
+        usuario_id = usuario_do_token()
+        precos = carregar_precos(list({produto_id for _, _, quantidades in validos for produto_id in quantidades}))
+        
+        aceitos = []
+        for indice, pedido_data, quantidades in validos:
+            try:
+                reservar_estoque(quantidades, precos)
+                aceitos.append((indice, pedido_data, quantidades))
+            except ErroPedido as e:
+                resultados[indice] = {'indice': indice, 'sucesso': False, 'erro': e.mensagem, **e.detalhes}
+        
+        if aceitos:
+            agora = datetime.utcnow()
+            linhas = [{
+                **dados_pedido(pedido_data, usuario_id, total_pedido(quantidades, precos)),
+                'data_pedido': agora,
+                'data_atualizacao': agora
+            } for _, pedido_data, quantidades in aceitos]
+            pedido_ids = db.session.scalars(
+                insert(Pedido).returning(Pedido.id, sort_by_parameter_order=True), linhas
+            ).all()
+            
+            db.session.execute(insert(ItemPedido), [{
+                'pedido_id': pedido_id,
+                'produto_id': produto_id,
+                'quantidade': quantidade,
+                'preco_unitario': precos[produto_id][0]
+            } for pedido_id, (_, _, quantidades) in zip(pedido_ids, aceitos) for produto_id, quantidade in quantidades.items()])
+            
+            registrar_estatistica(agora.date(), 'pendente', len(linhas), sum(linha['total'] for linha in linhas))
+            
+            for pedido_id, linha, (indice, _, _) in zip(pedido_ids, linhas, aceitos):
+                resultados[indice] = {'indice': indice, 'sucesso': True, 'id': pedido_id, 'total': linha['total']}
+        
+        db.session.commit()
+        
+    except Exception as e:
+        db.session.rollback()
+        return jsonify({'erro': f'Erro ao criar pedidos: {str(e)}'}), 500
+    
+    if aceitos:
+        invalidar_estoque()
+    
+    criados = sum(1 for r in resultados if r['sucesso'])
+    return jsonify({
+        'criados': criados,
+        'falhas': len(resultados) - criados,
+        'resultados': resultados
+    }), 201 if criados else 400
+
 @app.route('/api/pedidos', methods=['GET'])
 def listar_pedidos():
     """Listar todos os pedidos (para admin)"""
     try:
-        pedidos = Pedido.query.order_by(Pedido.data_pedido.desc()).all()
-        
-        pedidos_data = []
-        for pedido in pedidos:
-            pedidos_data.append({
-                'id': pedido.id,
-                'total': pedido.total,
-                'status': pedido.status,
-                'data_pedido': pedido.data_pedido.isoformat(),
-                'data_atualizacao': pedido.data_atualizacao.isoformat(),
-                'nome_cliente': pedido.nome_cliente,
-                'email_cliente': pedido.email_cliente,
-                'telefone_cliente': pedido.telefone_cliente,
-                'endereco_entrega': pedido.endereco_entrega,
-                'cidade_entrega': pedido.cidade_entrega,
-                'cep_entrega': pedido.cep_entrega,
-                'observacoes': pedido.observacoes,
-                'itens': [{
-                    'id': item.id,
-                    'produto_id': item.produto_id,
-                    'quantidade': item.quantidade,
-                    'preco_unitario': item.preco_unitario,
-                    'produto_nome': item.produto.nome if item.produto else 'Produto removido'
-                } for item in pedido.itens]
-            })
+        pedidos = Pedido.query.options(*CARREGAR_PEDIDO).order_by(Pedido.data_pedido.desc()).all()
         
-        return jsonify(pedidos_data)
+        return resposta_json(SERIALIZADOR_PEDIDO_LISTA.muitos(pedidos))
         
     except Exception as e:
         return jsonify({'erro': f'Erro ao listar pedidos: {str(e)}'}), 500
@@ -1159,36 +3220,15 @@ def listar_pedidos():
 def obter_pedido(pedido_id):
     """Obter detalhes de um pedido específico"""
     try:
-        pedido = Pedido.query.get_or_404(pedido_id)
-        
-        return jsonify({
-            'id': pedido.id,
-            'total': pedido.total,
-            'status': pedido.status,
-            'data_pedido': pedido.data_pedido.isoformat(),
-            'data_atualizacao': pedido.data_atualizacao.isoformat(),
-            'nome_cliente': pedido.nome_cliente,
-            'email_cliente': pedido.email_cliente,
-            'telefone_cliente': pedido.telefone_cliente,
-            'endereco_entrega': pedido.endereco_entrega,
-            'cidade_entrega': pedido.cidade_entrega,
-            'cep_entrega': pedido.cep_entrega,
-            'observacoes': pedido.observacoes,
-            'itens': [{
-                'id': item.id,
-                'produto_id': item.produto_id,
-                'quantidade': item.quantidade,
-                'preco_unitario': item.preco_unitario,
-                'produto_nome': item.produto.nome if item.produto else 'Produto removido',
-                'produto_imagem': item.produto.imagem_url if item.produto else ''
-            } for item in pedido.itens]
-        })
+        pedido = Pedido.query.options(*CARREGAR_PEDIDO).get_or_404(pedido_id)
+        return resposta_json(SERIALIZADOR_PEDIDO(pedido))
         
     except Exception as e:
         return jsonify({'erro': f'Erro ao obter pedido: {str(e)}'}), 500
 
 @app.route('/api/admin/pedidos/<int:pedido_id>/status', methods=['PUT'])
 @admin_required
+@escrita_serializada
 def atualizar_status_pedido(pedido_id):
     """Atualizar status de um pedido (apenas admin)"""
     data = request.get_json()
@@ -1196,12 +3236,15 @@ def atualizar_status_pedido(pedido_id):
     if 'status' not in data:
         return jsonify({'erro': 'Status é obrigatório'}), 400
     
-    status_validos = ['pendente', 'processando', 'enviado', 'entregue', 'cancelado']
-    if data['status'] not in status_validos:
-        return jsonify({'erro': f'Status inválido. Use: {", ".join(status_validos)}'}), 400
+    if data['status'] not in STATUS_PEDIDO:
+        return jsonify({'erro': f'Status inválido. Use: {", ".join(STATUS_PEDIDO)}'}), 400
     
     try:
         pedido = Pedido.query.get_or_404(pedido_id)
+        if pedido.status != data['status']:
+            dia = pedido.data_pedido.date()
+            registrar_estatistica(dia, pedido.status, -1, -pedido.total)
+            registrar_estatistica(dia, data['status'], 1, pedido.total)
         pedido.status = data['status']
         pedido.data_atualizacao = datetime.utcnow()
         
@@ -1218,40 +3261,72 @@ def atualizar_status_pedido(pedido_id):
         db.session.rollback()
         return jsonify({'erro': f'Erro ao atualizar status: {str(e)}'}), 500
 
+POR_PAGINA_PADRAO_USUARIOS = 50
+POR_PAGINA_MAXIMO_USUARIOS = 200
+
+def consulta_usuarios_admin():
+    """Colunas de SERIALIZADOR_USUARIO_ADMIN; a contagem de pedidos é agregada
+    em uma única query, em vez de um COUNT por usuário"""
+    contagem_pedidos = db.session.query(
+        Pedido.usuario_id.label('usuario_id'),
+        db.func.count(Pedido.id).label('total_pedidos')
+    ).group_by(Pedido.usuario_id).subquery()
+    colunas = [getattr(Usuario, campo) for campo in SERIALIZADOR_USUARIO_ADMIN.chaves if campo != 'total_pedidos']
+    return db.session.query(
+        *colunas, db.func.coalesce(contagem_pedidos.c.total_pedidos, 0).label('total_pedidos')
+    ).outerjoin(contagem_pedidos, contagem_pedidos.c.usuario_id == Usuario.id)
+
 @app.route('/api/admin/usuarios', methods=['GET'])
 @admin_required
 def listar_usuarios():
-    """Listar todos os usuários (apenas admin)"""
+    """Listar usuários com total de pedidos (apenas admin); ?pagina= ativa a paginação"""
+    ordenar = request.args.get('ordenar', 'data_criacao')
+    ordem = request.args.get('ordem', 'desc')
+    
+    colunas_ordenacao = {
+        'total_pedidos': db.literal_column('total_pedidos'),
+        'data_criacao': Usuario.data_criacao,
+        'nome': Usuario.nome
+    }
+    if ordenar not in colunas_ordenacao or ordem not in ('asc', 'desc'):
+        return jsonify({'erro': f'Ordenação inválida. Use ordenar={"|".join(colunas_ordenacao)} e ordem=asc|desc'}), 400
+    
+    coluna = colunas_ordenacao[ordenar]
+    criterio = coluna.desc() if ordem == 'desc' else coluna.asc()
+    desempate = Usuario.id.desc() if ordem == 'desc' else Usuario.id.asc()
+    
     try:
-        usuarios = Usuario.query.order_by(Usuario.data_criacao.desc()).all()
+        query = consulta_usuarios_admin().order_by(criterio, desempate)
         
-        usuarios_data = []
-        for usuario in usuarios:
-            # Contar pedidos do usuário
-            total_pedidos = Pedido.query.filter_by(usuario_id=usuario.id).count()
-            
-            usuarios_data.append({
-                'id': usuario.id,
-                'nome': usuario.nome,
-                'email': usuario.email,
-                'telefone': usuario.telefone,
-                'endereco': usuario.endereco,
-                'is_admin': usuario.is_admin,
-                'data_criacao': usuario.data_criacao.isoformat() if usuario.data_criacao else None,
-                'data_nascimento': usuario.data_nascimento.isoformat() if usuario.data_nascimento else None,
-                'genero': usuario.genero,
-                'avatar_url': usuario.avatar_url,
-                'ativo': usuario.ativo,
-                'total_pedidos': total_pedidos
-            })
+        paginacao = None
+        if 'pagina' in request.args:
+            try:
+                pagina = max(1, int(request.args.get('pagina', 1)))
+                por_pagina = int(request.args.get('por_pagina', POR_PAGINA_PADRAO_USUARIOS))
+            except ValueError:
+                return jsonify({'erro': 'pagina e por_pagina devem ser números inteiros'}), 400
+            por_pagina = max(1, min(por_pagina, POR_PAGINA_MAXIMO_USUARIOS))
+            total = Usuario.query.count()
+            query = query.offset((pagina - 1) * por_pagina).limit(por_pagina)
+            paginacao = {
+                'pagina': pagina,
+                'por_pagina': por_pagina,
+                'total': total,
+                'total_paginas': (total + por_pagina - 1) // por_pagina
+            }
         
-        return jsonify(usuarios_data)
+        usuarios_data = SERIALIZADOR_USUARIO_ADMIN.muitos(query.all())
+        
+        if paginacao is None:
+            return jsonify(usuarios_data)
+        return jsonify({'usuarios': usuarios_data, **paginacao})
         
     except Exception as e:
         return jsonify({'erro': f'Erro ao listar usuários: {str(e)}'}), 500
 
 @app.route('/api/admin/usuarios/<int:usuario_id>/ativo', methods=['PUT'])
 @admin_required
+@escrita_serializada
 def atualizar_status_usuario(usuario_id):
     """Atualizar status ativo/inativo de um usuário (apenas admin)"""
     data = request.get_json()
@@ -1275,34 +3350,216 @@ def atualizar_status_usuario(usuario_id):
         db.session.rollback()
         return jsonify({'erro': f'Erro ao atualizar status do usuário: {str(e)}'}), 500
 
+# ==================== EXPORTAÇÕES ====================
+# Exportação completa de pedidos (com itens), usuários e produtos em NDJSON ou
+# CSV. As linhas vêm do banco em lotes de EXPORTACAO_LOTE (yield_per: cursor do
+# lado do servidor no PostgreSQL) e cada lote é enviado assim que formatado, então
+# a memória do worker não cresce com o tamanho da tabela.
+
+EXPORTACAO_LOTE = int(os.environ.get('EXPORTACAO_LOTE', 1000))
+FORMATOS_EXPORTACAO = {'ndjson': 'application/x-ndjson', 'csv': 'text/csv'}
+
+def _linha_csv():
+    """Formata uma lista de valores como uma linha CSV (bytes), reaproveitando o buffer"""
+    buffer = io.StringIO()
+    escritor = csv.writer(buffer)
+    def formatar(valores):
+        buffer.seek(0)
+        buffer.truncate()
+        escritor.writerow(valores)
+        return buffer.getvalue().encode()
+    return formatar
+
+def _em_blocos(partes):
+    """Junta as partes em blocos de EXPORTACAO_LOTE para não enviar uma linha por write"""
+    bloco = []
+    for parte in partes:
+        bloco.append(parte)
+        if len(bloco) >= EXPORTACAO_LOTE:
+            yield b''.join(bloco)
+            bloco = []
+    if bloco:
+        yield b''.join(bloco)
+
+def resposta_exportacao(nome, chaves, registros):
+    """Resposta em streaming com os dicts de `registros` (um gerador, consumido durante o envio)
+
+    `chaves` são as colunas do CSV; no NDJSON cada registro vira uma linha JSON.
+    Um erro no meio do envio só pode interromper o corpo (o status já foi enviado),
+    então é registrado no log e a resposta termina truncada.
+    """
+    formato = request.args.get('formato', 'ndjson')
+    if formato not in FORMATOS_EXPORTACAO:
+        return jsonify({'erro': f'Formato inválido. Use: {", ".join(FORMATOS_EXPORTACAO)}'}), 400
+    
+    def gerar():
+        if formato == 'csv':
+            formatar = _linha_csv()
+            partes = itertools.chain([formatar(chaves)], (formatar([r[c] for c in chaves]) for r in registros))
+        else:
+            partes = (codificar_json(r) + b'\n' for r in registros)
+        try:
+            yield from _em_blocos(partes)
+        except Exception:
+            logger.exception('Exportação interrompida', extra={'campos': {'exportacao': nome}})
+    
+    resposta = Response(stream_with_context(gerar()), mimetype=FORMATOS_EXPORTACAO[formato])
+    resposta.headers['Content-Disposition'] = f'attachment; filename={nome}-{datetime.utcnow():%Y%m%d}.{formato}'
+    resposta.headers['Cache-Control'] = 'no-store'
+    resposta.headers['X-Accel-Buffering'] = 'no'  # nginx: repassar os blocos sem acumular
+    return resposta
+
+def _pedidos_com_itens(linhas):
+    """Agrupa as linhas pedido x item (ordenadas por pedido) em um dict por pedido"""
+    for _, grupo in itertools.groupby(linhas, key=attrgetter('id')):
+        grupo = list(grupo)
+        pedido = SERIALIZADOR_PEDIDO_EXPORTACAO(grupo[0])
+        pedido['itens'] = SERIALIZADOR_ITEM_EXPORTACAO.muitos(linha for linha in grupo if linha.item_id is not None)
+        yield pedido
+
+def _pedidos_por_item(linhas):
+    """Uma linha por item, com os dados do pedido repetidos (pedido sem itens: colunas de item vazias)"""
+    vazio = dict.fromkeys(SERIALIZADOR_ITEM_EXPORTACAO.chaves)
+    for linha in linhas:
+        item = SERIALIZADOR_ITEM_EXPORTACAO(linha) if linha.item_id is not None else vazio
+        registro = SERIALIZADOR_PEDIDO_EXPORTACAO(linha)
+        registro.update((f'item_{chave}', valor) for chave, valor in item.items())
+        yield registro
+
+@app.route('/api/admin/exportar/pedidos', methods=['GET'])
+@admin_required
+def exportar_pedidos():
+    """Todos os pedidos com itens (?formato=ndjson|csv; no CSV, uma linha por item)"""
+    linhas = db.session.query(
+        *[getattr(Pedido, campo) for campo in SERIALIZADOR_PEDIDO_EXPORTACAO.chaves],
+        ItemPedido.id.label('item_id'),
+        ItemPedido.produto_id.label('item_produto_id'),
+        ItemPedido.quantidade.label('item_quantidade'),
+        ItemPedido.preco_unitario.label('item_preco_unitario'),
+        Produto.nome.label('item_produto_nome'),
+    ).outerjoin(ItemPedido, ItemPedido.pedido_id == Pedido.id).outerjoin(
+        Produto, Produto.id == ItemPedido.produto_id
+    ).order_by(Pedido.id, ItemPedido.id).yield_per(EXPORTACAO_LOTE)
+    
+    if request.args.get('formato') == 'csv':
+        chaves = list(SERIALIZADOR_PEDIDO_EXPORTACAO.chaves) + [f'item_{c}' for c in SERIALIZADOR_ITEM_EXPORTACAO.chaves]
+        return resposta_exportacao('pedidos', chaves, _pedidos_por_item(linhas))
+    return resposta_exportacao('pedidos', None, _pedidos_com_itens(linhas))
+
+@app.route('/api/admin/exportar/usuarios', methods=['GET'])
+@admin_required
+def exportar_usuarios():
+    """Todos os usuários com total de pedidos (?formato=ndjson|csv)"""
+    linhas = consulta_usuarios_admin().order_by(Usuario.id).yield_per(EXPORTACAO_LOTE)
+    registros = (SERIALIZADOR_USUARIO_ADMIN(linha) for linha in linhas)
+    return resposta_exportacao('usuarios', SERIALIZADOR_USUARIO_ADMIN.chaves, registros)
+
+@app.route('/api/admin/exportar/produtos', methods=['GET'])
+@admin_required
+def exportar_produtos():
+    """Todos os produtos, inclusive inativos (?formato=ndjson|csv)"""
+    colunas = dict(COLUNAS_PRODUTO, ativo=Produto.ativo, data_criacao=Produto.data_criacao,
+                   data_atualizacao=Produto.data_atualizacao)
+    linhas = db.session.query(
+        *[colunas[campo].label(campo) for campo in SERIALIZADOR_PRODUTO_EXPORTACAO.chaves]
+    ).select_from(Produto).outerjoin(Categoria, Produto.categoria_id == Categoria.id).order_by(
+        Produto.id
+    ).yield_per(EXPORTACAO_LOTE)
+    registros = (SERIALIZADOR_PRODUTO_EXPORTACAO(linha) for linha in linhas)
+    return resposta_exportacao('produtos', SERIALIZADOR_PRODUTO_EXPORTACAO.chaves, registros)
+
+# ==================== ESTATÍSTICAS MATERIALIZADAS ====================
+
+STATUS_FATURAVEIS = ('entregue', 'enviado', 'processando')
+
+def registrar_estatistica(dia, status, quantidade, valor):
+    """Soma quantidade/valor ao contador (dia, status) dentro da transação corrente"""
+    tabela = EstatisticaPedido.__table__
+    atualizacao = tabela.update().where(
+        tabela.c.dia == dia, tabela.c.status == status
+    ).values(
+        quantidade=tabela.c.quantidade + quantidade,
+        valor_total=tabela.c.valor_total + valor
+    )
+    if db.session.execute(atualizacao).rowcount:
+        return
+    try:
+        with db.session.begin_nested():
+            db.session.execute(tabela.insert().values(dia=dia, status=status, quantidade=quantidade, valor_total=valor))
+    except IntegrityError:
+        # Outro worker criou a linha entre o UPDATE e o INSERT
+        db.session.execute(atualizacao)
+
+def recalcular_estatisticas():
+    """Reconstrói a tabela de estatísticas a partir dos pedidos em uma única agregação"""
+    dia = db.func.date(Pedido.data_pedido)
+    linhas = db.session.query(
+        dia, Pedido.status, db.func.count(Pedido.id), db.func.coalesce(db.func.sum(Pedido.total), 0)
+    ).group_by(dia, Pedido.status).all()
+    
+    EstatisticaPedido.query.delete()
+    db.session.bulk_insert_mappings(EstatisticaPedido, [{
+        'dia': datetime.strptime(d, '%Y-%m-%d').date() if isinstance(d, str) else d,
+        'status': status,
+        'quantidade': quantidade,
+        'valor_total': float(valor)
+    } for d, status, quantidade, valor in linhas if d is not None])
+    db.session.commit()
+
+def faturamento_por_periodo(agrupamento, dias):
+    """Série de faturamento diária ou semanal lida da tabela materializada"""
+    inicio = datetime.utcnow().date() - timedelta(days=dias - 1)
+    linhas = db.session.query(
+        EstatisticaPedido.dia,
+        db.func.sum(EstatisticaPedido.quantidade),
+        db.func.sum(EstatisticaPedido.valor_total)
+    ).filter(
+        EstatisticaPedido.dia >= inicio,
+        EstatisticaPedido.status.in_(STATUS_FATURAVEIS)
+    ).group_by(EstatisticaPedido.dia).order_by(EstatisticaPedido.dia).all()
+    
+    periodos = {}
+    for dia, quantidade, valor in linhas:
+        chave = dia - timedelta(days=dia.weekday()) if agrupamento == 'semana' else dia
+        periodo = periodos.setdefault(chave, {'periodo': chave.isoformat(), 'pedidos': 0, 'faturamento': 0.0})
+        periodo['pedidos'] += quantidade
+        periodo['faturamento'] += float(valor)
+    return list(periodos.values())
+
 @app.route('/api/admin/pedidos/estatisticas', methods=['GET'])
 @admin_required
 def estatisticas_pedidos():
     """Obter estatísticas dos pedidos (apenas admin)"""
+    agrupamento = request.args.get('agrupamento', 'dia')
+    if agrupamento not in ('dia', 'semana'):
+        return jsonify({'erro': 'agrupamento deve ser dia ou semana'}), 400
     try:
-        total_pedidos = Pedido.query.count()
-        pedidos_pendentes = Pedido.query.filter_by(status='pendente').count()
-        pedidos_processando = Pedido.query.filter_by(status='processando').count()
-        pedidos_enviados = Pedido.query.filter_by(status='enviado').count()
-        pedidos_entregues = Pedido.query.filter_by(status='entregue').count()
-        
-        # Calcular faturamento total
-        faturamento_total = db.session.query(db.func.sum(Pedido.total)).filter(
-            Pedido.status.in_(['entregue', 'enviado', 'processando'])
-        ).scalar() or 0
-        
-        # Pedidos por status
-        status_counts = {
-            'pendente': pedidos_pendentes,
-            'processando': pedidos_processando,
-            'enviado': pedidos_enviados,
-            'entregue': pedidos_entregues
-        }
+        dias = max(1, min(int(request.args.get('dias', 30)), 366))
+    except ValueError:
+        return jsonify({'erro': 'dias deve ser um número inteiro'}), 400
+    
+    try:
+        # Contagens e faturamento por status em uma única leitura da tabela materializada
+        por_status = dict.fromkeys(['pendente', 'processando', 'enviado', 'entregue'], 0)
+        total_pedidos = 0
+        faturamento_total = 0.0
+        for status, quantidade, valor in db.session.query(
+            EstatisticaPedido.status,
+            db.func.sum(EstatisticaPedido.quantidade),
+            db.func.sum(EstatisticaPedido.valor_total)
+        ).group_by(EstatisticaPedido.status):
+            total_pedidos += quantidade
+            if status in por_status:
+                por_status[status] = quantidade
+            if status in STATUS_FATURAVEIS:
+                faturamento_total += float(valor)
         
         return jsonify({
             'total_pedidos': total_pedidos,
-            'faturamento_total': float(faturamento_total),
-            'status_counts': status_counts,
+            'faturamento_total': faturamento_total,
+            'status_counts': por_status,
+            'faturamento_periodo': faturamento_por_periodo(agrupamento, dias),
+            'agrupamento': agrupamento,
             'pedidos_recentes': [
                 {
                     'id': p.id,
@@ -1344,38 +3601,145 @@ def criar_admin_padrao():
         )
         db.session.add(admin)
         db.session.commit()
-        print("👤 Administrador padrão criado:")
-        print("   Username: admin")
-        print("   Senha: admin123")
-        print("   ⚠️  ALTERE A SENHA APÓS O PRIMEIRO LOGIN!")
+        logger.warning('Administrador padrão criado (username: admin, senha: admin123); altere a senha após o primeiro login')
+
+# ==================== MIGRAÇÕES ====================
+# db.create_all só cria tabelas novas; o que muda em tabelas existentes entra
+# aqui como uma migração numerada. Cada migração precisa ser idempotente, porque
+# num banco novo o create_all já criou tudo e ela roda mesmo assim.
+
+def adicionar_colunas(tabela, colunas):
+    """ALTER TABLE ADD COLUMN para as colunas [(nome, tipo SQL)] que ainda não existem"""
+    existentes = {c['name'] for c in db.inspect(db.engine).get_columns(tabela)}
+    for coluna, tipo in colunas:
+        if coluna not in existentes:
+            db.session.execute(text(f'ALTER TABLE {tabela} ADD COLUMN {coluna} {tipo}'))
+    db.session.commit()
+
+def criar_indices(*nomes):
+    """Cria os índices declarados nos modelos que ainda não existem no banco
+
+    No PostgreSQL usa CREATE INDEX CONCURRENTLY (fora de transação), para não
+    bloquear escritas na tabela enquanto o índice é construído; um índice
+    deixado inválido por uma tentativa interrompida é removido e refeito.
+    """
+    declarados = {indice.name: indice for tabela in db.metadata.sorted_tables for indice in tabela.indexes}
+    postgres = _dialeto() == 'postgresql'
+    with db.engine.connect().execution_options(isolation_level='AUTOCOMMIT') as conexao:
+        for nome in nomes:
+            indice = declarados[nome]
+            colunas = ', '.join(coluna.name for coluna in indice.columns)
+            if postgres:
+                invalido = conexao.execute(text(
+                    'SELECT 1 FROM pg_index i JOIN pg_class c ON c.oid = i.indexrelid '
+                    'WHERE c.relname = :nome AND NOT i.indisvalid'
+                ), {'nome': nome}).first()
+                if invalido:
+                    conexao.execute(text(f'DROP INDEX CONCURRENTLY IF EXISTS {nome}'))
+                conexao.execute(text(f'CREATE INDEX CONCURRENTLY IF NOT EXISTS {nome} ON {indice.table.name} ({colunas})'))
+            else:
+                conexao.execute(text(f'CREATE INDEX IF NOT EXISTS {nome} ON {indice.table.name} ({colunas})'))
+
+def marcar_produtos_legados(criados_ate=None):
+    """Marca com id_externo 'legado:<id>' os produtos sem origem (criados até `criados_ate`, se informado)"""
+    consulta = Produto.query.filter(Produto.id_externo.is_(None))
+    if criados_ate is not None:
+        consulta = consulta.filter(db.or_(Produto.data_criacao.is_(None), Produto.data_criacao <= criados_ate))
+    consulta.update(
+        {'id_externo': db.literal(f'{ORIGEM_LEGADO}:') + db.cast(Produto.id, db.String)},
+        synchronize_session=False
+    )
+    db.session.commit()
+
+def migrar_colunas_sincronizacao():
+    adicionar_colunas('produto', [
+        ('data_atualizacao', 'TIMESTAMP'),
+        ('id_externo', 'VARCHAR(100)'),
+        ('hash_origem', 'VARCHAR(64)'),
+    ])
+    criar_indices('ix_produto_id_externo')
+    # Tudo o que existe antes desta migração veio de sincronizações antigas
+    marcar_produtos_legados()
+
+def migrar_produtos_legados():
+    """Marca como legados os produtos anteriores à migração 1 em bancos que já a aplicaram"""
+    aplicada_em = db.session.query(VersaoEsquema.data_aplicacao).filter_by(versao=1).scalar()
+    marcar_produtos_legados(criados_ate=aplicada_em or datetime.utcnow())
+
+def migrar_indices_consultas():
+    criar_indices(
+        'ix_pedido_usuario_data', 'ix_pedido_status_data', 'ix_pedido_data',
+        'ix_item_pedido_pedido', 'ix_item_pedido_produto',
+        'ix_produto_ativo_categoria', 'ix_produto_ativo_preco', 'ix_produto_ativo_data_criacao'
+    )
+
+MIGRACOES = [
+    (1, 'Colunas de sincronização em produto', migrar_colunas_sincronizacao),
+    (2, 'Índices de pedidos, itens de pedido e catálogo', migrar_indices_consultas),
+    (3, 'Origem dos produtos anteriores à sincronização incremental', migrar_produtos_legados),
+]
+
+def aplicar_migracoes(espera_maxima=300):
+    """Aplica, em ordem, as migrações ainda não registradas em versao_esquema
+
+    Só um worker migra por vez (trava 'migracoes'); os demais esperam até ele
+    terminar. Retorna as versões aplicadas por este processo.
+    """
+    dono = uuid.uuid4().hex
+    limite = time.monotonic() + espera_maxima
+    while not adquirir_trava('migracoes', dono, espera_maxima):
+        if time.monotonic() > limite:
+            raise RuntimeError('Tempo esgotado esperando a trava de migrações')
+        time.sleep(0.5)
+    aplicadas = []
+    try:
+        feitas = {versao for (versao,) in db.session.query(VersaoEsquema.versao)}
+        for versao, descricao, migrar in MIGRACOES:
+            if versao in feitas:
+                continue
+            inicio = time.perf_counter()
+            migrar()
+            db.session.add(VersaoEsquema(versao=versao, descricao=descricao))
+            db.session.commit()
+            aplicadas.append(versao)
+            logger.info('Migração aplicada', extra={'campos': {
+                'versao': versao, 'descricao': descricao, 'duracao_s': round(time.perf_counter() - inicio, 3)
+            }})
+    finally:
+        liberar_trava('migracoes', dono)
+    return aplicadas
 
 def inicializar_banco():
     """Inicializa o banco de dados e popula com dados iniciais"""
     try:
         with app.app_context():
             db.create_all()
+            aplicar_migracoes()
             criar_admin_padrao()
             
+            if criar_indice_busca() and indice_busca_vazio() and Produto.query.first() is not None:
+                indexar_produtos()
+                db.session.commit()
+            
+            if EstatisticaPedido.query.first() is None and Pedido.query.first() is not None:
+                recalcular_estatisticas()
+            
             if Categoria.query.count() == 0:
-                print("🔄 Carregando produtos em português...")
+                logger.info('Carregando produtos em português')
                 if sincronizar_produtos_portugues():
-                    print("✅ Produtos em português carregados com sucesso!")
-                    print(f"📦 Total: {len(PRODUTOS_PORTUGUES)} produtos")
-                    print("💰 Valores em meticais (MZN)")
+                    logger.info('Produtos em português carregados', extra={'campos': {'produtos': len(PRODUTOS_PORTUGUES), 'moeda': 'MZN'}})
                 else:
-                    print("⚠️ Falha no carregamento. Usando dados básicos...")
+                    logger.warning('Falha no carregamento; usando dados básicos')
                     popular_banco_fallback()
-    except Exception as e:
-        print(f"⚠️ Erro ao inicializar banco: {e}")
-        import traceback
-        traceback.print_exc()
+    except Exception:
+        logger.exception('Erro ao inicializar banco')
 
 # Inicializar banco quando o módulo for importado (para gunicorn no Render)
 # Isso garante que o banco seja criado mesmo quando não executamos python app.py diretamente
 try:
     inicializar_banco()
 except Exception as e:
-    print(f"⚠️ Aviso na inicialização: {e}")
+    logger.warning('Aviso na inicialização: %s', e)
 
 if __name__ == '__main__':
     # Para desenvolvimento local
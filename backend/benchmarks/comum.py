@@ -0,0 +1,77 @@
+"""Utilitários compartilhados pelos benchmarks"""
+import os
+import sys
+import tempfile
+
+BACKEND = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+def carregar_app(diretorio=None):
+    """Importa app.py apontando para um banco SQLite temporário; retorna (modulo, diretorio)
+
+    Precisa ser chamado antes de qualquer outro import de `app`, porque a
+    configuração do banco é lida na importação.
+    """
+    diretorio = diretorio or tempfile.mkdtemp(prefix='loja-bench-')
+    os.environ.setdefault('DATABASE_URL', f'sqlite:///{os.path.join(diretorio, "loja.db")}')
+    os.environ.setdefault('CACHE_VERSAO_DIR', diretorio)
+    if BACKEND not in sys.path:
+        sys.path.insert(0, BACKEND)
+    import app as loja
+    return loja, diretorio
+
+def percentil(valores, p):
+    """Percentil p (0-100) por interpolação linear"""
+    if not valores:
+        return 0.0
+    ordenados = sorted(valores)
+    posicao = (len(ordenados) - 1) * p / 100
+    base = int(posicao)
+    proximo = min(base + 1, len(ordenados) - 1)
+    return ordenados[base] + (ordenados[proximo] - ordenados[base]) * (posicao - base)
+
+def resumo_latencias(segundos):
+    """p50/p95/p99/máximo em milissegundos"""
+    return {
+        'p50_ms': round(percentil(segundos, 50) * 1000, 2),
+        'p95_ms': round(percentil(segundos, 95) * 1000, 2),
+        'p99_ms': round(percentil(segundos, 99) * 1000, 2),
+        'max_ms': round(max(segundos) * 1000, 2) if segundos else 0.0
+    }
+
+def pedido_exemplo(itens):
+    """Corpo de POST /api/pedidos com os itens [(produto_id, quantidade), ...]"""
+    return {
+        'itens': [{'produto_id': produto_id, 'quantidade': quantidade} for produto_id, quantidade in itens],
+        'nome_cliente': 'Cliente Benchmark',
+        'email_cliente': 'bench@loja.com',
+        'telefone_cliente': '840000000',
+        'endereco_entrega': 'Av. 25 de Setembro, 100',
+        'cidade_entrega': 'Maputo',
+        'cep_entrega': '1100'
+    }
+
+def iniciar_gunicorn(diretorio, workers=4, porta=8770, ambiente=None):
+    """Sobe o app no gunicorn com o banco de `diretorio`; retorna (processo, url) já respondendo
+
+    O banco precisa ter sido preparado antes (carregar_app com o mesmo diretório).
+    """
+    import subprocess
+    import time
+    import urllib.request
+    env = dict(os.environ, DATABASE_URL=f'sqlite:///{os.path.join(diretorio, "loja.db")}',
+               CACHE_VERSAO_DIR=diretorio, LOG_LEVEL=os.environ.get('LOG_LEVEL', 'WARNING'), **(ambiente or {}))
+    processo = subprocess.Popen(
+        [sys.executable, '-m', 'gunicorn', 'app:app', '--bind', f'127.0.0.1:{porta}',
+         '--workers', str(workers), '--timeout', '120'],
+        cwd=BACKEND, env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL
+    )
+    url = f'http://127.0.0.1:{porta}'
+    limite = time.monotonic() + 60
+    while time.monotonic() < limite:
+        try:
+            urllib.request.urlopen(f'{url}/api/categorias', timeout=1)
+            return processo, url
+        except OSError:
+            time.sleep(0.2)
+    processo.terminate()
+    raise RuntimeError('gunicorn não respondeu em 60s')
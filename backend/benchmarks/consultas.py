@@ -0,0 +1,78 @@
+"""Número de comandos SQL das listagens em dois tamanhos de banco (detecta N+1)
+
+Gera um banco pequeno, exercita cada listagem dentro de assert_max_queries,
+multiplica o volume por --fator e repete com os mesmos limites. Uma listagem
+que volte a carregar relacionamentos linha a linha estoura o limite no banco
+maior. Sai com código 1 se algum limite for excedido.
+
+Uso (a partir de backend/):
+    python -m benchmarks.consultas --pedidos 200 --fator 10
+"""
+import argparse
+import sys
+
+from benchmarks.comum import carregar_app
+from benchmarks.dados import SENHA_USUARIOS, gerar_dados
+
+# selectinload busca a coleção em lotes de 500 pais (padrão do SQLAlchemy)
+LOTE_SELECTIN = 500
+
+# (caminho, autenticação, máximo de comandos em função do total de pedidos)
+LISTAGENS = [
+    ('/api/produtos', None, lambda pedidos: 1),
+    ('/api/produtos?limit=50&sort=-preco', None, lambda pedidos: 1),
+    ('/api/produtos?campos=nome,categoria_nome', None, lambda pedidos: 1),
+    ('/api/pedidos', None, lambda pedidos: 1 + -(-pedidos // LOTE_SELECTIN)),
+    ('/api/pedidos/1', None, lambda pedidos: 2),
+    ('/api/pedidos/usuario/{usuario_id}', None, lambda pedidos: 2),
+    ('/api/usuarios/historico', 'usuario', lambda pedidos: 2),
+    ('/api/favoritos', 'usuario', lambda pedidos: 1),
+]
+
+def conferir(loja, cliente, usuario_id, cabecalhos, pedidos):
+    """Lista de falhas (texto) das listagens com mais comandos que o limite"""
+    falhas = []
+    for caminho, autenticacao, maximo in LISTAGENS:
+        caminho = caminho.format(usuario_id=usuario_id)
+        with loja.app.app_context():
+            loja.invalidar_catalogo()  # mede a consulta, não o cache de respostas
+            try:
+                with loja.assert_max_queries(maximo(pedidos)) as contador:
+                    resposta = cliente.get(caminho, headers=cabecalhos.get(autenticacao, {}))
+                situacao = 'ok'
+            except AssertionError as e:
+                falhas.append(f'{caminho} ({pedidos} pedidos): {e}')
+                situacao = 'EXCEDEU'
+        print(f'{pedidos:>8} {caminho:<44} {resposta.status_code:>4} {contador["total"]:>4} / {maximo(pedidos):<4} {situacao}')
+    return falhas
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--produtos', type=int, default=200)
+    parser.add_argument('--usuarios', type=int, default=20)
+    parser.add_argument('--pedidos', type=int, default=200)
+    parser.add_argument('--favoritos', type=int, default=100)
+    parser.add_argument('--fator', type=int, default=10, help='multiplicador do volume na segunda medição')
+    args = parser.parse_args()
+
+    loja, _ = carregar_app()
+    cliente = loja.app.test_client()
+    print(f'{"pedidos":>8} {"listagem":<44} {"http":>4} {"SQL":>4} / máx')
+    falhas, usuarios = [], args.usuarios
+    for fator in (1, args.fator):
+        with loja.app.app_context():
+            gerar_dados(loja, args.produtos * fator, usuarios, args.pedidos * fator, args.favoritos * fator, semente=fator)
+            usuarios = 0
+            usuario = loja.Usuario.query.filter(loja.Usuario.email.like('%@bench.loja')).order_by(loja.Usuario.id).first()
+            usuario_id, email, pedidos = usuario.id, usuario.email, loja.Pedido.query.count()
+        token = cliente.post('/api/usuarios/login', json={'email': email, 'senha': SENHA_USUARIOS}).get_json()['token']
+        falhas += conferir(loja, cliente, usuario_id, {'usuario': {'Authorization': f'Bearer {token}'}}, pedidos)
+
+    for falha in falhas:
+        print(f'FALHA {falha}')
+    if falhas:
+        sys.exit(1)
+    print('todas as listagens dentro do limite de comandos SQL')
+
+if __name__ == '__main__':
+    main()
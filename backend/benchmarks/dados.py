@@ -0,0 +1,133 @@
+"""Gerador de dados sintéticos em escala para benchmarks
+
+Produtos são variações dos modelos de PRODUTOS_PORTUGUES (nome com modelo/cor,
+preço com variação de até 20%); usuários, pedidos com itens e favoritos são
+gerados com semente fixa, então o mesmo tamanho produz sempre o mesmo banco.
+
+Uso (a partir de backend/):
+    python -m benchmarks.dados --produtos 100000 --usuarios 10000 --pedidos 200000 --diretorio /tmp/loja-100k
+    DATABASE_URL=sqlite:////tmp/loja-100k/loja.db gunicorn app:app
+"""
+import argparse
+import os
+import random
+import time
+from datetime import datetime, timedelta
+
+from benchmarks.comum import carregar_app
+
+SENHA_USUARIOS = 'senha-benchmark'
+CORES = ['Preto', 'Branco', 'Azul', 'Vermelho', 'Verde', 'Cinza', 'Dourado', 'Prata']
+TAMANHO_LOTE = 10000
+
+def _em_lotes(db, tabela, linhas):
+    lote = []
+    for linha in linhas:
+        lote.append(linha)
+        if len(lote) == TAMANHO_LOTE:
+            db.session.execute(tabela.insert(), lote)
+            lote = []
+    if lote:
+        db.session.execute(tabela.insert(), lote)
+
+def gerar_dados(loja, produtos=10000, usuarios=1000, pedidos=20000, favoritos=5000, semente=42):
+    """Acrescenta o volume pedido ao banco do app (dentro de app_context); retorna as contagens finais
+
+    Todos os usuários gerados usam SENHA_USUARIOS; o hash é calculado uma vez só.
+    """
+    db = loja.db
+    aleatorio = random.Random(semente)
+    agora = datetime.utcnow()
+    loja.garantir_categorias({(p['categoria'], '') for p in loja.PRODUTOS_PORTUGUES})
+    categorias = {c.nome: c.id for c in loja.Categoria.query.all()}
+
+    def produto(n):
+        modelo = aleatorio.choice(loja.PRODUTOS_PORTUGUES)
+        return {
+            'nome': f'{modelo["nome"]} {aleatorio.choice(CORES)} M{n}',
+            'descricao': modelo['descricao'],
+            'preco': round(modelo['preco'] * aleatorio.uniform(0.8, 1.2), 2),
+            'estoque': 10 ** 6,
+            'imagem_url': modelo['imagem'],
+            'categoria_id': categorias[modelo['categoria']],
+            'ativo': aleatorio.random() > 0.05,
+            'data_criacao': agora - timedelta(minutes=n),
+            'data_atualizacao': agora,
+        }
+    _em_lotes(db, loja.Produto.__table__, (produto(n) for n in range(produtos)))
+
+    senha_hash = loja.hash_senha(SENHA_USUARIOS)
+    primeiro_usuario = (db.session.query(db.func.max(loja.Usuario.id)).scalar() or 0) + 1
+    _em_lotes(db, loja.Usuario.__table__, ({
+        'nome': f'Usuário Sintético {n}',
+        'email': f'usuario{n}@bench.loja',
+        'senha_hash': senha_hash,
+        'ativo': True,
+        'data_criacao': agora - timedelta(hours=n % 8760),
+    } for n in range(primeiro_usuario, primeiro_usuario + usuarios)))
+
+    produto_ids = [i for (i,) in db.session.query(loja.Produto.id).filter(loja.Produto.ativo.is_(True))]
+    usuario_ids = [i for (i,) in db.session.query(loja.Usuario.id)]
+    precos = dict(db.session.query(loja.Produto.id, loja.Produto.preco))
+
+    for inicio in range(0, pedidos, TAMANHO_LOTE):
+        quantidade = min(TAMANHO_LOTE, pedidos - inicio)
+        itens_por_pedido = [
+            [(produto_id, aleatorio.randint(1, 3)) for produto_id in aleatorio.sample(produto_ids, aleatorio.randint(1, 4))]
+            for _ in range(quantidade)
+        ]
+        ids = db.session.execute(loja.Pedido.__table__.insert().returning(loja.Pedido.id, sort_by_parameter_order=True), [{
+            'usuario_id': aleatorio.choice(usuario_ids),
+            'total': round(sum(precos[p] * q for p, q in itens), 2),
+            'status': aleatorio.choice(loja.STATUS_PEDIDO),
+            'data_pedido': agora - timedelta(minutes=aleatorio.randint(0, 525600)),
+            'data_atualizacao': agora,
+            'nome_cliente': 'Cliente Sintético',
+            'email_cliente': 'cliente@bench.loja',
+            'cidade_entrega': 'Maputo',
+        } for itens in itens_por_pedido]).scalars().all()
+        _em_lotes(db, loja.ItemPedido.__table__, ({
+            'pedido_id': pedido_id, 'produto_id': produto_id, 'quantidade': quantidade_item, 'preco_unitario': precos[produto_id]
+        } for pedido_id, itens in zip(ids, itens_por_pedido) for produto_id, quantidade_item in itens))
+
+    pares = set()
+    while len(pares) < min(favoritos, len(usuario_ids) * len(produto_ids)):
+        pares.add((aleatorio.choice(usuario_ids), aleatorio.choice(produto_ids)))
+    existentes = set(db.session.query(loja.Favorito.usuario_id, loja.Favorito.produto_id))
+    _em_lotes(db, loja.Favorito.__table__, (
+        {'usuario_id': u, 'produto_id': p, 'data_favorito': agora} for u, p in pares - existentes
+    ))
+
+    if loja.busca_disponivel():
+        loja.indexar_produtos()
+    db.session.commit()
+    loja.recalcular_estatisticas()
+    loja.invalidar_catalogo()
+    return {
+        'produtos': loja.Produto.query.count(),
+        'usuarios': loja.Usuario.query.count(),
+        'pedidos': loja.Pedido.query.count(),
+        'itens': loja.ItemPedido.query.count(),
+        'favoritos': loja.Favorito.query.count(),
+    }
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--produtos', type=int, default=10000)
+    parser.add_argument('--usuarios', type=int, default=1000)
+    parser.add_argument('--pedidos', type=int, default=20000)
+    parser.add_argument('--favoritos', type=int, default=5000)
+    parser.add_argument('--semente', type=int, default=42)
+    parser.add_argument('--diretorio', help='onde criar loja.db (padrão: diretório temporário)')
+    args = parser.parse_args()
+
+    if args.diretorio:
+        os.makedirs(args.diretorio, exist_ok=True)
+    loja, diretorio = carregar_app(args.diretorio)
+    with loja.app.app_context():
+        inicio = time.perf_counter()
+        contagens = gerar_dados(loja, args.produtos, args.usuarios, args.pedidos, args.favoritos, args.semente)
+    print(f'{diretorio}/loja.db gerado em {time.perf_counter() - inicio:.1f}s: {contagens}')
+
+if __name__ == '__main__':
+    main()
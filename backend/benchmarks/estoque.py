@@ -0,0 +1,91 @@
+"""Teste de estresse da reserva de estoque em criar_pedido
+
+Uso (a partir de backend/):
+    python -m benchmarks.estoque --threads 16 --pedidos 50 --estoque 200
+    DATABASE_URL=sqlite:////caminho/loja.db python -m benchmarks.estoque --url http://127.0.0.1:5000
+
+Com --url, DATABASE_URL precisa apontar para o mesmo banco do servidor: o
+estoque é preparado e conferido diretamente no banco.
+
+Várias threads disputam os mesmos produtos com pedidos de 1 a 3 unidades. Ao
+final, o estoque vendido (soma dos itens dos pedidos aceitos) precisa ser igual
+à baixa no banco e nunca maior que o estoque inicial.
+"""
+import argparse
+import random
+import threading
+import time
+
+from benchmarks.comum import carregar_app, pedido_exemplo, resumo_latencias
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--threads', type=int, default=16)
+    parser.add_argument('--pedidos', type=int, default=50, help='pedidos por thread')
+    parser.add_argument('--estoque', type=int, default=200, help='estoque inicial de cada produto disputado')
+    parser.add_argument('--produtos', type=int, default=3, help='quantos produtos são disputados')
+    parser.add_argument('--url', help='servidor alvo; sem ele usa o Flask test client com banco temporário')
+    args = parser.parse_args()
+    
+    loja, _ = carregar_app()
+    produto_ids = list(range(1, args.produtos + 1))
+    with loja.app.app_context():
+        loja.Produto.query.filter(loja.Produto.id.in_(produto_ids)).update(
+            {'estoque': args.estoque, 'ativo': True}, synchronize_session=False
+        )
+        loja.db.session.commit()
+    
+    def estoque_atual():
+        with loja.app.app_context():
+            return dict(loja.db.session.query(loja.Produto.id, loja.Produto.estoque).filter(loja.Produto.id.in_(produto_ids)))
+    
+    inicial = estoque_atual()
+    vendidos = {i: 0 for i in produto_ids}
+    status = {}
+    latencias = []
+    lock = threading.Lock()
+    
+    def trabalhador(semente):
+        aleatorio = random.Random(semente)
+        if args.url:
+            import requests
+            sessao = requests.Session()
+            enviar = lambda corpo: sessao.post(f'{args.url}/api/pedidos', json=corpo)
+        else:
+            cliente = loja.app.test_client()
+            enviar = lambda corpo: cliente.post('/api/pedidos', json=corpo)
+        for _ in range(args.pedidos):
+            itens = [(i, aleatorio.randint(1, 3)) for i in aleatorio.sample(produto_ids, aleatorio.randint(1, len(produto_ids)))]
+            inicio = time.perf_counter()
+            resposta = enviar(pedido_exemplo(itens))
+            duracao = time.perf_counter() - inicio
+            with lock:
+                latencias.append(duracao)
+                status[resposta.status_code] = status.get(resposta.status_code, 0) + 1
+                if resposta.status_code == 201:
+                    for produto_id, quantidade in itens:
+                        vendidos[produto_id] += quantidade
+    
+    inicio = time.perf_counter()
+    threads = [threading.Thread(target=trabalhador, args=(n,)) for n in range(args.threads)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    duracao = time.perf_counter() - inicio
+    
+    final = estoque_atual()
+    total = args.threads * args.pedidos
+    print(f'{total} pedidos em {duracao:.2f}s ({total / duracao:.1f} pedidos/s) - status: {status}')
+    print(f'latência: {resumo_latencias(latencias)}')
+    ok = True
+    for produto_id in produto_ids:
+        baixa = inicial[produto_id] - final[produto_id]
+        coerente = baixa == vendidos[produto_id] and final[produto_id] >= 0
+        ok &= coerente
+        print(f'produto {produto_id}: inicial={inicial[produto_id]} vendido={vendidos[produto_id]} '
+              f'final={final[produto_id]} {"OK" if coerente else "INCONSISTENTE"}')
+    raise SystemExit(0 if ok else 1)
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,52 @@
+"""Pico de memória e tempo da listagem completa de pedidos x exportação em streaming
+
+Gera um banco sintético, pede GET /api/pedidos (documento inteiro em memória) e
+GET /api/admin/exportar/pedidos em NDJSON e CSV, consumindo o corpo bloco a bloco
+e descartando-o, e mede o pico de alocações Python (tracemalloc) de cada um.
+
+Uso (a partir de backend/):
+    python -m benchmarks.exportacao --pedidos 20000
+    python -m benchmarks.exportacao --pedidos 100000 --pedidos 200000
+"""
+import argparse
+import time
+import tracemalloc
+
+from benchmarks.comum import carregar_app
+from benchmarks.dados import gerar_dados
+
+def medir(cliente, caminho, cabecalhos):
+    """(pico de memória em MB, segundos, bytes enviados) de uma requisição"""
+    tracemalloc.start()
+    inicio = time.perf_counter()
+    resposta = cliente.get(caminho, headers=cabecalhos, buffered=False)
+    enviados = sum(len(bloco) for bloco in resposta.response)
+    resposta.close()
+    duracao = time.perf_counter() - inicio
+    _, pico = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return pico / 2 ** 20, duracao, enviados
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--pedidos', type=int, action='append', help='tamanhos a medir (acumulativo; padrão 5000 e 20000)')
+    parser.add_argument('--produtos', type=int, default=2000)
+    parser.add_argument('--usuarios', type=int, default=1000)
+    args = parser.parse_args()
+
+    loja, _ = carregar_app()
+    cliente = loja.app.test_client()
+    print(f'{"pedidos":>8} {"endpoint":<42} {"pico":>10} {"tempo":>9} {"enviado":>10}')
+    total, produtos, usuarios = 0, args.produtos, args.usuarios
+    for tamanho in sorted(args.pedidos or [5000, 20000]):
+        with loja.app.app_context():
+            gerar_dados(loja, produtos, usuarios, tamanho - total, favoritos=0)
+        total, produtos, usuarios = tamanho, 0, 0
+        token = cliente.post('/api/admin/login', json={'username': 'admin', 'senha': 'admin123'}).get_json()['token']
+        cabecalhos = {'Authorization': f'Bearer {token}'}
+        for caminho in ('/api/pedidos', '/api/admin/exportar/pedidos?formato=ndjson', '/api/admin/exportar/pedidos?formato=csv'):
+            pico, duracao, enviados = medir(cliente, caminho, cabecalhos)
+            print(f'{tamanho:>8} {caminho:<42} {pico:>7.1f} MB {duracao:>7.2f} s {enviados / 2 ** 20:>7.1f} MB')
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,88 @@
+"""Substituto local da fakestoreapi.com para testes e benchmarks de sincronização
+
+Uso:
+    python -m benchmarks.fakestore_local --produtos 100000 --porta 8765
+    FAKE_STORE_API=http://127.0.0.1:8765 python app.py
+
+Os produtos são gerados de forma determinística; --revisao altera o preço de
+parte deles para simular mudanças na fonte entre duas sincronizações.
+"""
+import argparse
+import json
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import urlparse, parse_qs
+
+CATEGORIAS = ["electronics", "jewelery", "men's clothing", "women's clothing"]
+
+def gerar_produto(i, revisao=0):
+    """Produto no formato da Fake Store API"""
+    preco = round(10 + (i * 7919) % 990 + 0.99, 2)
+    if revisao and i % 10 < revisao:
+        preco = round(preco * 1.1, 2)
+    return {
+        'id': i,
+        'title': f'Produto de teste {i}',
+        'price': preco,
+        'description': f'Descrição do produto de teste número {i}',
+        'category': CATEGORIAS[i % len(CATEGORIAS)],
+        'image': f'https://fakestoreapi.com/img/{i}.jpg',
+        'rating': {'rate': 4.1, 'count': i % 500}
+    }
+
+def criar_handler(quantidade, revisao):
+    class Handler(BaseHTTPRequestHandler):
+        def log_message(self, *args):
+            pass
+        
+        def _json(self, dados):
+            corpo = json.dumps(dados).encode()
+            self.send_response(200)
+            self.send_header('Content-Type', 'application/json; charset=utf-8')
+            self.send_header('Content-Length', str(len(corpo)))
+            self.end_headers()
+            self.wfile.write(corpo)
+        
+        def do_GET(self):
+            url = urlparse(self.path)
+            if url.path == '/products/categories':
+                return self._json(CATEGORIAS)
+            if url.path != '/products':
+                self.send_error(404)
+                return
+            
+            limite = int(parse_qs(url.query).get('limit', [quantidade])[0])
+            # Sem Content-Length (HTTP/1.0): o corpo é escrito em partes até fechar a conexão
+            self.send_response(200)
+            self.send_header('Content-Type', 'application/json; charset=utf-8')
+            self.end_headers()
+            self.wfile.write(b'[')
+            partes = []
+            for i in range(1, min(limite, quantidade) + 1):
+                partes.append(json.dumps(gerar_produto(i, revisao)))
+                if len(partes) == 500:
+                    self.wfile.write((',' if i > 500 else '').encode() + ','.join(partes).encode())
+                    partes = []
+            if partes:
+                self.wfile.write((',' if min(limite, quantidade) > len(partes) else '').encode() + ','.join(partes).encode())
+            self.wfile.write(b']')
+    return Handler
+
+def iniciar_servidor(quantidade=20, revisao=0, porta=0):
+    """Sobe o servidor em uma thread; retorna (servidor, url_base)"""
+    servidor = ThreadingHTTPServer(('127.0.0.1', porta), criar_handler(quantidade, revisao))
+    threading.Thread(target=servidor.serve_forever, daemon=True).start()
+    return servidor, f'http://127.0.0.1:{servidor.server_address[1]}'
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--produtos', type=int, default=20)
+    parser.add_argument('--revisao', type=int, default=0, help='0-10: décimos dos produtos com preço alterado')
+    parser.add_argument('--porta', type=int, default=8765)
+    args = parser.parse_args()
+    servidor, url = iniciar_servidor(args.produtos, args.revisao, args.porta)
+    print(f'Fake Store local em {url} com {args.produtos} produtos')
+    try:
+        threading.Event().wait()
+    except KeyboardInterrupt:
+        servidor.shutdown()
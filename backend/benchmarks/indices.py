@@ -0,0 +1,86 @@
+"""Tempo das consultas mais frequentes sem e com os índices da migração 2
+
+Popula um banco temporário, remove os índices de MIGRACOES[2], mede, recria
+com criar_indices e mede de novo.
+
+Uso (a partir de backend/):
+    python -m benchmarks.indices --pedidos 200000 --produtos 20000
+"""
+import argparse
+import random
+import time
+
+from benchmarks.comum import carregar_app, resumo_latencias
+from benchmarks.dados import gerar_dados
+
+INDICES = [
+    'ix_pedido_usuario_data', 'ix_pedido_status_data', 'ix_pedido_data',
+    'ix_item_pedido_pedido', 'ix_item_pedido_produto',
+    'ix_produto_ativo_categoria', 'ix_produto_ativo_preco', 'ix_produto_ativo_data_criacao',
+]
+
+def consultas(loja, usuario_ids, produto_ids, categorias):
+    """Consultas equivalentes às das rotas, como (nome, função sem argumentos)"""
+    db, Pedido, Produto, ItemPedido = loja.db, loja.Pedido, loja.Produto, loja.ItemPedido
+    aleatorio = random.Random(7)
+    return [
+        ('historico do usuario', lambda: Pedido.query.options(*loja.CARREGAR_PEDIDO).filter_by(
+            usuario_id=aleatorio.choice(usuario_ids)).order_by(Pedido.data_pedido.desc()).all()),
+        ('pedidos por status', lambda: Pedido.query.filter_by(
+            status='pendente').order_by(Pedido.data_pedido.desc()).limit(50).all()),
+        ('ultimos pedidos', lambda: Pedido.query.order_by(Pedido.data_pedido.desc()).limit(5).all()),
+        ('vendas do produto', lambda: ItemPedido.query.filter_by(produto_id=aleatorio.choice(produto_ids)).count()),
+        ('catalogo por categoria', lambda: Produto.query.filter_by(
+            ativo=True, categoria_id=aleatorio.choice(categorias)).order_by(Produto.id).limit(21).all()),
+        ('catalogo por preco', lambda: Produto.query.filter_by(
+            ativo=True).order_by(Produto.preco, Produto.id).limit(21).all()),
+    ]
+
+def medir(loja, lista, repeticoes):
+    resultados = {}
+    for nome, consulta in lista:
+        latencias = []
+        for _ in range(repeticoes):
+            inicio = time.perf_counter()
+            consulta()
+            latencias.append(time.perf_counter() - inicio)
+            loja.db.session.rollback()
+        resultados[nome] = resumo_latencias(latencias)
+    return resultados
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--pedidos', type=int, default=200000)
+    parser.add_argument('--produtos', type=int, default=20000)
+    parser.add_argument('--usuarios', type=int, default=5000)
+    parser.add_argument('--repeticoes', type=int, default=50)
+    args = parser.parse_args()
+
+    loja, _ = carregar_app()
+    with loja.app.app_context():
+        inicio = time.perf_counter()
+        gerar_dados(loja, args.produtos, args.usuarios, args.pedidos, favoritos=0)
+        print(f'banco populado em {time.perf_counter() - inicio:.1f}s')
+        dados = (
+            [i for (i,) in loja.db.session.query(loja.Usuario.id)],
+            [i for (i,) in loja.db.session.query(loja.Produto.id)],
+            [i for (i,) in loja.db.session.query(loja.Categoria.id)],
+        )
+
+        for nome in INDICES:
+            loja.db.session.execute(loja.db.text(f'DROP INDEX IF EXISTS {nome}'))
+        loja.db.session.commit()
+        antes = medir(loja, consultas(loja, *dados), args.repeticoes)
+
+        inicio = time.perf_counter()
+        loja.criar_indices(*INDICES)
+        print(f'índices criados em {time.perf_counter() - inicio:.1f}s')
+        depois = medir(loja, consultas(loja, *dados), args.repeticoes)
+
+    print(f'{"consulta":<24} {"p50 antes":>12} {"p50 depois":>12} {"p99 antes":>12} {"p99 depois":>12}')
+    for nome in antes:
+        print(f'{nome:<24} {antes[nome]["p50_ms"]:>10} ms {depois[nome]["p50_ms"]:>10} ms '
+              f'{antes[nome]["p99_ms"]:>10} ms {depois[nome]["p99_ms"]:>10} ms')
+
+if __name__ == '__main__':
+    main()
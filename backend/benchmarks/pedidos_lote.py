@@ -0,0 +1,46 @@
+"""Compara o custo por pedido de POST /api/pedidos com POST /api/pedidos/batch
+
+Uso (a partir de backend/):
+    python -m benchmarks.pedidos_lote --pedidos 2000 --lote 200
+"""
+import argparse
+import random
+import time
+
+from benchmarks.comum import carregar_app, pedido_exemplo
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--pedidos', type=int, default=2000)
+    parser.add_argument('--lote', type=int, default=200)
+    args = parser.parse_args()
+    
+    loja, _ = carregar_app()
+    with loja.app.app_context():
+        loja.Produto.query.update({'estoque': 10 ** 9}, synchronize_session=False)
+        loja.db.session.commit()
+        produto_ids = [i for (i,) in loja.db.session.query(loja.Produto.id)]
+    
+    aleatorio = random.Random(42)
+    corpos = [
+        pedido_exemplo([(i, aleatorio.randint(1, 3)) for i in aleatorio.sample(produto_ids, 3)])
+        for _ in range(args.pedidos)
+    ]
+    cliente = loja.app.test_client()
+    
+    inicio = time.perf_counter()
+    for corpo in corpos:
+        assert cliente.post('/api/pedidos', json=corpo).status_code == 201
+    individual = (time.perf_counter() - inicio) / args.pedidos
+    
+    inicio = time.perf_counter()
+    for n in range(0, args.pedidos, args.lote):
+        resposta = cliente.post('/api/pedidos/batch', json={'pedidos': corpos[n:n + args.lote]})
+        assert resposta.status_code == 201 and resposta.get_json()['falhas'] == 0
+    lote = (time.perf_counter() - inicio) / args.pedidos
+    
+    print(f'individual: {individual * 1000:.3f} ms/pedido')
+    print(f'lote de {args.lote}: {lote * 1000:.3f} ms/pedido ({individual / lote:.1f}x mais rápido)')
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,58 @@
+"""Latência de login por custo de hash de senha, numa taxa de logins fixa
+
+Para cada custo, dispara `--taxa` verificações por segundo durante `--duracao`
+segundos num pool de `--threads` (como SENHA_THREADS em um worker) e mede o
+tempo de fila + hash. Use para escolher o maior custo cujo p99 cabe no orçamento.
+
+Uso (a partir de backend/):
+    python -m benchmarks.senha --taxa 20 --threads 2 --orcamento-ms 250
+"""
+import argparse
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from benchmarks.comum import carregar_app, resumo_latencias
+
+CUSTOS = [
+    ('scrypt', 2 ** 13, 8, 1),
+    ('scrypt', 2 ** 14, 8, 1),
+    ('scrypt', 2 ** 15, 8, 1),
+    ('pbkdf2_sha256', 200000),
+    ('pbkdf2_sha256', 600000),
+]
+
+def medir(loja, parametros, taxa, duracao, threads):
+    senha_hash = loja.hash_senha('senha-benchmark', parametros)
+    intervalo = 1 / taxa
+    latencias = []
+
+    def verificar(enviado):
+        assert loja.verificar_senha('senha-benchmark', senha_hash)
+        latencias.append(time.perf_counter() - enviado)
+
+    with ThreadPoolExecutor(max_workers=threads) as pool:
+        inicio = time.perf_counter()
+        for n in range(int(taxa * duracao)):
+            atraso = inicio + n * intervalo - time.perf_counter()
+            if atraso > 0:
+                time.sleep(atraso)
+            pool.submit(verificar, time.perf_counter())
+    return resumo_latencias(latencias)
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--taxa', type=float, default=20, help='logins por segundo')
+    parser.add_argument('--duracao', type=float, default=5, help='segundos por custo')
+    parser.add_argument('--threads', type=int, default=2)
+    parser.add_argument('--orcamento-ms', type=float, default=250, help='p99 máximo aceitável')
+    args = parser.parse_args()
+
+    loja, _ = carregar_app()
+    for parametros in CUSTOS:
+        resumo = medir(loja, parametros, args.taxa, args.duracao, args.threads)
+        situacao = 'ok' if resumo['p99_ms'] <= args.orcamento_ms else 'acima do orçamento'
+        nome = '$'.join(map(str, parametros))
+        print(f'{nome:<24} p50={resumo["p50_ms"]:>8} ms  p99={resumo["p99_ms"]:>8} ms  {situacao}')
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,214 @@
+"""Suíte de carga ponta a ponta: vazão e latência por endpoint, com baseline em JSON
+
+Gera um banco sintético (benchmarks.dados) e exercita as rotas reais, em um
+de dois modos:
+
+- cliente: Flask test client, requisições sequenciais (custo da aplicação, sem rede)
+- http: gunicorn local com vários workers e threads clientes simultâneas
+
+Uso (a partir de backend/):
+    python -m benchmarks.suite --modo cliente --escala 10k
+    python -m benchmarks.suite --modo http --escala 100k --workers 4 --clientes 16
+    python -m benchmarks.suite --modo cliente --comparar benchmarks/baseline.json
+    python -m benchmarks.suite --modo cliente --salvar benchmarks/baseline.json
+
+Com --comparar, sai com código 1 se algum endpoint ficar com p95 ou vazão pior
+que a baseline do mesmo modo e escala além de --tolerancia.
+"""
+import argparse
+import json
+import os
+import platform
+import random
+import sys
+import threading
+import time
+from datetime import datetime
+
+from benchmarks.comum import carregar_app, iniciar_gunicorn, pedido_exemplo, resumo_latencias
+from benchmarks.dados import SENHA_USUARIOS, gerar_dados
+
+# produtos, usuários, pedidos, favoritos
+ESCALAS = {
+    '10k': (10000, 1000, 20000, 5000),
+    '100k': (100000, 10000, 200000, 50000),
+    '1m': (1000000, 50000, 1000000, 200000),
+}
+
+TERMOS_BUSCA = ['smartphone', 'camisa', 'sofa', 'tenis', 'relogio', 'cafe']
+
+# (nome, método, caminho(contexto, aleatorio), corpo(contexto, aleatorio) ou None, autenticação)
+CENARIOS = [
+    ('GET /api/categorias', 'GET', lambda c, a: '/api/categorias', None, None),
+    ('GET /api/produtos (página)', 'GET',
+     lambda c, a: f'/api/produtos?limit=20&categoria_id={a.choice(c["categorias"])}', None, None),
+    ('GET /api/produtos (preço)', 'GET', lambda c, a: '/api/produtos?limit=20&sort=-preco', None, None),
+    ('GET /api/produtos (busca)', 'GET', lambda c, a: f'/api/produtos?limit=20&busca={a.choice(TERMOS_BUSCA)}', None, None),
+    ('GET /api/produtos/<id>', 'GET', lambda c, a: f'/api/produtos/{a.choice(c["produtos"])}', None, None),
+    ('GET /api/usuarios/historico', 'GET', lambda c, a: '/api/usuarios/historico', None, 'usuario'),
+    ('GET /api/favoritos', 'GET', lambda c, a: '/api/favoritos', None, 'usuario'),
+    ('POST /api/pedidos', 'POST', lambda c, a: '/api/pedidos',
+     lambda c, a: pedido_exemplo([(i, 1) for i in a.sample(c['produtos'], 3)]), None),
+    ('GET /api/admin/usuarios', 'GET', lambda c, a: '/api/admin/usuarios?pagina=1&por_pagina=50', None, 'admin'),
+    ('GET /api/admin/pedidos/estatisticas', 'GET', lambda c, a: '/api/admin/pedidos/estatisticas', None, 'admin'),
+]
+
+def preparar(escala, diretorio=None):
+    """Banco sintético + contexto dos cenários (ids e tokens)"""
+    loja, diretorio = carregar_app(diretorio)
+    with loja.app.app_context():
+        inicio = time.perf_counter()
+        contagens = gerar_dados(loja, *ESCALAS[escala])
+        print(f'banco {escala} gerado em {time.perf_counter() - inicio:.1f}s: {contagens}')
+        contexto = {
+            'produtos': [i for (i,) in loja.db.session.query(loja.Produto.id).filter(loja.Produto.ativo.is_(True))],
+            'categorias': [i for (i,) in loja.db.session.query(loja.Categoria.id)],
+            'email': loja.Usuario.query.filter(loja.Usuario.email.like('%@bench.loja')).first().email,
+        }
+        loja.db.session.remove()
+        loja.db.engine.dispose()
+    return loja, diretorio, contexto
+
+def autenticar(enviar, contexto):
+    """Tokens de usuário e de admin obtidos pelas próprias rotas de login"""
+    usuario = enviar('POST', '/api/usuarios/login', {'email': contexto['email'], 'senha': SENHA_USUARIOS}, {})
+    admin = enviar('POST', '/api/admin/login', {'username': 'admin', 'senha': 'admin123'}, {})
+    return {'usuario': {'Authorization': f'Bearer {usuario["token"]}'},
+            'admin': {'Authorization': f'Bearer {admin["token"]}'}}
+
+def rodar_cliente(loja, contexto, requisicoes):
+    cliente = loja.app.test_client()
+
+    def enviar(metodo, caminho, corpo, cabecalhos):
+        return cliente.open(caminho, method=metodo, json=corpo, headers=cabecalhos).get_json()
+
+    tokens = autenticar(enviar, contexto)
+    resultados = {}
+    for nome, metodo, caminho, corpo, autenticacao in CENARIOS:
+        aleatorio = random.Random(nome)
+        latencias, erros = [], 0
+        inicio = time.perf_counter()
+        for _ in range(requisicoes):
+            antes = time.perf_counter()
+            resposta = cliente.open(
+                caminho(contexto, aleatorio), method=metodo,
+                json=corpo(contexto, aleatorio) if corpo else None,
+                headers=tokens.get(autenticacao, {})
+            )
+            latencias.append(time.perf_counter() - antes)
+            erros += resposta.status_code >= 400
+        resultados[nome] = dict(resumo_latencias(latencias), req_s=round(requisicoes / (time.perf_counter() - inicio), 1), erros=erros)
+    return resultados
+
+def rodar_http(diretorio, contexto, workers, clientes, duracao, porta):
+    import requests
+    processo, url = iniciar_gunicorn(diretorio, workers, porta)
+    try:
+        sessao = requests.Session()
+        tokens = autenticar(lambda m, c, corpo, h: sessao.request(m, url + c, json=corpo, headers=h).json(), contexto)
+        resultados = {}
+        for nome, metodo, caminho, corpo, autenticacao in CENARIOS:
+            latencias, erros = [], [0]
+            lock = threading.Lock()
+            fim = time.monotonic() + duracao
+
+            def cliente(semente):
+                aleatorio = random.Random(f'{nome}-{semente}')
+                conexao = requests.Session()
+                while time.monotonic() < fim:
+                    antes = time.perf_counter()
+                    try:
+                        codigo = conexao.request(
+                            metodo, url + caminho(contexto, aleatorio),
+                            json=corpo(contexto, aleatorio) if corpo else None,
+                            headers=tokens.get(autenticacao, {}), timeout=60
+                        ).status_code
+                    except requests.RequestException:
+                        codigo = 599
+                    with lock:
+                        latencias.append(time.perf_counter() - antes)
+                        erros[0] += codigo >= 400
+
+            inicio = time.perf_counter()
+            threads = [threading.Thread(target=cliente, args=(n,)) for n in range(clientes)]
+            for t in threads:
+                t.start()
+            for t in threads:
+                t.join()
+            resultados[nome] = dict(resumo_latencias(latencias), req_s=round(len(latencias) / (time.perf_counter() - inicio), 1), erros=erros[0])
+        return resultados
+    finally:
+        processo.terminate()
+        processo.wait()
+
+def comparar(resultados, baseline, tolerancia):
+    """Lista de regressões (texto) em relação à baseline"""
+    regressoes = []
+    for nome, atual in resultados.items():
+        base = baseline.get(nome)
+        if not base:
+            continue
+        if atual['p95_ms'] > base['p95_ms'] * (1 + tolerancia):
+            regressoes.append(f'{nome}: p95 {base["p95_ms"]} -> {atual["p95_ms"]} ms')
+        if atual['req_s'] < base['req_s'] * (1 - tolerancia):
+            regressoes.append(f'{nome}: vazão {base["req_s"]} -> {atual["req_s"]} req/s')
+        if atual['erros'] > base['erros']:
+            regressoes.append(f'{nome}: erros {base["erros"]} -> {atual["erros"]}')
+    return regressoes
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--modo', choices=['cliente', 'http'], default='cliente')
+    parser.add_argument('--escala', choices=list(ESCALAS), default='10k')
+    parser.add_argument('--requisicoes', type=int, default=200, help='por endpoint (modo cliente)')
+    parser.add_argument('--workers', type=int, default=4, help='workers do gunicorn (modo http)')
+    parser.add_argument('--clientes', type=int, default=16, help='threads clientes (modo http)')
+    parser.add_argument('--duracao', type=float, default=10, help='segundos por endpoint (modo http)')
+    parser.add_argument('--porta', type=int, default=8771)
+    parser.add_argument('--salvar', help='grava os resultados neste arquivo JSON (chave modo/escala)')
+    parser.add_argument('--comparar', help='baseline JSON para detectar regressões')
+    parser.add_argument('--tolerancia', type=float, default=0.25)
+    args = parser.parse_args()
+
+    loja, diretorio, contexto = preparar(args.escala)
+    if args.modo == 'cliente':
+        resultados = rodar_cliente(loja, contexto, args.requisicoes)
+    else:
+        resultados = rodar_http(diretorio, contexto, args.workers, args.clientes, args.duracao, args.porta)
+
+    print(f'{"endpoint":<38} {"req/s":>8} {"p50":>9} {"p95":>9} {"p99":>9} {"erros":>6}')
+    for nome, r in resultados.items():
+        print(f'{nome:<38} {r["req_s"]:>8} {r["p50_ms"]:>7}ms {r["p95_ms"]:>7}ms {r["p99_ms"]:>7}ms {r["erros"]:>6}')
+
+    chave = f'{args.modo}/{args.escala}'
+    if args.salvar:
+        dados = {}
+        if os.path.exists(args.salvar):
+            with open(args.salvar) as arquivo:
+                dados = json.load(arquivo)
+        dados[chave] = {
+            'data': datetime.utcnow().isoformat(timespec='seconds'),
+            'python': platform.python_version(),
+            'parametros': {k: v for k, v in vars(args).items() if k not in ('salvar', 'comparar')},
+            'resultados': resultados,
+        }
+        with open(args.salvar, 'w') as arquivo:
+            json.dump(dados, arquivo, indent=2, ensure_ascii=False, sort_keys=True)
+            arquivo.write('\n')
+        print(f'resultados gravados em {args.salvar} ({chave})')
+
+    if args.comparar:
+        with open(args.comparar) as arquivo:
+            baseline = json.load(arquivo).get(chave)
+        if baseline is None:
+            print(f'baseline sem entrada para {chave}')
+            return
+        regressoes = comparar(resultados, baseline['resultados'], args.tolerancia)
+        for regressao in regressoes:
+            print(f'REGRESSÃO {regressao}')
+        if regressoes:
+            sys.exit(1)
+        print(f'sem regressões em relação à baseline ({chave}, tolerância {args.tolerancia:.0%})')
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,47 @@
+"""Benchmark da sincronização com a Fake Store (usa o substituto local)
+
+Uso (a partir de backend/):
+    python -m benchmarks.sync --produtos 100000
+
+Mede a carga inicial, uma ressincronização sem mudanças e uma com 10% dos
+preços alterados, em um banco SQLite temporário.
+"""
+import argparse
+import os
+import sys
+import tempfile
+import time
+
+from benchmarks.fakestore_local import iniciar_servidor
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--produtos', type=int, default=100000)
+    args = parser.parse_args()
+    
+    diretorio = tempfile.mkdtemp(prefix='loja-bench-')
+    os.environ['DATABASE_URL'] = f'sqlite:///{os.path.join(diretorio, "loja.db")}'
+    os.environ['CACHE_VERSAO_DIR'] = diretorio
+    servidor, url = iniciar_servidor(args.produtos)
+    os.environ['FAKE_STORE_API'] = url
+    
+    sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+    import app as loja
+    
+    def medir(rotulo):
+        with loja.app.app_context():
+            inicio = time.perf_counter()
+            contagem = loja.sincronizar_dados_externos()
+            duracao = time.perf_counter() - inicio
+        print(f'{rotulo:<28} {duracao:8.2f}s  {contagem}')
+    
+    medir('carga inicial')
+    medir('sem mudanças')
+    servidor.shutdown()
+    servidor, url = iniciar_servidor(args.produtos, revisao=1)
+    loja.cliente_externo.base_url = url
+    medir('10% dos preços alterados')
+    servidor.shutdown()
+
+if __name__ == '__main__':
+    main()
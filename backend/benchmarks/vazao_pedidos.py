@@ -0,0 +1,82 @@
+"""Vazão sustentada de POST /api/pedidos com vários workers do gunicorn no mesmo SQLite
+
+Roda a mesma carga duas vezes, em bancos novos: com SQLITE_OTIMIZADO=0
+(journal padrão, sem fila de escrita) e com o perfil de produção.
+
+Uso (a partir de backend/):
+    python -m benchmarks.vazao_pedidos --workers 4 --clientes 16 --duracao 20
+"""
+import argparse
+import os
+import random
+import shutil
+import tempfile
+import threading
+import time
+
+import requests
+
+from benchmarks.comum import carregar_app, iniciar_gunicorn, pedido_exemplo, resumo_latencias
+
+def preparar_banco():
+    """Cria um banco temporário com estoque de sobra; retorna (diretorio, produto_ids)"""
+    loja, diretorio = carregar_app()
+    with loja.app.app_context():
+        loja.Produto.query.update({'estoque': 10 ** 9}, synchronize_session=False)
+        loja.db.session.commit()
+        produto_ids = [i for (i,) in loja.db.session.query(loja.Produto.id).filter(loja.Produto.ativo.is_(True))]
+        # Fechar a última conexão passa o WAL para loja.db, o único arquivo copiado
+        loja.db.session.remove()
+        loja.db.engine.dispose()
+    return diretorio, produto_ids
+
+def carga(url, produto_ids, clientes, duracao):
+    status, latencias = {}, []
+    lock = threading.Lock()
+    fim = time.monotonic() + duracao
+
+    def cliente(semente):
+        aleatorio = random.Random(semente)
+        sessao = requests.Session()
+        while time.monotonic() < fim:
+            corpo = pedido_exemplo([(i, 1) for i in aleatorio.sample(produto_ids, 3)])
+            inicio = time.perf_counter()
+            try:
+                codigo = sessao.post(f'{url}/api/pedidos', json=corpo, timeout=60).status_code
+            except requests.RequestException:
+                codigo = 'erro de conexão'
+            with lock:
+                latencias.append(time.perf_counter() - inicio)
+                status[codigo] = status.get(codigo, 0) + 1
+
+    threads = [threading.Thread(target=cliente, args=(n,)) for n in range(clientes)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    return status, latencias
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--workers', type=int, default=4)
+    parser.add_argument('--clientes', type=int, default=16, help='conexões simultâneas')
+    parser.add_argument('--duracao', type=float, default=20, help='segundos de carga por cenário')
+    parser.add_argument('--porta', type=int, default=8770)
+    args = parser.parse_args()
+
+    diretorio, produto_ids = preparar_banco()
+    modelo = os.path.join(diretorio, 'loja.db')
+    for nome, otimizado in (('padrão', '0'), ('produção', '1')):
+        destino = tempfile.mkdtemp(prefix='loja-vazao-')
+        shutil.copy(modelo, destino)
+        processo, url = iniciar_gunicorn(destino, args.workers, args.porta, {'SQLITE_OTIMIZADO': otimizado})
+        try:
+            status, latencias = carga(url, produto_ids, args.clientes, args.duracao)
+        finally:
+            processo.terminate()
+            processo.wait()
+        criados = status.get(201, 0)
+        print(f'{nome:<9} {criados / args.duracao:7.1f} pedidos/s  status={status}  latência={resumo_latencias(latencias)}')
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,18 @@
+"""Testes do backend
+
+Rodam contra um banco SQLite temporário criado na importação (o app lê a
+configuração do banco ao ser importado). A partir de backend/:
+    python -m unittest
+"""
+import os
+import tempfile
+
+DIRETORIO = tempfile.mkdtemp(prefix='loja-testes-')
+os.environ['DATABASE_URL'] = f'sqlite:///{os.path.join(DIRETORIO, "loja.db")}'
+os.environ['CACHE_VERSAO_DIR'] = DIRETORIO
+os.environ['METRICAS_DIR'] = os.path.join(DIRETORIO, 'metricas')
+os.environ.setdefault('LOG_LEVEL', 'WARNING')
+
+from benchmarks.comum import carregar_app  # noqa: E402
+
+loja, _ = carregar_app(DIRETORIO)
@@ -0,0 +1,39 @@
+import unittest
+from unittest import mock
+
+from tests import loja
+
+class CacheCatalogoTest(unittest.TestCase):
+    def setUp(self):
+        self.cliente = loja.app.test_client()
+        loja.invalidar_catalogo()
+
+    def test_invalidacao_durante_a_view_nao_guarda_resposta_antiga(self):
+        view = loja.app.view_functions['get_categorias'].__wrapped__
+
+        def view_com_invalidacao():
+            resposta = view()
+            loja.invalidar_catalogo(categorias=True)  # p.ex. a sync em outra thread
+            return resposta
+
+        with mock.patch.dict(loja.app.view_functions, get_categorias=loja.em_cache(
+                loja.cache_catalogo, 'public, max-age=300', etag=loja.etag_catalogo)(view_com_invalidacao)):
+            primeira = self.cliente.get('/api/categorias')
+        self.assertEqual(primeira.headers['X-Cache'], 'MISS')
+
+        segunda = self.cliente.get('/api/categorias')
+        self.assertEqual(segunda.headers['X-Cache'], 'MISS')
+        self.assertNotEqual(segunda.headers['ETag'], primeira.headers['ETag'])
+        self.assertEqual(self.cliente.get('/api/categorias').headers['X-Cache'], 'HIT')
+
+    def test_guardar_descarta_valor_de_geracao_anterior(self):
+        cache = loja.CacheLRU()
+        geracao = cache.geracao_atual()
+        cache.invalidar()
+        cache.guardar('chave', 'valor', geracao)
+        self.assertIsNone(cache.obter('chave'))
+        cache.guardar('chave', 'valor', cache.geracao_atual())
+        self.assertEqual(cache.obter('chave'), 'valor')
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,53 @@
+import base64
+import json
+import unittest
+
+from tests import loja
+
+def cursor(dados):
+    return base64.urlsafe_b64encode(json.dumps(dados).encode()).decode().rstrip('=')
+
+class CursorProdutosTest(unittest.TestCase):
+    def setUp(self):
+        self.cliente = loja.app.test_client()
+
+    def listar(self, sort, valor_cursor):
+        return self.cliente.get('/api/produtos', query_string={'sort': sort, 'limit': 2, 'cursor': valor_cursor})
+
+    def test_cursor_malformado_responde_400(self):
+        casos = [
+            ('data_criacao', cursor({'s': 'data_criacao', 'v': 1, 'id': 1})),
+            ('data_criacao', cursor({'s': 'data_criacao', 'v': 'ontem', 'id': 1})),
+            ('preco', cursor({'s': 'preco', 'v': [1], 'id': 1})),
+            ('preco', cursor({'s': 'preco', 'v': 'x', 'id': 1})),
+            ('preco', cursor({'s': 'preco', 'v': True, 'id': 1})),
+            ('preco', cursor({'s': 'preco', 'v': 10 ** 30, 'id': 1})),
+            ('preco', cursor({'s': 'preco', 'v': 1.5, 'id': '1'})),
+            ('-id', cursor({'s': '-id', 'v': 1, 'id': 1.5})),
+            ('id', cursor(['s', 'v', 'id'])),
+            ('id', cursor('texto')),
+            ('id', '%%%'),
+            ('preco', cursor({'s': 'id', 'v': 1, 'id': 1})),
+        ]
+        for sort, valor_cursor in casos:
+            with self.subTest(sort=sort, cursor=valor_cursor):
+                resposta = self.listar(sort, valor_cursor)
+                self.assertEqual(resposta.status_code, 400)
+                self.assertIn('erro', resposta.get_json())
+
+    def test_cursor_de_relevancia_malformado_responde_400(self):
+        resposta = self.cliente.get('/api/produtos', query_string={
+            'busca': 'camisa', 'limit': 2, 'cursor': cursor({'s': 'relevancia', 'v': 'x', 'id': 1})})
+        self.assertEqual(resposta.status_code, 400)
+
+    def test_cursor_gerado_pela_api_continua_valido(self):
+        for sort in ('id', '-preco', 'data_criacao'):
+            with self.subTest(sort=sort):
+                primeira = self.cliente.get('/api/produtos', query_string={'sort': sort, 'limit': 2}).get_json()
+                segunda = self.listar(sort, primeira['proximo_cursor'])
+                self.assertEqual(segunda.status_code, 200)
+                ids = {p['id'] for p in primeira['produtos']}
+                self.assertFalse(ids & {p['id'] for p in segunda.get_json()['produtos']})
+
+if __name__ == '__main__':
+    unittest.main()
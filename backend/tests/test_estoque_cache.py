@@ -0,0 +1,50 @@
+import unittest
+
+from benchmarks.comum import pedido_exemplo
+from tests import loja
+
+class EstoqueNoCacheTest(unittest.TestCase):
+    def setUp(self):
+        self.cliente = loja.app.test_client()
+        loja.invalidar_catalogo()
+
+    def pagina(self, cursor=None):
+        return self.cliente.get('/api/produtos', query_string={'limit': 3, **({'cursor': cursor} if cursor else {})})
+
+    def test_pedido_so_revalida_respostas_com_os_produtos_vendidos(self):
+        categorias = self.cliente.get('/api/categorias')
+        primeira = self.pagina()
+        segunda = self.pagina(primeira.get_json()['proximo_cursor'])
+        vendido = primeira.get_json()['produtos'][0]
+        detalhe = self.cliente.get(f'/api/produtos/{vendido["id"]}')
+        geracao = loja.cache_catalogo.geracao_atual()
+
+        self.assertEqual(self.cliente.post('/api/pedidos', json=pedido_exemplo([(vendido['id'], 2)])).status_code, 201)
+
+        # A geração do catálogo não muda: categorias e páginas sem o produto seguem em cache
+        self.assertEqual(loja.cache_catalogo.geracao_atual(), geracao)
+        self.assertEqual(self.cliente.get('/api/categorias').headers['X-Cache'], 'HIT')
+        self.assertEqual(self.cliente.get('/api/categorias', headers={'If-None-Match': categorias.headers['ETag']}).status_code, 304)
+        outra = self.pagina(primeira.get_json()['proximo_cursor'])
+        self.assertEqual((outra.headers['X-Cache'], outra.headers['ETag']), ('HIT', segunda.headers['ETag']))
+
+        # A página e o detalhe do produto vendido trazem o estoque novo, com outra ETag
+        nova = self.pagina()
+        self.assertEqual(nova.headers['X-Cache'], 'MISS')
+        self.assertNotEqual(nova.headers['ETag'], primeira.headers['ETag'])
+        self.assertEqual(nova.get_json()['produtos'][0]['estoque'], vendido['estoque'] - 2)
+        self.assertEqual(self.cliente.get('/api/produtos', query_string={'limit': 3}, headers={'If-None-Match': primeira.headers['ETag']}).status_code, 200)
+        novo_detalhe = self.cliente.get(f'/api/produtos/{vendido["id"]}', headers={'If-None-Match': detalhe.headers['ETag']})
+        self.assertEqual(novo_detalhe.status_code, 200)
+        self.assertEqual(novo_detalhe.get_json()['estoque'], vendido['estoque'] - 2)
+
+    def test_projecao_sem_estoque_nao_e_revalidada(self):
+        campos = {'campos': 'nome,preco', 'limit': 3}
+        antes = self.cliente.get('/api/produtos', query_string=campos)
+        produto_id = antes.get_json()['produtos'][0]['id']
+        self.assertEqual(self.cliente.post('/api/pedidos', json=pedido_exemplo([(produto_id, 1)])).status_code, 201)
+        depois = self.cliente.get('/api/produtos', query_string=campos, headers={'If-None-Match': antes.headers['ETag']})
+        self.assertEqual(depois.status_code, 304)
+
+if __name__ == '__main__':
+    unittest.main()
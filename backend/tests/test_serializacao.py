@@ -0,0 +1,33 @@
+import unittest
+
+from tests import loja
+
+class ProjecaoProdutosTest(unittest.TestCase):
+    def setUp(self):
+        self.cliente = loja.app.test_client()
+
+    def test_repeticoes_e_permutacoes_usam_a_mesma_projecao(self):
+        variacoes = ['nome,preco', 'preco,nome', 'nome,nome,preco', 'preco, nome,preco', 'id,preco,nome']
+        respostas = [self.cliente.get('/api/produtos', query_string={'campos': campos, 'limit': 3}) for campos in variacoes]
+        for resposta in respostas:
+            self.assertEqual(resposta.status_code, 200)
+            self.assertEqual(set(resposta.get_json()['produtos'][0]), {'id', 'nome', 'preco'})
+        projecoes = loja.SERIALIZADOR_PRODUTO._projecoes
+        self.assertIn(('id', 'nome', 'preco'), projecoes)
+        self.assertEqual(len([c for c in projecoes if set(c) == {'id', 'nome', 'preco'}]), 1)
+
+    def test_campos_repetidos_nao_criam_projecoes(self):
+        self.cliente.get('/api/produtos', query_string={'campos': 'nome'})
+        antes = len(loja.SERIALIZADOR_PRODUTO._projecoes)
+        for repeticoes in range(2, 50):
+            self.cliente.get('/api/produtos', query_string={'campos': ','.join(['nome'] * repeticoes)})
+        self.assertEqual(len(loja.SERIALIZADOR_PRODUTO._projecoes), antes)
+        self.assertEqual(loja.parse_campos('nome,nome,nome'), ['id', 'nome'])
+
+    def test_campo_invalido_responde_400(self):
+        resposta = self.cliente.get('/api/produtos', query_string={'campos': 'nome,senha'})
+        self.assertEqual(resposta.status_code, 400)
+        self.assertIn('senha', resposta.get_json()['erro'])
+
+if __name__ == '__main__':
+    unittest.main()
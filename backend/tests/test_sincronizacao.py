@@ -0,0 +1,66 @@
+import unittest
+from datetime import datetime, timedelta
+
+from tests import loja
+
+def registro(numero, nome, preco=10.0):
+    return {
+        'id_externo': f'teste:{numero}', 'nome': nome, 'descricao': 'Da fonte de teste',
+        'preco': preco, 'imagem_url': 'https://fonte/imagem.png', 'categoria': 'Eletrônicos',
+    }
+
+class AdocaoProdutosTest(unittest.TestCase):
+    def setUp(self):
+        self.cliente = loja.app.test_client()
+        token = self.cliente.post('/api/admin/login', json={'username': 'admin', 'senha': 'admin123'}).get_json()['token']
+        self.admin = {'Authorization': f'Bearer {token}'}
+        self.contexto = loja.app.app_context()
+        self.contexto.push()
+        self.categoria_id = loja.Categoria.query.first().id
+
+    def tearDown(self):
+        loja.db.session.rollback()
+        self.contexto.pop()
+
+    def criar_pelo_admin(self, nome):
+        resposta = self.cliente.post('/api/admin/produtos', headers=self.admin, json={
+            'nome': nome, 'descricao': 'Cadastro manual', 'preco': 99.0, 'categoria_id': self.categoria_id})
+        self.assertEqual(resposta.status_code, 200)
+        return resposta.get_json()['id']
+
+    def produto(self, produto_id):
+        loja.db.session.expire_all()
+        return loja.db.session.get(loja.Produto, produto_id)
+
+    def test_produto_do_admin_com_o_mesmo_nome_nao_e_adotado(self):
+        produto_id = self.criar_pelo_admin('Fone Homônimo')
+        contagem = loja.sincronizar_registros([registro(1, 'Fone Homônimo')], 'teste')
+        self.assertEqual((contagem['adicionados'], contagem['atualizados']), (1, 0))
+        produto = self.produto(produto_id)
+        self.assertEqual((produto.preco, produto.descricao, produto.id_externo), (99.0, 'Cadastro manual', None))
+
+        # Sumir da fonte desativa o produto da fonte, nunca o do admin
+        loja.sincronizar_registros([], 'teste')
+        self.assertTrue(self.produto(produto_id).ativo)
+
+    def test_produto_legado_e_adotado_pelo_nome(self):
+        produto_id = self.criar_pelo_admin('Relógio Antigo')
+        loja.marcar_produtos_legados(criados_ate=datetime.utcnow())
+        self.assertEqual(self.produto(produto_id).id_externo, f'legado:{produto_id}')
+
+        contagem = loja.sincronizar_registros([registro(2, 'Relógio Antigo', preco=15.0)], 'teste')
+        self.assertEqual((contagem['adicionados'], contagem['atualizados']), (0, 1))
+        produto = self.produto(produto_id)
+        self.assertEqual((produto.preco, produto.id_externo), (15.0, 'teste:2'))
+
+    def test_migracao_so_marca_produtos_anteriores(self):
+        anterior = self.criar_pelo_admin('Anterior à Migração')
+        loja.Produto.query.filter_by(id=anterior).update({'data_criacao': datetime.utcnow() - timedelta(days=30)})
+        loja.db.session.commit()
+        posterior = self.criar_pelo_admin('Posterior à Migração')
+        loja.marcar_produtos_legados(criados_ate=datetime.utcnow() - timedelta(days=1))
+        self.assertEqual(self.produto(anterior).id_externo, f'legado:{anterior}')
+        self.assertIsNone(self.produto(posterior).id_externo)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,45 @@
+import unittest
+from datetime import datetime, timedelta
+
+from tests import loja
+
+class TravaSincronizacaoTest(unittest.TestCase):
+    def setUp(self):
+        self.contexto = loja.app.app_context()
+        self.contexto.push()
+        loja.db.session.query(loja.Trava).delete()
+        loja.db.session.commit()
+
+    def tearDown(self):
+        loja.db.session.rollback()
+        loja.db.session.query(loja.Trava).delete()
+        loja.db.session.commit()
+        self.contexto.pop()
+
+    def trava(self):
+        loja.db.session.expire_all()
+        return loja.db.session.get(loja.Trava, 'sincronizacao')
+
+    def test_progresso_renova_a_trava(self):
+        self.assertTrue(loja.adquirir_trava('sincronizacao', 'tarefa-a', 1))
+        loja._registrar_progresso('tarefa-a', 500)
+        self.assertGreater(self.trava().expira_em, datetime.utcnow() + timedelta(seconds=loja.TRAVA_SYNC_TTL - 60))
+        loja._progresso_local.pop('tarefa-a', None)
+
+    def test_progresso_interrompe_tarefa_que_perdeu_a_trava(self):
+        self.assertTrue(loja.adquirir_trava('sincronizacao', 'tarefa-a', -1))
+        self.assertTrue(loja.adquirir_trava('sincronizacao', 'tarefa-b', 60))
+        with self.assertRaises(loja.TravaPerdida):
+            loja._registrar_progresso('tarefa-a', 500)
+        self.assertEqual(self.trava().dono, 'tarefa-b')
+        loja._progresso_local.pop('tarefa-a', None)
+
+    def test_trava_liberada_mesmo_se_o_status_inicial_falhar(self):
+        # Sem a linha da tarefa, a gravação do status inicial (e a final) falham
+        self.assertTrue(loja.adquirir_trava('sincronizacao', 'inexistente', 60))
+        with self.assertRaises(AttributeError):
+            loja._executar_tarefa('inexistente')
+        self.assertIsNone(self.trava().dono)
+
+if __name__ == '__main__':
+    unittest.main()